@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from codespeed.models import (Project, Revision, Executable, Benchmark, Branch,
-                              Result, Environment, Report)
+                              Result, Environment, Report, ResultBatch,
+                              PendingCommitLog)
 
 
 class ProjectForm(forms.ModelForm):
@@ -90,7 +91,37 @@ recalculate_report.short_description = "Recalculate reports"
 
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
-    list_display = ('revision', 'summary', 'colorcode')
-    list_filter = ('environment', 'executable')
+    list_display = ('revision', 'summary', 'colorcode', 'dirty')
+    list_filter = ('dirty', 'environment', 'executable')
     ordering = ['-revision']
     actions = [recalculate_report]
+
+    def changelist_view(self, request, extra_context=None):
+        dirty = Report.objects.filter(dirty=True).count()
+        if dirty:
+            self.message_user(
+                request, "%d reports are waiting to be recalculated by the "
+                "recompute_reports command" % dirty, messages.WARNING)
+        return super(ReportAdmin, self).changelist_view(
+            request, extra_context)
+
+
+def requeue_batches(modeladmin, request, queryset):
+    queryset.update(status=ResultBatch.PENDING, claimed=None, error='')
+
+
+requeue_batches.short_description = "Queue again"
+
+
+@admin.register(ResultBatch)
+class ResultBatchAdmin(admin.ModelAdmin):
+    list_display = ('created', 'num_results', 'status', 'attempts', 'error')
+    list_filter = ('status',)
+    ordering = ['created']
+    actions = [requeue_batches]
+
+
+@admin.register(PendingCommitLog)
+class PendingCommitLogAdmin(admin.ModelAdmin):
+    list_display = ('revision', 'created', 'attempts', 'error')
+    ordering = ['created']
@@ -7,6 +7,9 @@ class CodespeedConfig(AppConfig):
 
     def ready(self):
         import warnings
+        from .signals import connect_signals
+        connect_signals()
+
         if settings.ALLOW_ANONYMOUS_POST:
             warnings.warn("Results can be posted by unregistered users")
             warnings.warn(
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized computation of the changes shown in reports
+
+The results of a report are laid out in a matrix of benchmarks by revisions,
+with NaN where a benchmark has no result. The first column holds the results
+of the reported revision, the second one those of the revision before it,
+and the trend is computed against the average of some other columns.
+"""
+from __future__ import absolute_import, division
+
+import numpy as np
+
+
+def get_colors(values, lessisbetter, threshold):
+    """
+    Returns the significance color of each change: "red" for regressions
+    and "green" for improvements beyond the threshold, "none" otherwise
+
+    lessisbetter is a boolean, or one boolean per change.
+    """
+    values = np.where(lessisbetter, -np.asarray(values), values)
+    with np.errstate(invalid='ignore'):
+        return np.where(values < -threshold, "red",
+                        np.where(values > threshold, "green", "none"))
+
+
+def _group_averages(ratios, groups, num_groups):
+    """Arithmetic mean of the ratios of each group, ignoring NaN"""
+    valid = ~np.isnan(ratios)
+    sums = np.zeros(num_groups)
+    np.add.at(sums, groups[valid], ratios[valid])
+    counts = np.bincount(groups[valid], minlength=num_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def compute_changes(values, past, groups, lessisbetter,
+                    change_threshold, trend_threshold):
+    """
+    Computes the changes and trends of a matrix of results
+
+    values is a benchmarks x revisions array, past the columns whose average
+    the trend is computed against (e.g. a slice) and groups the index of the
+    group of each benchmark, e.g. its units title. lessisbetter gives one
+    boolean per group.
+
+    Returns a dict of arrays, NaN where a value is unavailable:
+
+    * change, trend: percentage change of each benchmark relative to the
+      previous result and to the past average
+    * change_color, trend_color: their significance colors
+    * total_change, total_trend: percentage change of the arithmetic mean of
+      the ratios of each group
+    * total_change_color, total_trend_color: their significance colors
+
+    A previous result of 0 gives a change of 0 when the result is also 0,
+    and an infinite one otherwise.
+    """
+    values = np.asarray(values, dtype=float)
+    groups = np.asarray(groups, dtype=int)
+    lessisbetter = np.asarray(lessisbetter, dtype=bool)
+    num_groups = len(lessisbetter)
+    current = values[:, 0]
+    if values.shape[1] > 1:
+        previous = values[:, 1]
+    else:
+        previous = np.full(len(current), np.nan)
+    past_values = values[:, past]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zero = previous == 0
+        change = np.where(zero, np.where(current == 0, 0.0, np.inf),
+                          (current - previous) * 100 / previous)
+        change_ratio = np.where(zero, np.where(current == 0, 1.0, np.inf),
+                                current / previous)
+
+        past_sum = np.nansum(past_values, axis=1)
+        past_count = np.sum(~np.isnan(past_values), axis=1)
+        # No past results, or a sum of 0, give no trend
+        average = np.where(past_sum != 0, past_sum / past_count, np.nan)
+        trend = (current - average) * 100 / average
+        trend_ratio = current / average
+
+    total_change = (_group_averages(change_ratio, groups, num_groups) - 1) * 100
+    total_trend = (_group_averages(trend_ratio, groups, num_groups) - 1) * 100
+
+    row_lessisbetter = lessisbetter[groups]
+    return {
+        'change': change,
+        'trend': trend,
+        'change_color': get_colors(change, row_lessisbetter,
+                                   change_threshold),
+        'trend_color': get_colors(trend, row_lessisbetter, trend_threshold),
+        'total_change': total_change,
+        'total_trend': total_trend,
+        'total_change_color': get_colors(total_change, lessisbetter,
+                                         change_threshold),
+        'total_trend_color': get_colors(total_trend, lessisbetter,
+                                        trend_threshold),
+    }
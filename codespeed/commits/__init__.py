@@ -1 +1 @@
-from .logs import get_logs  # noqa
+from .logs import get_logs, get_commits  # noqa
@@ -1,11 +1,15 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
 import datetime
 import logging
 import os
-from string import strip
+import threading
 from subprocess import Popen, PIPE
 
 from django.conf import settings
 
+from . import gitpool
 from .exceptions import CommitLogError
 
 logger = logging.getLogger(__name__)
@@ -40,50 +44,99 @@ def updaterepo(project, update=True):
             return [{'error': False}]
 
 
-def getlogs(endrev, startrev):
-    updaterepo(endrev.branch.project, update=False)
-
+def _log_format():
     # NULL separated values delimited by 0x1e record separators
     # See PRETTY FORMATS in git-log(1):
     if hasattr(settings, 'GIT_USE_COMMIT_DATE') and settings.GIT_USE_COMMIT_DATE:
-        logfmt = '--format=format:%h%x00%H%x00%ct%x00%an%x00%ae%x00%s%x00%b%x1e'
+        return '--format=format:%h%x00%H%x00%P%x00%ct%x00%an%x00%ae%x00%s%x00%b%x1e'
     else:
-        logfmt = '--format=format:%h%x00%H%x00%at%x00%an%x00%ae%x00%s%x00%b%x1e'
-
-    cmd = ["git", "log", logfmt]
-
-    if endrev.commitid != startrev.commitid:
-        cmd.append("%s...%s" % (startrev.commitid, endrev.commitid))
-    else:
-        cmd.append("-1")  # Only return one commit
-        cmd.append(endrev.commitid)
-
-    working_copy = endrev.branch.project.working_copy
+        return '--format=format:%h%x00%H%x00%P%x00%at%x00%an%x00%ae%x00%s%x00%b%x1e'
+
+
+# Maps working copies to a (refs state, {commit id: tags}) tuple
+_tag_maps = {}
+_tag_maps_lock = threading.Lock()
+
+
+def _refs_state(working_copy):
+    """Returns the modification times of the files that store tags
+
+    Creating, moving or deleting a tag changes at least one of them, so a
+    tag map read for the same state is still valid. Returns None when the
+    repository layout is unknown, e.g. for worktrees.
+    """
+    git_dir = os.path.join(working_copy, '.git')
+    if not os.path.isdir(git_dir):
+        return None
+    state = []
+    packed_refs = os.path.join(git_dir, 'packed-refs')
+    if os.path.exists(packed_refs):
+        state.append(os.stat(packed_refs).st_mtime)
+    for dirpath, dirnames, filenames in os.walk(
+            os.path.join(git_dir, 'refs', 'tags')):
+        state.append((dirpath, os.stat(dirpath).st_mtime))
+        for filename in filenames:
+            state.append(os.stat(os.path.join(dirpath, filename)).st_mtime)
+    return tuple(state)
+
+
+def _read_tags(working_copy):
+    """Returns a dict of commit id -> sorted list of tags pointing to it"""
+    # Annotated tags are peeled to the commit they point to
+    cmd = ["git", "for-each-ref",
+           "--format=%(objectname)%00%(*objectname)%00%(refname:short)",
+           "refs/tags"]
     p = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=working_copy)
-
     stdout, stderr = p.communicate()
-
     if p.returncode != 0:
         raise CommitLogError("%s returned %s: %s" % (
                              " ".join(cmd), p.returncode, stderr))
-    logs = []
-    for log in filter(None, stdout.split(b'\x1e')):
-        (short_commit_id, commit_id, date_t, author_name, author_email,
-         subject, body) = map(strip, log.split(b'\x00', 7))
 
-        tag = ""
+    tags = {}
+    for line in stdout.decode('utf-8', 'replace').splitlines():
+        objectname, peeled, name = line.split('\x00', 2)
+        tags.setdefault(peeled or objectname, []).append(name)
+    for names in tags.values():
+        names.sort()
+    return tags
+
+
+def get_tag_map(working_copy):
+    """Returns the commit id -> tags map of a working copy
+
+    The map is read with a single git call and cached until the tags of
+    the repository change.
+    """
+    state = _refs_state(working_copy)
+    with _tag_maps_lock:
+        cached = _tag_maps.get(working_copy)
+    if state is not None and cached is not None and cached[0] == state:
+        return cached[1]
 
-        cmd = ["git", "tag", "--points-at", commit_id]
-        proc = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=working_copy)
+    tags = _read_tags(working_copy)
+    if state is not None:
+        with _tag_maps_lock:
+            _tag_maps[working_copy] = (state, tags)
+    return tags
 
-        try:
-            stdout, stderr = proc.communicate()
-        except ValueError:
-            stdout = b''
-            stderr = b''
 
-        if proc.returncode == 0:
-            tag = stdout.strip()
+def gettags(project):
+    """Returns the commit id -> tags map, or None without a working copy"""
+    if not os.path.exists(project.working_copy):
+        return None
+    return get_tag_map(project.working_copy)
+
+
+def _parse_logs(stdout, working_copy):
+    logs = []
+    tag_map = get_tag_map(working_copy)
+    for log in filter(None, stdout.split(b'\x1e')):
+        (short_commit_id, commit_id, parents, date_t, author_name,
+         author_email, subject, body) = [
+            part.strip().decode('utf-8', 'replace')
+            for part in log.split(b'\x00', 7)]
+
+        tag = "\n".join(tag_map.get(commit_id, []))
 
         date = datetime.datetime.fromtimestamp(
             int(date_t)).strftime("%Y-%m-%d %H:%M:%S")
@@ -96,7 +149,106 @@ def getlogs(endrev, startrev):
             'author_email': author_email,
             'body': body,
             'short_commit_id': short_commit_id,
+            'parents': parents.split(),
             'tag': tag
         })
+    return logs
 
+
+def getlogs(endrev, startrev):
+    updaterepo(endrev.branch.project, update=False)
+
+    cmd = ["git", "log", _log_format()]
+
+    if endrev.commitid != startrev.commitid:
+        cmd.append("%s...%s" % (startrev.commitid, endrev.commitid))
+    else:
+        cmd.append("-1")  # Only return one commit
+        cmd.append(endrev.commitid)
+
+    working_copy = endrev.branch.project.working_copy
+    p = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=working_copy)
+
+    stdout, stderr = p.communicate()
+
+    if p.returncode != 0:
+        raise CommitLogError("%s returned %s: %s" % (
+                             " ".join(cmd), p.returncode, stderr))
+    return _parse_logs(stdout, working_copy)
+
+
+def _commit_log(sha, content, tag_map):
+    """Returns the log of a raw commit object read by git cat-file"""
+    headers, message = gitpool.parse_commit(content)
+    headers_dict = dict(headers)
+    author_name, author_email, author_time = gitpool.parse_signature(
+        headers_dict['author'])
+    if getattr(settings, 'GIT_USE_COMMIT_DATE', False):
+        date_t = gitpool.parse_signature(headers_dict['committer'])[2]
+    else:
+        date_t = author_time
+
+    # Like %s and %b, the subject is the first paragraph on a single line
+    subject, _, body = message.strip().partition("\n\n")
+    return {
+        'date': datetime.datetime.fromtimestamp(
+            date_t).strftime("%Y-%m-%d %H:%M:%S"),
+        'message': " ".join(subject.split("\n")),
+        'commitid': sha,
+        'author': author_name,
+        'author_email': author_email,
+        'body': body.strip(),
+        'short_commit_id': sha[:7],
+        'parents': [value for name, value in headers if name == 'parent'],
+        'tag': "\n".join(tag_map.get(sha, [])),
+    }
+
+
+def _get_positions(commit_ids, working_copy):
+    """Returns the number of first-parent commits up to each commit
+
+    A single git rev-list lists the first-parent history of all the
+    commits, parents first, so that positions are counted from the root.
+    """
+    if not commit_ids:
+        return {}
+    cmd = ["git", "rev-list", "--first-parent", "--reverse", "--topo-order",
+           "--parents"] + list(commit_ids)
+    p = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=working_copy)
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        logger.warning("%s returned %s: %s", " ".join(cmd), p.returncode,
+                       stderr)
+        return {}
+    positions = {}
+    for line in stdout.decode('ascii').splitlines():
+        shas = line.split()
+        # Roots have no parent, the first parent is listed before the others
+        parent = shas[1] if len(shas) > 1 else None
+        positions[shas[0]] = positions.get(parent, 0) + 1
+    return positions
+
+
+def getcommits(project, commitids):
+    """Returns the logs of the given commits
+
+    Commits are read by the long-lived git cat-file processes of the
+    working copy, so no process is started once they are running.
+    """
+    updaterepo(project, update=False)
+
+    pool = gitpool.get_pool(project.working_copy)
+    tag_map = get_tag_map(project.working_copy)
+    logs = []
+    for commitid in commitids:
+        found = pool.read("%s^{commit}" % commitid)
+        if found is None:
+            logger.warning("unable to get log for commit %s", commitid)
+            continue
+        logs.append(_commit_log(found[0], found[2], tag_map))
+    # git rev-list can't be kept running, it costs one process per call
+    positions = _get_positions([log['commitid'] for log in logs],
+                               project.working_copy)
+    for log in logs:
+        log['position'] = positions.get(log['commitid'])
     return logs
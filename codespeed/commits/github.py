@@ -10,14 +10,19 @@ from __future__ import absolute_import
 import logging
 try:
     # Python 3
-    from urllib.request import urlopen
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
 except ImportError:
     # Python 2
-    from urllib import urlopen
+    from urllib2 import HTTPError, Request, urlopen
 import re
 import json
+import math
+import time
+from multiprocessing.pool import ThreadPool
 
 import isodate
+from django.conf import settings
 from django.core.cache import cache
 
 from .exceptions import CommitLogError
@@ -27,23 +32,69 @@ logger = logging.getLogger(__name__)
 GITHUB_URL_RE = re.compile(
     r'^(?P<proto>\w+)://github.com/(?P<username>[^/]+)/(?P<project>[^/]+)([.]git)?$')
 
-# We currently use a simple linear search of on a single parent to retrieve
-# the history. This is often good enough, but might miss the actual starting
-# point. Thus, we need to terminate the search after a resonable number of
-# revisions.
-GITHUB_REVISION_LIMIT = 10
+# Number of commits per page and maximum number of pages read from the commit
+# list when looking up many commits at once, or from a comparison of two
+# commits
+GITHUB_COMMITS_PER_PAGE = 100
+GITHUB_COMMIT_PAGES = 10
+
+# Number of tags per page and maximum number of pages read from the tag list
+GITHUB_TAGS_PER_PAGE = 100
+GITHUB_TAG_PAGES = 100
+
+# Number of pages fetched at the same time
+GITHUB_FETCH_THREADS = 4
+
+# Seconds cached responses are kept. Unless they are known not to change,
+# they are revalidated with their ETag before being used
+GITHUB_CACHE_TIMEOUT = 86400 * 30
 
 
 def updaterepo(project, update=True):
     return
 
 
-def fetch_json(url):
-    json_obj = cache.get(url)
+def api_url(path, *args):
+    base_url = getattr(settings, 'GITHUB_API_URL', 'https://api.github.com')
+    return base_url.rstrip('/') + path % args
+
 
-    if json_obj is None:
+def fetch_json(url, max_age=0):
+    """
+    Returns the decoded JSON response of a Github API URL
+
+    Responses are cached. A cached response younger than max_age seconds is
+    used as it is, older ones are revalidated with a conditional request.
+    Pass max_age=None for responses that never change.
+    """
+    entry = cache.get(url)
+    if not isinstance(entry, dict) or 'fetched' not in entry:
+        entry = None
+    if entry is not None and (
+            max_age is None or time.time() - entry['fetched'] < max_age):
+        json_obj = entry['json']
+    else:
+        request = Request(url)
+        if entry is not None and entry.get('etag'):
+            request.add_header('If-None-Match', entry['etag'])
         try:
-            json_obj = json.load(urlopen(url))
+            response = urlopen(request)
+            json_obj = json.loads(response.read().decode('utf-8'))
+            etag = response.headers.get('ETag')
+        except HTTPError as e:
+            if e.code == 304:
+                json_obj, etag = entry['json'], entry['etag']
+            else:
+                try:
+                    json_obj = json.loads(e.read().decode('utf-8'))
+                except ValueError:
+                    json_obj = {'message': e.reason}
+                if json_obj.get("message") not in ("Not Found",
+                                                   "Server Error"):
+                    # e.g. rate limiting, retry with the next request
+                    raise CommitLogError("Unable to load %s: %s" % (
+                        url, json_obj.get("message", e.code)))
+                etag = None
         except IOError as e:
             logger.exception("Unable to load %s: %s",
                              url, e, exc_info=True)
@@ -53,11 +104,11 @@ def fetch_json(url):
            json_obj["message"] in ("Not Found", "Server Error",):
             # We'll still cache these for a brief period of time to avoid
             # making too many requests:
-            cache.set(url, json_obj, 300)
+            cache.set(url, {'json': json_obj, 'etag': None,
+                            'fetched': time.time()}, 300)
         else:
-            # We'll cache successes for a very long period of time since
-            # SCM diffs shouldn't change:
-            cache.set(url, json_obj, 86400 * 30)
+            cache.set(url, {'json': json_obj, 'etag': etag,
+                            'fetched': time.time()}, GITHUB_CACHE_TIMEOUT)
 
     if "message" in json_obj and \
        json_obj["message"] in ("Not Found", "Server Error",):
@@ -67,23 +118,58 @@ def fetch_json(url):
     return json_obj
 
 
-def retrieve_tag(commit_id, username, project):
-    tags_url = 'https://api.github.com/repos/%s/%s/git/refs/tags' % (
-        username, project)
+def fetch_pages(urls, max_age=0):
+    """Fetches many URLs concurrently, returning their responses in order"""
+    if len(urls) < 2:
+        return [fetch_json(url, max_age) for url in urls]
+    pool = ThreadPool(min(len(urls), GITHUB_FETCH_THREADS))
+    try:
+        return pool.map(lambda url: fetch_json(url, max_age), urls)
+    finally:
+        pool.close()
+
+
+def get_tags(username, project):
+    """
+    Returns a dict of commit id -> tags of a repository
+
+    The dict is kept in the cache and only rebuilt from the tag list once
+    every GITHUB_TAGS_REFRESH_INTERVAL seconds, revalidating its pages.
+    """
+    key = 'github-tags:%s/%s' % (username, project)
+    entry = cache.get(key)
+    refresh_interval = getattr(settings, 'GITHUB_TAGS_REFRESH_INTERVAL', 300)
+    if entry is not None and time.time() - entry[0] < refresh_interval:
+        return entry[1]
+
+    names = {}
+    for page in range(1, GITHUB_TAG_PAGES + 1):
+        # Unlike git/refs/tags, the tag list gives the commit of annotated
+        # tags too
+        tags_json = fetch_json(api_url('/repos/%s/%s/tags?per_page=%d&page=%d',
+                                       username, project,
+                                       GITHUB_TAGS_PER_PAGE, page))
+        for tag in tags_json:
+            names.setdefault(tag['commit']['sha'], []).append(tag['name'])
+        if len(tags_json) < GITHUB_TAGS_PER_PAGE:
+            break
+
+    tags = dict((sha, "\n".join(sorted(tag_names)))
+                for sha, tag_names in names.items())
+    cache.set(key, (time.time(), tags), GITHUB_CACHE_TIMEOUT)
+    return tags
 
-    tags_json = fetch_json(tags_url)
-    for tag in tags_json:
-        if tag['object']['sha'] == commit_id:
-            return tag['ref'].split("refs/tags/")[-1]
 
-    return ""
+def retrieve_tag(commit_id, username, project):
+    return get_tags(username, project).get(commit_id, "")
 
 
 def retrieve_revision(commit_id, username, project, revision=None):
-    commit_url = 'https://api.github.com/repos/%s/%s/git/commits/%s' % (
-        username, project, commit_id)
+    commit_url = api_url('/repos/%s/%s/git/commits/%s',
+                         username, project, commit_id)
 
-    commit_json = fetch_json(commit_url)
+    # Commits never change
+    commit_json = fetch_json(commit_url, max_age=None)
 
     date = isodate.parse_datetime(commit_json['committer']['date'])
     tag = retrieve_tag(commit_id, username, project)
@@ -112,52 +198,103 @@ def retrieve_revision(commit_id, username, project, revision=None):
             'tag':          tag}
 
 
-def getlogs(endrev, startrev):
-    if endrev != startrev:
-        revisions = endrev.branch.revisions.filter(
-            date__lte=endrev.date, date__gte=startrev.date)
-    else:
-        revisions = [i for i in (startrev, endrev) if i.commitid]
-
-    if endrev.branch.project.repo_path[-1] == '/':
-        endrev.branch.project.repo_path = endrev.branch.project.repo_path[:-1]
-
-    m = GITHUB_URL_RE.match(endrev.branch.project.repo_path)
+def _parse_repo_path(project):
+    repo_path = project.repo_path.rstrip('/')
+    m = GITHUB_URL_RE.match(repo_path)
 
     if not m:
         raise ValueError(
-            "Unable to parse Github URL %s" % endrev.branch.project.repo_path)
+            "Unable to parse Github URL %s" % repo_path)
+
+    project_name = m.group("project")
+    if project_name.endswith(".git"):
+        project_name = project_name[:-len(".git")]
+    return m.group("username"), project_name
+
+
+def _commit_log(commit_json, tags):
+    """Returns the log of an entry of the commits or compare APIs"""
+    commit = commit_json['commit']
+    return {
+        'date': isodate.parse_datetime(commit['committer']['date']),
+        'message': commit['message'],
+        'body': "",
+        'author': commit['author']['name'],
+        'author_email': commit['author']['email'],
+        'commitid': commit_json['sha'],
+        'short_commit_id': commit_json['sha'][0:7],
+        'parents': commit_json['parents'],
+        'tag': tags.get(commit_json['sha'], "")}
+
+
+def getcommits(project, commitids):
+    """Returns the logs of the given commits
+
+    The commit list of the default branch is read one page of
+    GITHUB_COMMITS_PER_PAGE commits at a time, until all commits are found
+    or GITHUB_COMMIT_PAGES pages were read. Commits that were not found
+    are then retrieved one by one.
+    """
+    username, repo = _parse_repo_path(project)
+    tags = get_tags(username, repo)
+    missing = set(commitids)
+    logs = []
 
-    username = m.group("username")
-    project = m.group("project")
+    for page in range(1, GITHUB_COMMIT_PAGES + 1):
+        if not missing:
+            break
+        commits_url = api_url('/repos/%s/%s/commits?sha=%s&per_page=%d'
+                              '&page=%d', username, repo,
+                              project.default_branch,
+                              GITHUB_COMMITS_PER_PAGE, page)
+        commits_json = fetch_json(commits_url)
+        for commit_json in commits_json:
+            found = set(commitid for commitid in missing
+                        if commit_json['sha'].startswith(commitid))
+            if found:
+                missing -= found
+                logs.append(_commit_log(commit_json, tags))
+        if len(commits_json) < GITHUB_COMMITS_PER_PAGE:
+            break
+
+    for commitid in missing:
+        try:
+            logs.append(retrieve_revision(commitid, username, repo))
+        except (CommitLogError, IOError) as e:
+            logger.warning("unable to get log for commit %s: %s", commitid, e)
+    return logs
 
-    logs = []
-    last_rev_data = None
-    revision_count = 0
-    ancestor_found = False
-    # TODO: get all revisions between endrev and startrev,
-    # not only those present in the Codespeed DB
-
-    for revision in revisions:
-        last_rev_data = retrieve_revision(
-            revision.commitid, username, project, revision)
-        logs.append(last_rev_data)
-        revision_count += 1
-        ancestor_found = (
-            startrev.commitid in [
-                rev['sha'] for rev in last_rev_data['parents']])
-
-    # Simple approach to find the startrev, stop after found or after
-    # #GITHUB_REVISION_LIMIT revisions are fetched
-    while (revision_count < GITHUB_REVISION_LIMIT
-            and not ancestor_found
-            and len(last_rev_data['parents']) > 0):
-        last_rev_data = retrieve_revision(
-            last_rev_data['parents'][0]['sha'], username, project)
-        logs.append(last_rev_data)
-        revision_count += 1
-        ancestor_found = (
-            startrev.commitid in [
-                rev['sha'] for rev in last_rev_data['parents']])
 
+def getlogs(endrev, startrev):
+    """
+    Returns the logs of the commits between startrev and endrev
+
+    The range is read from the compare API. Its first page tells the number
+    of commits in the range, the other pages are then fetched concurrently.
+    """
+    username, project = _parse_repo_path(endrev.branch.project)
+    tags = get_tags(username, project)
+
+    if endrev.commitid == startrev.commitid:
+        commit_json = fetch_json(api_url('/repos/%s/%s/commits/%s', username,
+                                         project, endrev.commitid),
+                                 max_age=None)
+        return [_commit_log(commit_json, tags)]
+
+    def compare_url(page):
+        return api_url('/repos/%s/%s/compare/%s...%s?per_page=%d&page=%d',
+                       username, project, startrev.commitid, endrev.commitid,
+                       GITHUB_COMMITS_PER_PAGE, page)
+
+    # Comparisons of two commit ids never change
+    first_page = fetch_json(compare_url(1), max_age=None)
+    num_pages = min(int(math.ceil(
+        first_page['total_commits'] / float(GITHUB_COMMITS_PER_PAGE))),
+        GITHUB_COMMIT_PAGES)
+    pages = [first_page] + fetch_pages(
+        [compare_url(page) for page in range(2, num_pages + 1)],
+        max_age=None)
+
+    logs = [_commit_log(commit_json, tags)
+            for page in pages for commit_json in page['commits']]
     return sorted(logs, key=lambda i: i['date'], reverse=True)
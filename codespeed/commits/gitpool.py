@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of long-lived 'git cat-file --batch' processes
+
+Looking up a commit through a running cat-file process avoids starting git
+and opening the repository for every lookup. Each working copy has its own
+pool of at most settings.GIT_CAT_FILE_PROCESSES processes, which are
+stopped after settings.GIT_CAT_FILE_IDLE_TIMEOUT seconds without use.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from subprocess import Popen, PIPE
+
+from django.conf import settings
+
+from .exceptions import CommitLogError
+
+logger = logging.getLogger(__name__)
+
+
+def check_name(name):
+    """Raises CommitLogError for names with whitespace or control
+    characters, which cat-file would answer with several objects"""
+    if not name or any(c.isspace() or ord(c) < 32 or ord(c) == 127
+                       for c in name):
+        raise CommitLogError("Invalid git object name %r" % name)
+
+
+class CatFileProcess(object):
+    """A 'git cat-file --batch' process reading objects of a working copy"""
+
+    def __init__(self, working_copy):
+        self.process = Popen(["git", "cat-file", "--batch"], stdin=PIPE,
+                             stdout=PIPE, stderr=PIPE, cwd=working_copy)
+        self.last_used = time.time()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def read(self, name):
+        """
+        Returns a (sha, type, content) tuple for an object name, which can
+        be any revision git understands, or None if it does not exist
+        """
+        check_name(name)
+        self.last_used = time.time()
+        self.process.stdin.write(name.encode('utf-8') + b"\n")
+        self.process.stdin.flush()
+        header = self.process.stdout.readline()
+        if not header:
+            raise IOError("git cat-file exited with %s" % self.process.poll())
+        parts = header.decode('utf-8', 'replace').split()
+        if len(parts) != 3:
+            # "<name> missing" or "<name> ambiguous"
+            return None
+        sha, object_type, size = parts
+        content = self.process.stdout.read(int(size) + 1)[:-1]
+        return sha, object_type, content
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait()
+        except (IOError, OSError):
+            self.process.kill()
+
+
+class CatFilePool(object):
+    """Reuses up to max_processes cat-file processes of a working copy"""
+
+    def __init__(self, working_copy, max_processes, idle_timeout):
+        self.working_copy = working_copy
+        self.max_processes = max_processes
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def _close_idle(self, now):
+        expired = [p for p in self.idle
+                   if now - p.last_used > self.idle_timeout or
+                   not p.is_alive()]
+        for process in expired:
+            self.idle.remove(process)
+            self.running -= 1
+            process.close()
+
+    @contextmanager
+    def process(self):
+        """Lends a process, waiting while all max_processes are in use"""
+        with self.condition:
+            self._close_idle(time.time())
+            while not self.idle and self.running >= self.max_processes:
+                self.condition.wait()
+            if self.idle:
+                process = self.idle.pop()
+            else:
+                self.running += 1
+                process = None
+
+        healthy = False
+        try:
+            if process is None:
+                process = CatFileProcess(self.working_copy)
+            yield process
+            healthy = process.is_alive()
+        finally:
+            with self.condition:
+                if healthy:
+                    self.idle.append(process)
+                else:
+                    self.running -= 1
+                    if process is not None:
+                        process.close()
+                self.condition.notify()
+
+    def read(self, name):
+        """Reads an object, restarting a process that stopped working"""
+        check_name(name)
+        for attempt in range(2):
+            try:
+                with self.process() as process:
+                    return process.read(name)
+            except (IOError, OSError, ValueError) as e:
+                logger.warning("git cat-file failed in %s: %s",
+                               self.working_copy, e)
+        raise CommitLogError(
+            "git cat-file failed in %s" % self.working_copy)
+
+    def close(self):
+        with self.condition:
+            self._close_idle(float('inf'))
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(working_copy):
+    with _pools_lock:
+        pool = _pools.get(working_copy)
+        if pool is None:
+            pool = _pools[working_copy] = CatFilePool(
+                working_copy,
+                getattr(settings, 'GIT_CAT_FILE_PROCESSES', 2),
+                getattr(settings, 'GIT_CAT_FILE_IDLE_TIMEOUT', 300))
+        return pool
+
+
+def parse_commit(content):
+    """Returns the headers and message of a raw commit object
+
+    Headers are a list of (name, value) tuples, since 'parent' repeats.
+    """
+    content = content.decode('utf-8', 'replace')
+    header_text, _, message = content.partition("\n\n")
+    headers = []
+    for line in header_text.split("\n"):
+        if line.startswith(" ") and headers:
+            # Continuation of a multi-line header such as gpgsig
+            name, value = headers[-1]
+            headers[-1] = (name, value + "\n" + line[1:])
+        else:
+            name, _, value = line.partition(" ")
+            headers.append((name, value))
+    return headers, message
+
+
+def parse_signature(value):
+    """Splits an author or committer header into name, email and timestamp"""
+    name, _, rest = value.partition(" <")
+    email, _, rest = rest.partition("> ")
+    return name, email, int(rest.split()[0])
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived Mercurial command servers
+
+Starting hg costs the startup of a Python interpreter. With
+settings.HG_USE_CMDSERVER enabled, the mercurial backend runs its commands
+through one 'hg serve --cmdserver pipe' process per working copy instead.
+See https://www.mercurial-scm.org/wiki/CommandServer for the protocol.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+import struct
+import threading
+from subprocess import Popen, PIPE
+
+from .exceptions import CommitLogError
+
+logger = logging.getLogger(__name__)
+
+
+class CommandServer(object):
+    """An 'hg serve --cmdserver pipe' process of a working copy"""
+
+    def __init__(self, working_copy):
+        self.working_copy = working_copy
+        self.process = None
+        self.devnull = None
+
+    def start(self):
+        env = dict(os.environ, HGPLAIN='1', HGENCODING='UTF-8')
+        # Command errors come through the 'e' channel, and an unread stderr
+        # pipe could fill up and block the server
+        self.devnull = open(os.devnull, 'wb')
+        self.process = Popen(
+            ["hg", "serve", "--cmdserver", "pipe",
+             "--config", "ui.interactive=False"],
+            stdin=PIPE, stdout=PIPE, stderr=self.devnull,
+            cwd=self.working_copy, env=env)
+        channel, hello = self._read_channel()
+        if channel != b'o' or b'runcommand' not in hello:
+            raise IOError("unexpected hg command server greeting: %r" % hello)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _read_channel(self):
+        header = self.process.stdout.read(5)
+        if len(header) < 5:
+            raise IOError("hg command server exited with %s" %
+                          self.process.poll())
+        channel, length = struct.unpack('>cI', header)
+        if channel in (b'I', b'L'):
+            # Asking for input, which we never give
+            return channel, length
+        return channel, self.process.stdout.read(length)
+
+    def runcommand(self, args):
+        """Runs an hg command, returning its exit code, output and errors"""
+        data = b'\0'.join(arg.encode('utf-8') for arg in args)
+        self.process.stdin.write(
+            b'runcommand\n' + struct.pack('>I', len(data)) + data)
+        self.process.stdin.flush()
+
+        output, error = [], []
+        while True:
+            channel, data = self._read_channel()
+            if channel == b'o':
+                output.append(data)
+            elif channel == b'e':
+                error.append(data)
+            elif channel == b'r':
+                return (struct.unpack('>i', data)[0], b''.join(output),
+                        b''.join(error))
+            elif channel in (b'I', b'L'):
+                raise IOError("hg asked for input running %s" % args)
+            elif channel.isupper():
+                # Unknown mandatory channel
+                raise IOError("unexpected hg channel %r" % channel)
+
+    def close(self, kill=False):
+        """Stops the server, killing it if it may be stuck in a command"""
+        if self.process is None:
+            return
+        try:
+            if kill:
+                self.process.kill()
+            self.process.stdin.close()
+            self.process.wait()
+        except (IOError, OSError):
+            pass
+        self.devnull.close()
+        self.process = None
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def _get_server(working_copy):
+    with _servers_lock:
+        if working_copy not in _servers:
+            _servers[working_copy] = (CommandServer(working_copy),
+                                      threading.Lock())
+        return _servers[working_copy]
+
+
+def runcommand(working_copy, args):
+    """
+    Runs an hg command in the command server of a working copy
+
+    Commands of a working copy run one at a time. A server that stopped
+    working is restarted once.
+    """
+    server, lock = _get_server(working_copy)
+    with lock:
+        for attempt in range(2):
+            try:
+                if not server.is_alive():
+                    server.start()
+                return server.runcommand(args)
+            except (IOError, OSError, struct.error) as e:
+                logger.warning("hg command server failed in %s: %s",
+                               working_copy, e)
+                server.close(kill=True)
+    raise CommitLogError("hg command server failed in %s" % working_copy)
+
+
+def close_all():
+    with _servers_lock:
+        for server, lock in _servers.values():
+            with lock:
+                server.close()
+        _servers.clear()
@@ -3,33 +3,106 @@ from __future__ import absolute_import, unicode_literals
 
 import logging
 
+from . import repos, store
+
 logger = logging.getLogger(__name__)
 
 
-def get_logs(rev, startrev, update=False):
-    logs = []
-    project = rev.branch.project
+def get_backend(project):
+    """Returns the module retrieving commit logs for a project, or None"""
     if project.repo_type == project.SUBVERSION:
-        from .subversion import getlogs, updaterepo
+        from . import subversion as backend
     elif project.repo_type == project.MERCURIAL:
-        from .mercurial import getlogs, updaterepo
+        from . import mercurial as backend
     elif project.repo_type == project.GIT:
-        from .git import getlogs, updaterepo
+        from . import git as backend
     elif project.repo_type == project.GITHUB:
-        from .github import getlogs, updaterepo
+        from . import github as backend
     else:
         if project.repo_type not in (project.NO_LOGS, ""):
             logger.warning("Don't know how to retrieve logs from %s project",
                            project.get_repo_type_display())
+        return None
+    return backend
+
+
+def _update_tags(backend, project, logs):
+    """Applies the current tags to stored logs, as tags can be moved"""
+    if not hasattr(backend, 'gettags'):
+        return
+    tag_map = backend.gettags(project)
+    if tag_map is None:
+        return
+    for log in logs:
+        log['tag'] = "\n".join(tag_map.get(log['commitid'], []))
+
+
+def get_logs(rev, startrev, update=False):
+    logs = []
+    project = rev.branch.project
+    backend = get_backend(project)
+    if backend is None:
+        return logs
+
+    # Commits never change, serve known ranges without asking the repository
+    logs = store.get_range(project, rev.commitid, startrev.commitid)
+    if logs is not None:
+        _update_tags(backend, project, logs)
         return logs
 
+    repos.check_working_copy(project)
     if update:
-        updaterepo(rev.branch.project)
+        repos.update_working_copy(project)
 
-    logs = getlogs(rev, startrev)
+    logs = backend.getlogs(rev, startrev)
+    store.save_logs(project, logs)
 
     # Remove last log because the startrev log shouldn't be shown
     if len(logs) > 1 and logs[-1].get('commitid') == startrev.commitid:
         logs.pop()
 
     return logs
+
+
+def _matches(commitid, log):
+    """Whether a commit id, which may be abbreviated, identifies a log
+
+    Only hashes can be abbreviated, revision numbers, e.g. of subversion,
+    must be equal.
+    """
+    commitid = str(commitid)
+    log_commitid = str(log['commitid'])
+    if log_commitid.isdigit():
+        matches = log_commitid == commitid
+    else:
+        matches = log_commitid.startswith(commitid)
+    return (matches or
+            commitid in str(log.get('short_commit_id', '')).split(':'))
+
+
+def get_commits(project, commitids, update=False):
+    """
+    Returns the logs of many commits of a project at once
+
+    The backends retrieve all of them with a single call where the VCS
+    allows it. It returns a dict of commit id -> log, where commit ids
+    that could not be found are missing.
+    """
+    backend = get_backend(project)
+    commitids = list(set(commitids))
+    if backend is None or not commitids:
+        return {}
+
+    repos.check_working_copy(project)
+    if update:
+        repos.update_working_copy(project)
+
+    logs = backend.getcommits(project, commitids)
+    store.save_logs(project, logs)
+
+    commits = {}
+    for log in logs:
+        for commitid in commitids:
+            if commitid not in commits and _matches(commitid, log):
+                commits[commitid] = log
+    return commits
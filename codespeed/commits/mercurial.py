@@ -8,6 +8,7 @@ import logging
 
 from django.conf import settings
 
+from . import hgserver
 from .exceptions import CommitLogError
 
 logger = logging.getLogger(__name__)
@@ -45,60 +46,92 @@ def updaterepo(project, update=True):
             return [{'error': False}]
 
 
-def getlogs(endrev, startrev):
-    updaterepo(endrev.branch.project, update=False)
+LOG_TEMPLATE = ("{rev}:{node|short}\n{node}\n{author|user}\n{author|email}"
+                "\n{date}\n{tags}\n{desc}\n=newlog=\n")
 
-    cmd = [
-        "hg", "log",
-        "-r", "%s::%s" % (startrev.commitid, endrev.commitid),
-        "--template",
-        ("{rev}:{node|short}\n{node}\n{author|user}\n{author|email}"
-         "\n{date}\n{tags}\n{desc}\n=newlog=\n")
-    ]
 
-    working_copy = endrev.branch.project.working_copy
-    p = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=working_copy)
-    stdout, stderr = p.communicate()
+def _hg_log(working_copy, revset):
+    cmd = ["hg", "log", "-r", revset, "--template", LOG_TEMPLATE]
 
-    if p.returncode != 0:
-        raise CommitLogError(str(stderr))
+    if getattr(settings, 'HG_USE_CMDSERVER', False):
+        returncode, stdout, stderr = hgserver.runcommand(
+            working_copy, cmd[1:])
     else:
-        stdout = stdout.rstrip('\n')  # Remove last newline
-        logs = []
-        for log in stdout.split("=newlog=\n"):
-            elements = []
-            elements = log.split('\n')[:-1]
-            if len(elements) < 7:
-                # "Malformed" log
-                logs.append({
-                    'date': '-', 'message': 'error parsing log', 'commitid': '-'})
-            else:
-                short_commit_id = elements.pop(0)
-                commit_id = elements.pop(0)
-                author_name = elements.pop(0)
-                author_email = elements.pop(0)
-                date = elements.pop(0)
-                tag = elements.pop(0)
-                tag = "" if tag == "tip" else tag
-                # All other newlines should belong to the description text. Join.
-                message = '\n'.join(elements)
-
-                # Parse date
-                date = date.split('-')[0]
-                date = datetime.datetime.fromtimestamp(
-                    float(date)).strftime("%Y-%m-%d %H:%M:%S")
-
-                # Add changeset info
-                logs.append({
-                    'date': date,
-                    'author': author_name,
-                    'author_email': author_email,
-                    'message': message,
-                    'short_commit_id': short_commit_id,
-                    'commitid': commit_id,
-                    'tag': tag
-                })
+        p = Popen(cmd, stdout=PIPE, stderr=PIPE, cwd=working_copy)
+        stdout, stderr = p.communicate()
+        returncode = p.returncode
+
+    if returncode != 0:
+        raise CommitLogError(str(stderr))
+    return _parse_logs(stdout.decode('utf-8', 'replace'))
+
+
+def _parse_logs(stdout):
+    stdout = stdout.rstrip('\n')  # Remove last newline
+    logs = []
+    for log in stdout.split("=newlog=\n"):
+        elements = []
+        elements = log.split('\n')[:-1]
+        if len(elements) < 7:
+            # "Malformed" log
+            logs.append({
+                'date': '-', 'message': 'error parsing log', 'commitid': '-'})
+        else:
+            short_commit_id = elements.pop(0)
+            commit_id = elements.pop(0)
+            author_name = elements.pop(0)
+            author_email = elements.pop(0)
+            date = elements.pop(0)
+            tag = elements.pop(0)
+            tag = "" if tag == "tip" else tag
+            # All other newlines should belong to the description text. Join.
+            message = '\n'.join(elements)
+
+            # Parse date
+            date = date.split('-')[0]
+            date = datetime.datetime.fromtimestamp(
+                float(date)).strftime("%Y-%m-%d %H:%M:%S")
+
+            # Add changeset info
+            logs.append({
+                'date': date,
+                'author': author_name,
+                'author_email': author_email,
+                'message': message,
+                'short_commit_id': short_commit_id,
+                'commitid': commit_id,
+                'tag': tag,
+                'position': int(short_commit_id.split(':')[0]),
+            })
+    return logs
+
+
+def getlogs(endrev, startrev):
+    updaterepo(endrev.branch.project, update=False)
+
+    logs = _hg_log(endrev.branch.project.working_copy,
+                   "%s::%s" % (startrev.commitid, endrev.commitid))
     # Remove last log here because mercurial saves the short hast as commitid now
     if len(logs) > 1 and logs[-1].get('short_commit_id') == startrev.commitid:
         logs.pop()
     return logs
+
+
+def getcommits(project, commitids):
+    """Returns the logs of the given changesets with a single hg log call"""
+    updaterepo(project, update=False)
+
+    try:
+        return _hg_log(project.working_copy, " + ".join(commitids))
+    except CommitLogError:
+        if len(commitids) == 1:
+            raise
+    # An unknown changeset fails the whole call, retry them one by one
+    logs = []
+    for commitid in commitids:
+        try:
+            logs.extend(_hg_log(project.working_copy, commitid))
+        except CommitLogError as e:
+            logger.warning("unable to get log for changeset %s: %s",
+                           commitid, e)
+    return logs
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Updates of the working copies of git and mercurial projects
+
+Each working copy has a lock file, so that only one process pulls it at a
+time, and a stamp file recording when it was last fetched. When
+settings.BACKGROUND_REPO_FETCH is True the fetch_repos management command
+is the only one pulling, and requests only read the working copies.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .exceptions import CommitLogError
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, working copies are then not locked
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def background_fetch_enabled():
+    return getattr(settings, 'BACKGROUND_REPO_FETCH', False)
+
+
+def has_working_copy(project):
+    return project.repo_type in (project.GIT, project.MERCURIAL)
+
+
+def _state_path(project, suffix):
+    return os.path.join(settings.REPOSITORY_BASE_PATH,
+                        '.%s.%s' % (project.repo_name, suffix))
+
+
+@contextmanager
+def repo_lock(project):
+    """Holds the lock of the working copy of a project"""
+    if not os.path.isdir(settings.REPOSITORY_BASE_PATH):
+        os.makedirs(settings.REPOSITORY_BASE_PATH)
+    with open(_state_path(project, 'lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_fetch_state(project):
+    """Returns the last fetch times and number of consecutive failures"""
+    state = {'last_success': None, 'last_attempt': None, 'failures': 0,
+             'error': ''}
+    try:
+        with open(_state_path(project, 'fetch')) as stamp:
+            state.update(json.load(stamp))
+    except (IOError, ValueError):
+        pass
+    return state
+
+
+def _save_fetch_state(project, state):
+    path = _state_path(project, 'fetch')
+    with open(path + '.tmp', 'w') as stamp:
+        json.dump(state, stamp)
+    os.rename(path + '.tmp', path)
+
+
+def get_staleness(project):
+    """Seconds since the working copy was last fetched, None if never"""
+    last_success = get_fetch_state(project)['last_success']
+    if last_success is None:
+        return None
+    return time.time() - last_success
+
+
+def get_backoff(state):
+    """Seconds to wait after the last attempt before fetching again"""
+    interval = getattr(settings, 'REPO_FETCH_INTERVAL', 300)
+    if not state['failures']:
+        return interval
+    return min(interval * 2 ** state['failures'],
+               getattr(settings, 'REPO_FETCH_MAX_BACKOFF', 3600))
+
+
+def fetch_project(project, force=False):
+    """
+    Pulls or clones the working copy of a project
+
+    Waits while another process updates the same working copy, and does not
+    pull again if it was updated meanwhile. Unless force is True, projects
+    are not fetched before their fetch interval or failure backoff passed.
+    Returns True if the working copy was updated.
+    """
+    from .logs import get_backend
+
+    started = time.time()
+    if not force:
+        state = get_fetch_state(project)
+        if (state['last_attempt'] is not None and
+                started < state['last_attempt'] + get_backoff(state)):
+            return False
+
+    with repo_lock(project):
+        state = get_fetch_state(project)
+        if (state['last_success'] is not None and
+                state['last_success'] >= started):
+            # Another process pulled while we were waiting for the lock
+            return False
+
+        state['last_attempt'] = time.time()
+        try:
+            get_backend(project).updaterepo(project)
+        except CommitLogError as e:
+            state['failures'] += 1
+            state['error'] = str(e)
+            _save_fetch_state(project, state)
+            raise
+        state.update(last_success=state['last_attempt'], failures=0,
+                     error='')
+        _save_fetch_state(project, state)
+    return True
+
+
+def update_working_copy(project):
+    """Brings the working copy of a project up to date for a request
+
+    With BACKGROUND_REPO_FETCH enabled only the staleness of the working
+    copy is checked, as fetch_repos updates it.
+    """
+    if not has_working_copy(project):
+        from .logs import get_backend
+        get_backend(project).updaterepo(project)
+    elif not background_fetch_enabled():
+        fetch_project(project, force=True)
+    else:
+        staleness = get_staleness(project)
+        if staleness is None:
+            return
+        if staleness > 2 * getattr(settings, 'REPO_FETCH_INTERVAL', 300):
+            logger.warning("The working copy of %s was last fetched %.0fs "
+                           "ago", project, staleness)
+
+
+def check_working_copy(project):
+    """Raises CommitLogError if a request would have to clone a repository
+
+    With BACKGROUND_REPO_FETCH enabled the working copies are only cloned
+    by fetch_repos.
+    """
+    if (background_fetch_enabled() and has_working_copy(project) and
+            not os.path.exists(project.working_copy)):
+        raise CommitLogError(
+            "The repository of %s has not been fetched yet" % project)
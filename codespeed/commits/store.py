@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Database store of the commit logs retrieved from the repositories
+
+Only logs that list their parent commits are stored, so that a range of
+commits can be rebuilt by walking the parents from its last commit.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from datetime import datetime
+
+import isodate
+from django.utils.dateparse import parse_datetime
+
+
+# Maximum number of commits of a range served from the store. Longer
+# ranges, and ranges reaching commits before the start commit through
+# merges, are retrieved from the repository
+MAX_STORED_RANGE = 500
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_log_date(date):
+    """Returns the date of a commit log as a naive datetime"""
+    if not isinstance(date, datetime):
+        date = parse_datetime(date)
+    if date is not None and date.tzinfo is not None:
+        # Store naive UTC dates, as the Github backend does
+        date = date.astimezone(isodate.tzinfo.Utc()).replace(tzinfo=None)
+    return date
+
+
+def _parent_ids(log):
+    # Github logs list their parents as {'sha': ..., 'url': ...} dicts
+    return [p['sha'] if isinstance(p, dict) else p for p in log['parents']]
+
+
+def _to_log(commit_log):
+    return {
+        'date': (commit_log.date.strftime(DATE_FORMAT)
+                 if commit_log.date else ''),
+        'message': commit_log.message,
+        'commitid': commit_log.commitid,
+        'author': commit_log.author,
+        'author_email': commit_log.author_email,
+        'body': commit_log.body,
+        'short_commit_id': commit_log.short_commit_id,
+        'parents': commit_log.get_parents(),
+        'tag': commit_log.tag,
+    }
+
+
+def save_logs(project, logs):
+    """Stores the logs that are not stored yet"""
+    from ..models import CommitLog
+
+    logs = dict((log['commitid'], log) for log in logs
+                if log.get('commitid') and 'parents' in log)
+    if not logs:
+        return
+    known = set(CommitLog.objects.filter(
+        project=project, commitid__in=list(logs)
+    ).values_list('commitid', flat=True))
+
+    new_logs = []
+    for commitid, log in logs.items():
+        if commitid in known:
+            continue
+        new_logs.append(CommitLog(
+            project=project,
+            commitid=commitid,
+            short_commit_id=log.get('short_commit_id', ''),
+            parents=" ".join(_parent_ids(log)),
+            author=log.get('author', '')[:100],
+            author_email=log.get('author_email', '')[:100],
+            date=parse_log_date(log['date']),
+            message=log.get('message', ''),
+            body=log.get('body', ''),
+            tag=log.get('tag', '')[:200]))
+    CommitLog.objects.bulk_create(new_logs)
+
+
+def get_range(project, endid, startid):
+    """
+    Returns the stored logs of the commits of endid not in startid
+
+    Like 'git log startid..endid', newest first. Returns None when the
+    range is not fully stored, or when endid does not descend from startid
+    within MAX_STORED_RANGE commits.
+    """
+    from ..models import CommitLog
+
+    stored = CommitLog.objects.filter(project=project)
+    endpoints = dict(
+        (c.commitid, c) for c in stored.filter(commitid__in=[endid, startid]))
+    end = endpoints.get(endid)
+    if end is None:
+        return None
+    if endid == startid:
+        return [_to_log(end)]
+    start = endpoints.get(startid)
+
+    # Most commits of a range are dated between both ends, load them at once
+    known = {endid: end}
+    if start is not None and start.date and end.date:
+        known.update((c.commitid, c) for c in stored.filter(
+            date__gte=start.date, date__lte=end.date
+        )[:MAX_STORED_RANGE])
+
+    commits = []
+    seen = set([endid])
+    frontier = [endid]
+    while frontier:
+        missing = [commitid for commitid in frontier if commitid not in known]
+        if missing:
+            known.update((c.commitid, c) for c in stored.filter(
+                commitid__in=missing))
+            if any(commitid not in known for commitid in missing):
+                return None
+
+        parents = []
+        for commitid in frontier:
+            commit = known[commitid]
+            commits.append(commit)
+            if not commit.get_parents():
+                # A root commit, startid is not an ancestor of endid
+                return None
+            for parent in commit.get_parents():
+                if parent != startid and parent not in seen:
+                    seen.add(parent)
+                    parents.append(parent)
+        if len(seen) > MAX_STORED_RANGE:
+            return None
+        frontier = parents
+
+    commits.sort(key=lambda c: (c.date is not None, c.date), reverse=True)
+    return [_to_log(commit) for commit in commits]
@@ -2,76 +2,139 @@
 """Subversion commit logs support"""
 from __future__ import absolute_import
 
+import threading
+import time
 from datetime import datetime
 
+from django.conf import settings
+
 from .exceptions import CommitLogError
 
+# Maps repository paths to a (fetched, highest revision, {revision: tag})
+# tuple
+_tag_maps = {}
+_tag_maps_lock = threading.Lock()
+
 
 def updaterepo(project):
     """Not needed for a remote subversion repo"""
     return [{'error': False}]
 
 
-def get_tag(rev_num, repo_path, client):
-    tags_url = repo_path + '/tags'
-    tags = client.ls(tags_url)
+def _list_tags(repo_path, client):
+    tags = {}
+    for tag in client.ls(repo_path + '/tags'):
+        if 'created_rev' in tag and 'name' in tag:
+            tags.setdefault(tag['created_rev'].number,
+                            tag['name'].split('/')[-1])
+    return tags
 
-    for tag in tags:
-        if 'created_rev' in tag and tag['created_rev'].number == rev_num:
-            if 'name' in tag:
-                return tag['name'].split('/')[-1]
-    return ''
 
+def get_tag_map(repo_path, client, rev_num):
+    """
+    Returns the revision number -> tag map of a repository
 
-def getlogs(newrev, startrev):
-    import pysvn
+    The tags are listed once every SVN_TAGS_REFRESH_INTERVAL seconds. A tag
+    is created by a new commit, so the map is also listed again when asked
+    for a revision newer than all revisions it was listed for.
+    """
+    refresh_interval = getattr(settings, 'SVN_TAGS_REFRESH_INTERVAL', 300)
+    with _tag_maps_lock:
+        cached = _tag_maps.get(repo_path)
+    if (cached is not None and time.time() - cached[0] < refresh_interval and
+            rev_num <= cached[1]):
+        return cached[2]
+
+    tags = _list_tags(repo_path, client)
+    highest = max([rev_num] + list(tags))
+    with _tag_maps_lock:
+        _tag_maps[repo_path] = (time.time(), highest, tags)
+    return tags
 
-    logs = []
-    log_messages = []
-    loglimit = 200
+
+def get_tag(rev_num, repo_path, client):
+    return get_tag_map(repo_path, client, rev_num).get(rev_num, '')
+
+
+def _get_client(project):
+    import pysvn
 
     def get_login(realm, username, may_save):
-        repo_user = newrev.branch.project.repo_user
-        repo_pass = newrev.branch.project.repo_pass
-        return True, repo_user, repo_pass, False
+        return True, project.repo_user, project.repo_pass, False
 
     client = pysvn.Client()
-    if newrev.branch.project.repo_user != "":
+    if project.repo_user != "":
         client.callback_get_login = get_login
+    return client
+
+
+def _get_log_messages(project, client, startrev, endrev):
+    import pysvn
 
     try:
-        log_messages = \
-            client.log(
-                newrev.branch.project.repo_path,
-                revision_start=pysvn.Revision(
-                    pysvn.opt_revision_kind.number, startrev.commitid
-                ),
-                revision_end=pysvn.Revision(
-                    pysvn.opt_revision_kind.number, newrev.commitid
-                )
+        return client.log(
+            project.repo_path,
+            revision_start=pysvn.Revision(
+                pysvn.opt_revision_kind.number, startrev
+            ),
+            revision_end=pysvn.Revision(
+                pysvn.opt_revision_kind.number, endrev
             )
+        )
     except pysvn.ClientError as e:
         raise CommitLogError(e.args)
     except ValueError:
         raise CommitLogError(
-            "'%s' is an invalid subversion revision number" % newrev.commitid)
+            "'%s' is an invalid subversion revision number" % endrev)
+
+
+def _format_log(log, tag_map):
+    try:
+        author = log.author
+    except AttributeError:
+        author = ""
+    date = datetime.fromtimestamp(log.date).strftime("%Y-%m-%d %H:%M:%S")
+    message = log.message
+    tag = tag_map.get(log.revision.number, '')
+    return {
+        'date': date, 'author': author, 'message': message,
+        'commitid': log.revision.number, 'tag': tag,
+        'position': log.revision.number}
+
+
+def getlogs(newrev, startrev):
+    loglimit = 200
+
+    project = newrev.branch.project
+    client = _get_client(project)
+    log_messages = _get_log_messages(
+        project, client, startrev.commitid, newrev.commitid)
     log_messages.reverse()
     s = len(log_messages)
     while s > loglimit:
         log_messages = log_messages[:s]
         s = len(log_messages) - 1
 
-    for log in log_messages:
-        try:
-            author = log.author
-        except AttributeError:
-            author = ""
-        date = datetime.fromtimestamp(log.date).strftime("%Y-%m-%d %H:%M:%S")
-        message = log.message
-        tag = get_tag(log.revision.number,
-                      newrev.branch.project.repo_path, client)
-        # Add log unless it is the last commit log, which has already been tested
-        logs.append({
-            'date': date, 'author': author, 'message': message,
-            'commitid': log.revision.number, 'tag': tag})
-    return logs
+    if not log_messages:
+        return []
+    tag_map = get_tag_map(
+        project.repo_path, client,
+        max(log.revision.number for log in log_messages))
+    # Add log unless it is the last commit log, which has already been tested
+    return [_format_log(log, tag_map) for log in log_messages]
+
+
+def getcommits(project, commitids):
+    """Returns the logs of the given revisions with a single log call"""
+    try:
+        numbers = set(int(commitid) for commitid in commitids)
+    except ValueError as e:
+        raise CommitLogError(
+            "invalid subversion revision number: %s" % e)
+
+    client = _get_client(project)
+    log_messages = _get_log_messages(
+        project, client, min(numbers), max(numbers))
+    tag_map = get_tag_map(project.repo_path, client, max(numbers))
+    return [_format_log(log, tag_map) for log in log_messages
+            if log.revision.number in numbers]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+In-process cache for the dimension tables used when saving results
+
+Environments, projects, branches, benchmarks and executables are looked up
+by name for every saved result, but those tables are small and rarely
+change. The cache maps names (scoped by project for branches and
+executables) to model instances, and is cleared whenever one of those
+models is saved or deleted (see codespeed.signals).
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Environment, Project, Branch, Benchmark, Executable
+
+#: Models whose instances are scoped by project
+PROJECT_DIMENSIONS = (Branch, Executable)
+DIMENSION_MODELS = (Environment, Project, Benchmark) + PROJECT_DIMENSIONS
+
+
+class DimensionCache(object):
+    """Bounded, thread-safe LRU cache of dimension instances
+
+    Keys are (model, name) or (model, (project_id, name)) tuples. Entries
+    also expire after a timeout, which bounds how long other processes
+    can serve a dimension changed through this one.
+    """
+
+    def __init__(self, size=1000, timeout=300):
+        self.size = size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model, key):
+        with self._lock:
+            entry = self._data.pop((model, key), None)
+            if entry is None:
+                return None
+            instance, expires = entry
+            if expires < time.time():
+                return None
+            # Reinsert to mark as the most recently used
+            self._data[(model, key)] = entry
+            return instance
+
+    def set(self, model, key, instance):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._data.pop((model, key), None)
+            self._data[(model, key)] = (instance, time.time() + self.timeout)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+dimension_cache = DimensionCache(
+    size=getattr(settings, 'DIMENSION_CACHE_SIZE', 1000),
+    timeout=getattr(settings, 'DIMENSION_CACHE_TIMEOUT', 300))
+
+
+def cache_enabled():
+    return getattr(settings, 'USE_DIMENSION_CACHE', True)
+
+
+def dimension_key(instance):
+    """Returns the cache key for a dimension instance"""
+    if isinstance(instance, PROJECT_DIMENSIONS):
+        return (instance.project_id, instance.name)
+    return instance.name
+
+
+def chunked(values, size=500):
+    """Splits values into lists small enough for an SQL IN clause"""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def get_dimensions(model, keys):
+    """Returns a dict of key -> instance for the keys that exist
+
+    Keys are names, or (project_id, name) tuples for branches and
+    executables. Only the keys missing from the cache are queried.
+    """
+    found = {}
+    missing = set()
+    use_cache = cache_enabled()
+    for key in keys:
+        instance = use_cache and dimension_cache.get(model, key)
+        if instance:
+            found[key] = instance
+        else:
+            missing.add(key)
+
+    if missing:
+        queryset = model.objects.all()
+        if model in PROJECT_DIMENSIONS:
+            queryset = queryset.select_related('project')
+            names = set(name for project_id, name in missing)
+            queryset = queryset.filter(
+                project__in=set(project_id for project_id, name in missing))
+        else:
+            names = missing
+        for chunk in chunked(names):
+            for instance in queryset.filter(name__in=chunk):
+                key = dimension_key(instance)
+                if key not in missing:
+                    continue
+                found[key] = instance
+                if use_cache:
+                    dimension_cache.set(model, key, instance)
+    return found
+
+
+def get_dimension(model, key):
+    """Returns the instance for a single key, or None if it does not exist"""
+    return get_dimensions(model, [key]).get(key)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Downsampling of long timeline series
+
+Series are reduced with min/max bucketing: the points are split into
+buckets of consecutive points, and only the lowest and highest result of
+every bucket are kept. Unlike averaging, this keeps single regressions and
+improvements visible in the plots.
+"""
+from __future__ import absolute_import, division
+
+import numpy as np
+
+
+def downsample(values, num_points, keep=None):
+    """
+    Returns the sorted indices of the values to plot so that about
+    num_points are shown
+
+    The first and last values are always kept, as are those where keep is
+    true, e.g. tagged revisions. They count towards num_points, but are
+    kept even when they exceed it.
+    """
+    values = np.asarray(values, dtype=float)
+    size = len(values)
+    if size <= max(num_points, 2):
+        return np.arange(size)
+
+    kept = np.zeros(size, dtype=bool)
+    if keep is not None:
+        kept[np.asarray(keep, dtype=bool)] = True
+    kept[0] = kept[-1] = True
+
+    num_buckets = max((num_points - np.count_nonzero(kept)) // 2, 1)
+    # Interior points, split in buckets of about the same size
+    indices = np.arange(1, size - 1)
+    buckets = indices * num_buckets // (size - 1)
+    # Sort every bucket by value: its first and last points are the lowest
+    # and highest values
+    order = indices[np.lexsort((values[indices], buckets))]
+    sorted_buckets = buckets[order - 1]
+    starts = np.flatnonzero(
+        np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    ends = np.append(starts[1:], len(order)) - 1
+    kept[order[starts]] = True
+    kept[order[ends]] = True
+    return np.flatnonzero(kept)
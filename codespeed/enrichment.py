@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Background retrieval of commit log information for new revisions
+
+When settings.QUEUE_COMMIT_LOGS is True, new revisions are saved with the
+date posted by the benchmark runner (or the current date) and an empty
+author, message and tag, and a PendingCommitLog is queued for them. The
+fetch_commit_logs management command then retrieves the commit logs, so
+that saving results never waits for a repository pull or the Github API.
+"""
+from __future__ import absolute_import
+
+import calendar
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .models import PendingCommitLog, Revision, Report
+from . import commits, timelines
+from .commits.store import parse_log_date
+
+logger = logging.getLogger(__name__)
+
+
+def queue_enabled():
+    return getattr(settings, 'QUEUE_COMMIT_LOGS', False)
+
+
+def needs_log(rev):
+    return rev.branch.project.repo_type not in ("N", "")
+
+
+def queue_commit_logs(revisions):
+    """Queues the retrieval of the commit logs of saved revisions"""
+    PendingCommitLog.objects.bulk_create(
+        [PendingCommitLog(revision=rev) for rev in revisions
+         if needs_log(rev)])
+
+
+def default_position(rev):
+    """Returns the position of a revision that is known without its log
+
+    That is the revision number for subversion, and the date as a timestamp
+    in microseconds for projects whose logs don't tell a position, so that
+    revisions saved within a second are ordered. None for git and mercurial.
+    """
+    project = rev.branch.project
+    if project.repo_type == project.SUBVERSION:
+        try:
+            return int(rev.commitid)
+        except ValueError:
+            return None
+    if project.repo_type in (project.GIT, project.MERCURIAL):
+        return None
+    if rev.date is None:
+        return None
+    return (calendar.timegm(rev.date.timetuple()) * 10 ** 6 +
+            rev.date.microsecond)
+
+
+def apply_log(rev, log):
+    """Updates a revision with the information of its commit log
+
+    Authors and tags, e.g. several git tags of one commit, are truncated to
+    the length of the revision fields.
+    """
+    rev.author = log['author'][:Revision._meta.get_field('author').max_length]
+    rev.date = parse_log_date(log['date']) or rev.date
+    rev.message = log['message']
+    rev.tag = log['tag'][:Revision._meta.get_field('tag').max_length]
+    position = log.get('position')
+    if position is None:
+        position = default_position(rev)
+    if position is not None:
+        rev.position = position
+
+
+def claim_pending_logs(limit):
+    """Marks up to limit pending logs as claimed and returns them"""
+    timeout = getattr(settings, 'QUEUE_CLAIM_TIMEOUT', 600)
+    max_attempts = getattr(settings, 'COMMIT_LOG_ATTEMPTS', 5)
+    now = datetime.now()
+    claimable = PendingCommitLog.objects.filter(
+        Q(claimed__isnull=True) |
+        Q(claimed__lt=now - timedelta(seconds=timeout)),
+        attempts__lt=max_attempts)
+    claimed = []
+    for pending in claimable.select_related(
+            'revision__branch__project').order_by('id')[:limit]:
+        if PendingCommitLog.objects.filter(
+                pk=pending.pk, claimed=pending.claimed
+        ).update(claimed=now):
+            pending.claimed = now
+            claimed.append(pending)
+    return claimed
+
+
+def mark_reports_dirty(rev, old_date, old_position):
+    """Marks the reports affected by a change of a revision date or
+    position dirty
+
+    Those are the reports of the revision itself, and the reports of the
+    revisions that follow it at its old and its new place, as their
+    previous revisions changed.
+    """
+    Report.mark_dirty(rev)
+    if old_date is not None or old_position is not None:
+        Report.mark_dirty(Revision(pk=rev.pk, branch_id=rev.branch_id,
+                                   position=old_position, date=old_date))
+
+
+def save_log(rev, log):
+    """Saves the commit log information of a revision"""
+    old_date = rev.date
+    old_position = rev.position
+    apply_log(rev, log)
+    rev.full_clean()
+    rev.save()
+    if rev.date != old_date:
+        # Results without a date of their own use the revision date
+        rev.results.filter(date=old_date).update(date=rev.date)
+    if rev.date != old_date or rev.position != old_position:
+        mark_reports_dirty(rev, old_date, old_position)
+        # Timeline series are ordered by revision position and date
+        timelines.refresh_revision(rev)
+
+
+def fetch_pending_logs(limit):
+    """Retrieves up to limit queued commit logs
+
+    The logs of all claimed revisions of a project are retrieved at once.
+    Returns a dict with the number of logs saved and failed.
+    """
+    stats = {'saved': 0, 'failed': 0}
+    by_project = OrderedDict()
+    for pending in claim_pending_logs(limit):
+        project = pending.revision.branch.project
+        by_project.setdefault(project, []).append(pending)
+
+    for project, pending_logs in by_project.items():
+        try:
+            logs = commits.get_commits(
+                project, [pending.revision.commitid
+                          for pending in pending_logs], update=True)
+        except commits.exceptions.CommitLogError as e:
+            logger.warning("unable to retrieve revisions info for %s: %s",
+                           project, e, exc_info=True)
+            error = str(e)
+            logs = {}
+        else:
+            error = "Commit not found"
+
+        for pending in pending_logs:
+            rev = pending.revision
+            if rev.commitid not in logs:
+                pending.attempts += 1
+                pending.error = error
+                pending.claimed = None
+                pending.save()
+                stats['failed'] += 1
+                continue
+            try:
+                save_log(rev, logs[rev.commitid])
+            except ValidationError as e:
+                logger.warning("unable to save the commit log of %s: %s",
+                               rev, e)
+                pending.attempts += 1
+                pending.error = str(e)
+                pending.claimed = None
+                pending.save()
+                stats['failed'] += 1
+                continue
+            pending.delete()
+            stats['saved'] += 1
+    return stats
+
+
+def queue_missing_logs(project=None):
+    """Queues the revisions that never got their commit log
+
+    Returns the number of queued revisions.
+    """
+    revisions = Revision.objects.filter(
+        author='', message='', pending_log__isnull=True
+    ).exclude(
+        branch__project__repo_type__in=("N", "")
+    ).select_related('branch__project')
+    if project is not None:
+        revisions = revisions.filter(branch__project__name=project)
+    revisions = list(revisions)
+    queue_commit_logs(revisions)
+    return len(revisions)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand, CommandError
+
+from codespeed import commits
+from codespeed.models import CommitLog, Project
+
+
+class Command(BaseCommand):
+    help = ("Stores the commit logs between all saved revisions, so that "
+            "the changes view does not have to ask the repositories")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            help="Only store the commit logs of this project")
+
+    def handle(self, *args, **options):
+        projects = Project.objects.filter(
+            repo_type__in=(Project.GIT, Project.GITHUB))
+        if options['project']:
+            projects = projects.filter(name=options['project'])
+            if not projects:
+                raise CommandError(
+                    "No git or Github project named %s" % options['project'])
+
+        for project in projects:
+            before = CommitLog.objects.filter(project=project).count()
+            update = True
+            for branch in project.branches.all():
+                startrev = None
+                for rev in branch.revisions.order_by('date'):
+                    try:
+                        commits.get_logs(rev, startrev or rev, update=update)
+                    except commits.exceptions.CommitLogError as e:
+                        self.stderr.write(
+                            "Unable to retrieve logs of %s: %s" % (rev, e))
+                    update = False
+                    startrev = rev
+            self.stdout.write("Stored %d commit logs of %s" % (
+                CommitLog.objects.filter(project=project).count() - before,
+                project))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from codespeed import spool
+
+
+class Command(BaseCommand):
+    help = ("Saves the results queued by the results API when "
+            "QUEUE_RESULTS is enabled")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=20,
+            help="Number of queued batches claimed at a time")
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running and wait for new results when the queue is "
+                 "empty")
+        parser.add_argument(
+            '--sleep', type=float, default=5.0,
+            help="Seconds to wait when the queue is empty in --loop mode")
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Only print the size of the queue")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_backlog()
+            return
+
+        while True:
+            stats = spool.drain(options['batch_size'])
+            processed = stats['batches'] + stats['failed']
+            if processed:
+                rate = stats['results'] / max(stats['seconds'], 1e-6)
+                self.stdout.write(
+                    "Saved %d results in %d batches (%d failed) in %.2fs, "
+                    "%.1f results/s" % (stats['results'], stats['batches'],
+                                        stats['failed'], stats['seconds'],
+                                        rate))
+                self.print_backlog()
+            if processed < options['batch_size']:
+                # The queue is empty
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+
+    def print_backlog(self):
+        backlog = spool.get_backlog()
+        self.stdout.write(
+            "Backlog: %(results)d results in %(batches)d batches, oldest "
+            "queued %(oldest).0fs ago, %(failed)d failed batches" % backlog)
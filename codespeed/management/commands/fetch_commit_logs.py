@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from codespeed import enrichment
+from codespeed.models import PendingCommitLog
+
+
+class Command(BaseCommand):
+    help = ("Retrieves the commit logs of new revisions when "
+            "QUEUE_COMMIT_LOGS is enabled")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help="Number of revisions claimed at a time")
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running and wait for new revisions when the queue is "
+                 "empty")
+        parser.add_argument(
+            '--sleep', type=float, default=10.0,
+            help="Seconds to wait when the queue is empty in --loop mode")
+        parser.add_argument(
+            '--missing', action='store_true',
+            help="First queue all revisions without author and message")
+        parser.add_argument(
+            '--project',
+            help="Only queue revisions of this project with --missing")
+
+    def handle(self, *args, **options):
+        if options['missing']:
+            queued = enrichment.queue_missing_logs(options['project'])
+            self.stdout.write("Queued %d revisions" % queued)
+
+        while True:
+            start = time.time()
+            stats = enrichment.fetch_pending_logs(options['batch_size'])
+            processed = stats['saved'] + stats['failed']
+            if processed:
+                self.stdout.write(
+                    "Retrieved %d commit logs (%d failed) in %.2fs, %d "
+                    "pending" % (stats['saved'], stats['failed'],
+                                 time.time() - start,
+                                 PendingCommitLog.objects.count()))
+            if processed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from codespeed.commits import repos
+from codespeed.commits.exceptions import CommitLogError
+from codespeed.models import Project
+
+
+class Command(BaseCommand):
+    help = ("Pulls the repositories of all git and mercurial projects. Run "
+            "it on a schedule, or with --loop, when BACKGROUND_REPO_FETCH is "
+            "enabled")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running and fetch every REPO_FETCH_INTERVAL seconds")
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Fetch even projects fetched recently or failing to fetch")
+        parser.add_argument(
+            '--project',
+            help="Only fetch the repository of this project")
+
+    def handle(self, *args, **options):
+        while True:
+            projects = Project.objects.filter(
+                repo_type__in=(Project.GIT, Project.MERCURIAL))
+            if options['project']:
+                projects = projects.filter(name=options['project'])
+
+            for project in projects:
+                start = time.time()
+                try:
+                    fetched = repos.fetch_project(project, options['force'])
+                except CommitLogError as e:
+                    state = repos.get_fetch_state(project)
+                    self.stderr.write(
+                        "Failed to fetch %s (%d failures in a row, next "
+                        "attempt in %ds): %s" % (
+                            project, state['failures'],
+                            repos.get_backoff(state), e))
+                    continue
+                if fetched:
+                    self.stdout.write("Fetched %s in %.2fs" % (
+                        project, time.time() - start))
+
+            if not options['loop']:
+                break
+            time.sleep(min(getattr(settings, 'REPO_FETCH_INTERVAL', 300), 60))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division
+
+import json
+import multiprocessing
+import os
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils.dateparse import parse_date, parse_datetime
+
+from codespeed.dimensions import chunked
+from codespeed.models import Report
+
+
+class Command(BaseCommand):
+    help = ("Recalculates all reports, e.g. after changing CHANGE_THRESHOLD "
+            "or TREND_THRESHOLD. Reports are split by executable, "
+            "environment and branch, which are recalculated in parallel")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help="Only recalculate the reports of revisions from this date "
+                 "(YYYY-MM-DD) on")
+        parser.add_argument(
+            '--project',
+            help="Only recalculate the reports of this project")
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help="Number of worker processes. With 1, reports are "
+                 "recalculated in this process")
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Number of reports saved per transaction")
+        parser.add_argument(
+            '--state-file',
+            help="Record the partitions done in this file. Running the "
+                 "command again with the same file and filters skips them")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since']) or \
+                parse_date(options['since'])
+            if since is None:
+                raise CommandError("Invalid date %s" % options['since'])
+
+        filters = {'since': options['since'], 'project': options['project']}
+        state = {'filters': filters, 'done': []}
+        state_file = options['state_file']
+        if state_file and os.path.exists(state_file):
+            with open(state_file) as f:
+                state = json.load(f)
+            if state['filters'] != filters:
+                raise CommandError(
+                    "%s was written for other filters: %s" % (
+                        state_file, state['filters']))
+        done = set(tuple(partition) for partition in state['done'])
+
+        partitions = [
+            partition for partition in get_partitions(since,
+                                                      options['project'])
+            if partition not in done]
+        if done:
+            self.stdout.write("Skipping %d partitions already done" %
+                              len(done))
+        tasks = [(partition, since, options['batch_size'])
+                 for partition in partitions]
+
+        start = time.time()
+        total = 0
+        if options['workers'] > 1 and len(tasks) > 1:
+            # Workers open their own connections, none can be inherited
+            connections.close_all()
+            pool = multiprocessing.Pool(
+                min(options['workers'], len(tasks)), initializer=django.setup)
+            rebuilt = pool.imap_unordered(rebuild_partition, tasks)
+        else:
+            pool = None
+            rebuilt = (rebuild_partition(task) for task in tasks)
+
+        try:
+            for partition, count, seconds in rebuilt:
+                total += count
+                self.stdout.write(
+                    "Recalculated %d reports of executable %d, environment "
+                    "%d and branch %d in %.2fs" % (
+                        (count,) + partition + (seconds,)))
+                if state_file:
+                    state['done'].append(partition)
+                    with open(state_file, 'w') as f:
+                        json.dump(state, f)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        elapsed = time.time() - start
+        self.stdout.write(
+            "Recalculated %d reports of %d partitions in %.2fs, %.1f "
+            "reports/s" % (total, len(tasks), elapsed,
+                           total / max(elapsed, 1e-6)))
+        if state_file and os.path.exists(state_file):
+            os.remove(state_file)
+
+
+def get_reports(since=None, project=None):
+    reports = Report.objects.all()
+    if since is not None:
+        reports = reports.filter(revision__date__gte=since)
+    if project is not None:
+        reports = reports.filter(revision__branch__project__name=project)
+    return reports
+
+
+def get_partitions(since=None, project=None):
+    """Returns the (executable, environment, branch) ids of the reports"""
+    return list(get_reports(since, project).order_by().values_list(
+        'executable_id', 'environment_id', 'revision__branch_id'
+    ).distinct())
+
+
+def rebuild_partition(task):
+    """Recalculates the reports of a partition, in batches
+
+    Returns the partition, the number of reports and the seconds it took.
+    """
+    partition, since, batch_size = task
+    start = time.time()
+    executable_id, environment_id, branch_id = partition
+    report_ids = get_reports(since).filter(
+        executable_id=executable_id, environment_id=environment_id,
+        revision__branch_id=branch_id
+    ).order_by('id').values_list('id', flat=True)
+
+    count = 0
+    for chunk in chunked(report_ids, batch_size):
+        reports = list(Report.objects.filter(id__in=chunk).select_related(
+            'revision', 'executable', 'environment'))
+        for report in reports:
+            report.recalculate()
+        # Only write in the transaction, so that workers do not hold
+        # database locks while computing
+        with transaction.atomic():
+            for report in reports:
+                Report.objects.filter(pk=report.pk).update(
+                    summary=report.summary, colorcode=report.colorcode,
+                    _tablecache=report._tablecache, dirty=False)
+        count += len(reports)
+    return partition, count, time.time() - start
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from codespeed import timelines
+from codespeed.models import Branch
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the stored timeline series from the results, e.g. "
+            "after changing TIMELINE_STORE_SIZE")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            help="Only rebuild the series of this project")
+
+    def handle(self, *args, **options):
+        branches = Branch.objects.select_related('project')
+        if options['project']:
+            branches = branches.filter(project__name=options['project'])
+
+        for branch in branches:
+            start = time.time()
+            count = timelines.rebuild([branch])
+            self.stdout.write("Rebuilt %d series of %s, branch %s in %.2fs" % (
+                count, branch.project, branch.name, time.time() - start))
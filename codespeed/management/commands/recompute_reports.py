@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from codespeed.models import Report
+
+
+class Command(BaseCommand):
+    help = ("Recalculates the reports marked dirty because results they are "
+            "computed from were saved late, or a revision date changed")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Number of reports recalculated at a time")
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running and wait for new dirty reports")
+        parser.add_argument(
+            '--sleep', type=float, default=30.0,
+            help="Seconds to wait when no report is dirty in --loop mode")
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Only print the number of dirty reports")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write("%d dirty reports" %
+                              Report.objects.filter(dirty=True).count())
+            return
+
+        while True:
+            start = time.time()
+            recomputed = recompute_batch(options['batch_size'])
+            if recomputed:
+                self.stdout.write("Recalculated %d reports in %.2fs" % (
+                    recomputed, time.time() - start))
+            if recomputed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+
+
+def recompute_batch(batch_size):
+    """Recalculates up to batch_size dirty reports, oldest revisions first
+
+    A report is marked clean before it is recalculated, and the dirty flag
+    is not saved with it, so that a report marked dirty again meanwhile is
+    recalculated by the next batch.
+    """
+    reports = Report.objects.filter(dirty=True).select_related(
+        'revision', 'executable', 'environment'
+    ).order_by('revision__date', 'id')[:batch_size]
+    recomputed = 0
+    for report in reports:
+        if not Report.objects.filter(pk=report.pk, dirty=True).update(
+                dirty=False):
+            # Recalculated by another process
+            continue
+        report.save(update_fields=['summary', 'colorcode', '_tablecache'])
+        recomputed += 1
+    return recomputed
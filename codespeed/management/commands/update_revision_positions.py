@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand
+
+from codespeed import commits, enrichment
+from codespeed.dimensions import chunked
+from codespeed.models import (DataVersion, Project, Report, Revision,
+                              TimelineSeries)
+
+
+class Command(BaseCommand):
+    help = ("Sets the position of the revisions saved before positions "
+            "existed, or whose commit log could not be retrieved")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            help="Only update the revisions of this project")
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options['project']:
+            projects = projects.filter(name=options['project'])
+
+        for project in projects:
+            revisions = Revision.objects.filter(
+                branch__project=project, position__isnull=True
+            ).select_related('branch__project')
+            updated = 0
+            for chunk in chunked(list(revisions), 500):
+                positions = {}
+                if project.repo_type in (Project.GIT, Project.MERCURIAL):
+                    try:
+                        logs = commits.get_commits(
+                            project, [rev.commitid for rev in chunk])
+                    except commits.exceptions.CommitLogError as e:
+                        self.stderr.write("Unable to retrieve logs of %s: %s"
+                                          % (project, e))
+                        break
+                    positions = dict(
+                        (commitid, log.get('position'))
+                        for commitid, log in logs.items())
+                for rev in chunk:
+                    position = positions.get(rev.commitid)
+                    if position is None:
+                        position = enrichment.default_position(rev)
+                    if position is not None:
+                        Revision.objects.filter(pk=rev.pk).update(
+                            position=position)
+                        updated += 1
+            if updated:
+                # Stored timeline series are ordered by position, and the
+                # changes tables compare revisions with the previous ones
+                TimelineSeries.objects.filter(
+                    branch__project=project).delete()
+                Report.objects.filter(
+                    revision__branch__project=project
+                ).update(_tablecache='', dirty=True)
+                DataVersion.bump(project_id=project.id)
+            self.stdout.write("Updated %d revisions of %s" % (
+                updated, project))
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 21:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0004_resultbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCommitLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('claimed', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('revision', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_log', to='codespeed.Revision')),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 21:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0005_pendingcommitlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommitLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('commitid', models.CharField(max_length=42)),
+                ('short_commit_id', models.CharField(blank=True, max_length=50)),
+                ('parents', models.CharField(blank=True, max_length=200)),
+                ('author', models.CharField(blank=True, max_length=100)),
+                ('author_email', models.CharField(blank=True, max_length=100)),
+                ('date', models.DateTimeField(null=True)),
+                ('message', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('tag', models.CharField(blank=True, max_length=200)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commit_logs', to='codespeed.Project')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='commitlog',
+            unique_together={('project', 'commitid')},
+        ),
+    ]
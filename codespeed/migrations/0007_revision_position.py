@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 21:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0006_commitlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='revision',
+            name='position',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='revision',
+            index_together={('branch', 'position')},
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 21:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0007_revision_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='dirty',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 21:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0008_report_dirty'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.IntegerField(default=0)),
+                ('modified', models.DateTimeField()),
+                ('environment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_versions', to='codespeed.Environment')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_versions', to='codespeed.Project')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dataversion',
+            unique_together={('environment', 'project')},
+        ),
+    ]
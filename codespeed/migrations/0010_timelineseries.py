@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 21:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0009_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.BinaryField()),
+                ('benchmark', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_series', to='codespeed.Benchmark')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_series', to='codespeed.Branch')),
+                ('environment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_series', to='codespeed.Environment')),
+                ('executable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_series', to='codespeed.Executable')),
+            ],
+            options={
+                'verbose_name_plural': 'timeline series',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineseries',
+            unique_together={('benchmark', 'executable', 'environment', 'branch')},
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 22:02
+from __future__ import unicode_literals
+
+import calendar
+
+from django.db import migrations
+
+
+def fill_positions(apps, schema_editor):
+    """Sets the positions that are known without commit logs
+
+    Those are the revision numbers of subversion projects, and the dates of
+    projects without logs, as timestamps in microseconds. The positions of git and mercurial revisions are
+    set by the update_revision_positions command. Dates saved as positions
+    in seconds before are converted.
+    """
+    Revision = apps.get_model('codespeed', 'Revision')
+    revisions = Revision.objects.exclude(
+        branch__project__repo_type__in=('G', 'M')).values_list(
+        'id', 'commitid', 'date', 'branch__project__repo_type')
+    for pk, commitid, date, repo_type in revisions.iterator():
+        if repo_type == 'S':
+            try:
+                position = int(commitid)
+            except ValueError:
+                continue
+        elif date is not None:
+            position = (calendar.timegm(date.timetuple()) * 10 ** 6 +
+                        date.microsecond)
+        else:
+            continue
+        Revision.objects.filter(pk=pk).update(position=position)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0010_timelineseries'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.1.15 on 2026-10-17 22:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codespeed', '0011_fill_revision_positions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commitlog',
+            name='parents',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -8,13 +8,69 @@ import json
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
+import numpy as np
 
+from . import changes
 from .commits.github import GITHUB_URL_RE
 
 logger = logging.getLogger(__name__)
 
+#: Trend depths that can be chosen in the changes view
+TREND_DEPTHS = [5, 10, 20, 50, 100]
+
+
+def get_thresholds():
+    """Returns the change and trend thresholds of significant changes"""
+    change_threshold = 3.0
+    trend_threshold = 5.0
+    if (hasattr(settings, 'CHANGE_THRESHOLD') and
+            settings.CHANGE_THRESHOLD is not None):
+        change_threshold = settings.CHANGE_THRESHOLD
+    if hasattr(settings, 'TREND_THRESHOLD') and settings.TREND_THRESHOLD:
+        trend_threshold = settings.TREND_THRESHOLD
+    return change_threshold, trend_threshold
+
+
+def get_default_trend():
+    """Returns the default depth of the trend"""
+    return getattr(settings, 'TREND', None) or 10
+
+
+def get_trend_depths():
+    """Returns the trend depths whose changes tables are cached"""
+    return sorted(set(TREND_DEPTHS + [get_default_trend()]))
+
+
+def revision_ordering(prefix='', by_position=True):
+    """Order_by arguments putting the latest revisions first
+
+    Revisions are ordered by position, revisions with an unknown position
+    last, and then by date, or only by date unless by_position. Revisions
+    without a date are the oldest, and ties are ordered by id. prefix is
+    the path to the revision, e.g. 'revision__' to order results.
+    """
+    ordering = (models.F(prefix + 'date').desc(nulls_last=True),
+                '-' + prefix + 'id')
+    if not by_position:
+        return ordering
+    return (models.F(prefix + 'position').desc(nulls_last=True),) + ordering
+
+
+def order_revisions(queryset, prefix=''):
+    """Orders revisions, or results by their revision, latest first
+
+    While some of them have no position yet, e.g. until their commit logs
+    are retrieved, all of them are ordered by date rather than putting
+    those before the older revisions.
+    """
+    unknown = queryset.filter(**{prefix + 'position__isnull': True})
+    return queryset.order_by(*revision_ordering(
+        prefix, by_position=not unknown.exists()))
+
 
 @python_2_unicode_compatible
 class Project(models.Model):
@@ -129,6 +185,11 @@ class Revision(models.Model):
     author = models.CharField(max_length=100, blank=True)
     branch = models.ForeignKey(
         Branch, on_delete=models.CASCADE, related_name="revisions")
+    # Ordinal of the revision in its branch: the number of first-parent
+    # commits for git, the revision number for mercurial and subversion,
+    # and the date as a timestamp in microseconds for other projects. Null
+    # until known.
+    position = models.BigIntegerField(null=True, blank=True)
 
     def get_short_commitid(self):
         return self.commitid[:10]
@@ -148,6 +209,61 @@ class Revision(models.Model):
 
     class Meta:
         unique_together = ("commitid", "branch")
+        index_together = ("branch", "position")
+
+    def _ordered_by_position(self, revisions):
+        """Whether this revision and the revisions of its branch all have a
+        position, see order_revisions"""
+        if self.position is None:
+            return False
+        return not revisions.filter(position__isnull=True).exists()
+
+    def _compare(self, fields, later):
+        """Q of the revisions ordered before this one by the given fields,
+        or after it if later, those without a value being the oldest"""
+        found = Q(pk__in=[])
+        ties = Q()
+        for name in fields:
+            value = getattr(self, name)
+            if value is None:
+                if later:
+                    found |= ties & Q(**{name + '__isnull': False})
+                ties &= Q(**{name + '__isnull': True})
+            elif later:
+                found |= ties & Q(**{name + '__gt': value})
+                ties &= Q(**{name: value})
+            else:
+                found |= ties & (Q(**{name + '__lt': value}) |
+                                 Q(**{name + '__isnull': True}))
+                ties &= Q(**{name: value})
+        return found
+
+    def _ordering(self, revisions):
+        """Fields and order_by arguments of the revisions of the branch"""
+        by_position = self._ordered_by_position(revisions)
+        fields = ('position', 'date', 'id') if by_position else ('date', 'id')
+        return fields, revision_ordering(by_position=by_position)
+
+    def get_previous(self, include_self=False):
+        """Returns the revisions of the branch before this one, latest first
+
+        Revisions are ordered by position, or by date while the position of
+        this one or of another one of the branch is unknown, and then by
+        date and id, so that revisions of the same position are ordered too.
+        """
+        revisions = Revision.objects.filter(branch_id=self.branch_id)
+        fields, ordering = self._ordering(revisions)
+        previous = self._compare(fields, later=False)
+        if include_self:
+            previous |= Q(pk=self.pk)
+        return revisions.filter(previous).order_by(*ordering)
+
+    def get_next(self):
+        """Returns the revisions of the branch after this one, oldest first"""
+        revisions = Revision.objects.filter(branch_id=self.branch_id)
+        fields, ordering = self._ordering(revisions)
+        return revisions.filter(
+            self._compare(fields, later=True)).order_by(*ordering).reverse()
 
     def clean(self):
         if not self.commitid or self.commitid == "None":
@@ -245,6 +361,101 @@ class Result(models.Model):
         unique_together = ("revision", "executable", "benchmark", "environment")
 
 
+@python_2_unicode_compatible
+class TimelineSeries(models.Model):
+    """The latest results of a benchmark, executable, environment and branch
+
+    The points are packed by codespeed.timelines, latest first, so that the
+    timeline view reads a series without sorting its results.
+    """
+    benchmark = models.ForeignKey(
+        Benchmark, on_delete=models.CASCADE, related_name="timeline_series")
+    executable = models.ForeignKey(
+        Executable, on_delete=models.CASCADE, related_name="timeline_series")
+    environment = models.ForeignKey(
+        Environment, on_delete=models.CASCADE,
+        related_name="timeline_series")
+    branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name="timeline_series")
+    points = models.BinaryField()
+
+    class Meta:
+        unique_together = ("benchmark", "executable", "environment", "branch")
+        verbose_name_plural = "timeline series"
+
+    def __str__(self):
+        return u"Timeline of %s, %s, %s, %s" % (
+            self.benchmark_id, self.executable_id, self.environment_id,
+            self.branch_id)
+
+
+@python_2_unicode_compatible
+class DataVersion(models.Model):
+    """A counter bumped whenever the results of a project in an environment
+    change
+
+    The JSON data views use it to answer conditional requests without
+    reading any result.
+    """
+    environment = models.ForeignKey(
+        Environment, on_delete=models.CASCADE, related_name="data_versions")
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, related_name="data_versions")
+    version = models.IntegerField(default=0)
+    modified = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("environment", "project")
+
+    def __str__(self):
+        return u"%s, %s: version %s" % (
+            self.environment_id, self.project_id, self.version)
+
+    @classmethod
+    def bump(cls, environment_id=None, project_id=None):
+        """Bumps the versions of an environment and project
+
+        Without environment or project, the versions of all of them are
+        bumped.
+        """
+        now = timezone.now()
+        versions = cls.objects.all()
+        if environment_id is not None:
+            versions = versions.filter(environment_id=environment_id)
+        if project_id is not None:
+            versions = versions.filter(project_id=project_id)
+        if versions.update(version=F('version') + 1, modified=now):
+            return
+        if environment_id is None or project_id is None:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(environment_id=environment_id,
+                                   project_id=project_id, version=1,
+                                   modified=now)
+        except IntegrityError:
+            # Created concurrently
+            versions.update(version=F('version') + 1, modified=now)
+
+    @classmethod
+    def get_stamp(cls, environment_ids=None, project_ids=None):
+        """Returns a (tag, last modified date) tuple that changes with the
+        versions of the given environments and projects
+
+        The date is None when none of them has a version yet.
+        """
+        versions = cls.objects.all()
+        if environment_ids is not None:
+            versions = versions.filter(environment__in=environment_ids)
+        if project_ids is not None:
+            versions = versions.filter(project__in=project_ids)
+        stamp = versions.aggregate(
+            count=Count('id'), version=Sum('version'),
+            modified=Max('modified'))
+        return ("%s-%s" % (stamp['count'], stamp['version'] or 0),
+                stamp['modified'])
+
+
 @python_2_unicode_compatible
 class Report(models.Model):
     revision = models.ForeignKey(
@@ -256,6 +467,9 @@ class Report(models.Model):
     summary = models.CharField(max_length=64, blank=True)
     colorcode = models.CharField(max_length=10, default="none")
     _tablecache = models.TextField(blank=True)
+    # Set when results the report is computed from changed since it was
+    # saved, see mark_dirty
+    dirty = models.BooleanField(default=False, db_index=True)
 
     def __str__(self):
         return u"Report for %s" % self.revision
@@ -264,12 +478,16 @@ class Report(models.Model):
         unique_together = ("revision", "executable", "environment")
 
     def save(self, *args, **kwargs):
+        self.recalculate()
+        super(Report, self).save(*args, **kwargs)
+
+    def recalculate(self):
+        """Recomputes the changes tables, summary and color code"""
         tablelist = self.get_changes_table(force_save=True)
         self.reinitialize()
         changes = self.aggregate_significant_changes(tablelist)
         self.update_to_highest_priority_change(changes)
-
-        super(Report, self).save(*args, **kwargs)
+        self.dirty = False
 
     def update_to_highest_priority_change(self, changes):
         average_change = changes['average_change']
@@ -303,15 +521,10 @@ class Report(models.Model):
         self.colorcode = "none"
 
     def aggregate_significant_changes(self, tablelist):
-        # Get default threshold values
-        change_threshold = 3.0
-        trend_threshold = 5.0
-        if (hasattr(settings, 'CHANGE_THRESHOLD') and
-                settings.CHANGE_THRESHOLD is not None):
-            change_threshold = settings.CHANGE_THRESHOLD
-        if hasattr(settings, 'TREND_THRESHOLD') and settings.TREND_THRESHOLD:
-            trend_threshold = settings.TREND_THRESHOLD
+        """Finds the most significant changes of a table
 
+        The significance colors are those computed by get_changes_table.
+        """
         max_change = HistoricalValue()
         max_trend = HistoricalValue()
         average_change = HistoricalValue()
@@ -320,38 +533,29 @@ class Report(models.Model):
         # Fetch big changes for each quantity and each benchmark
         for quantity in tablelist:
             quantity_name = quantity['units_title'].lower()
-            less_is_better = quantity['lessisbetter']
+            totals = quantity['totals']
 
-            val = quantity['totals']['change']
-            if val == "-":
+            if totals['change'] == "-":
                 continue
-            color = self.getcolorcode(val, less_is_better, change_threshold)
-            average_change.update_if_less_important_than(val, color,
-                                                         quantity_name)
+            average_change.update_if_less_important_than(
+                totals['change'], totals['change_color'], quantity_name)
 
-            val = quantity['totals']['trend']
-            if val != "-":
-                color = self.getcolorcode(val, less_is_better, trend_threshold)
-                average_trend.update_if_less_important_than(val, color,
-                                                            quantity_name)
+            if totals['trend'] != "-":
+                average_trend.update_if_less_important_than(
+                    totals['trend'], totals['trend_color'], quantity_name)
 
             for row in quantity['rows']:
                 benchmark_name = row['bench_name']
                 # Single change
-                val = row['change']
-                if val == "-":
+                if row['change'] == "-":
                     continue
-                color = self.getcolorcode(val, less_is_better,
-                                          change_threshold)
-                max_change.update_if_less_important_than(val, color,
-                                                         benchmark_name)
+                max_change.update_if_less_important_than(
+                    row['change'], row['change_color'], benchmark_name)
                 # Single trend
-                val = row['trend']
-                if val == "-":
+                if row['trend'] == "-":
                     continue
-                color = self.getcolorcode(val, less_is_better, trend_threshold)
-                max_trend.update_if_less_important_than(val, color,
-                                                        benchmark_name)
+                max_trend.update_if_less_important_than(
+                    row['trend'], row['trend_color'], benchmark_name)
         return {'max_change': max_change,
                 'max_trend': max_trend,
                 'average_change': average_change,
@@ -388,74 +592,121 @@ class Report(models.Model):
             return "none"
 
     def get_last_revisions(self, depth):
+        """Returns the revision of the report and the depth revisions
+        before it, latest first"""
         lastrevisions = []
         try:
-            lastrevisions = Revision.objects.filter(
-                branch=self.revision.branch
-            ).filter(
-                date__lte=self.revision.date
-            ).order_by('-date')[:depth + 1]
-            # Same as self.revision unless in a different branch
+            lastrevisions = [self.revision] + list(
+                self.revision.get_previous()[:depth])
         except Exception as e:
             logger.warning("Exception while getting results: %s", e,
                            exc_info=True)
         return lastrevisions
 
     def get_changes_table(self, trend_depth=10, force_save=False):
-        # Determine whether required trend value is the default one
-        default_trend = 10
-        if hasattr(settings, 'TREND') and settings.TREND:
-            default_trend = settings.TREND
-        # If the trend is the default and a forced save is not required
-        # just return the cached changes table
-        if not force_save and trend_depth == default_trend:
-            return self._get_tablecache()
-        # Otherwise generate a new changes table
+        """Returns the changes table of a trend depth
+
+        The tables of all the depths of get_trend_depths() are cached
+        together. force_save recomputes and caches them, otherwise cached
+        tables are served, and missing ones computed and cached.
+        """
+        if not force_save:
+            tablelist = self._get_tablecache(trend_depth)
+            if tablelist is not None:
+                return tablelist
+        depths = get_trend_depths()
+        if not force_save and trend_depth not in depths:
+            return self._compute_changes_tables([trend_depth])[trend_depth]
+
+        tables = self._compute_changes_tables(set(depths + [trend_depth]))
+        self._save_tablecache(dict(
+            (depth, tables[depth]) for depth in depths))
+        if not force_save and self.pk is not None:
+            # Only the cache needs saving, the summary did not change
+            Report.objects.filter(pk=self.pk).update(
+                _tablecache=self._tablecache)
+        return tables[trend_depth]
+
+    def _compute_changes_tables(self, depths):
+        """Computes the changes tables of several trend depths at once"""
         # Get latest revisions for this branch (which also sets the project)
-        lastrevisions = self.get_last_revisions(trend_depth)
+        lastrevisions = list(self.get_last_revisions(max(depths)))
         if not lastrevisions:
-            return []
-
-        change_list = []
-        pastrevisions = []
-        if len(lastrevisions) > 1:
-            changerevision = lastrevisions[1]
-            change_list = Result.objects.filter(
-                revision=changerevision
-            ).filter(
-                environment=self.environment
-            ).filter(
-                executable=self.executable
-            )
-            pastrevisions = lastrevisions[trend_depth - 2:trend_depth + 1]
-
-        result_list = Result.objects.filter(
-            revision=lastrevisions[0]
-        ).filter(
-            environment=self.environment
-        ).filter(
-            executable=self.executable
-        )
-
-        tablelist = []
+            return dict((depth, []) for depth in depths)
+
+        # The changes are computed from a matrix of results: the current
+        # revision, the previous one and then the revisions of the trend
+        columns = {}
+        for depth in depths:
+            revisions = lastrevisions[:depth + 1]
+            pastrevisions = []
+            if len(revisions) > 1:
+                pastrevisions = revisions[depth - 2:depth + 1]
+            columns[depth] = revisions[:2] + pastrevisions
+
+        # Fetch the results of all revisions involved at once, by revision
+        # and benchmark
+        results = {}
+        for res in Result.objects.filter(
+                revision__in=set(rev for depth_columns in columns.values()
+                                 for rev in depth_columns),
+                environment=self.environment,
+                executable=self.executable):
+            results[(res.revision_id, res.benchmark_id)] = res
+
+        benchmarks = {}
+        for bench in Benchmark.objects.all():
+            benchmarks.setdefault(bench.units_title, []).append(bench)
+
+        # Benchmarks with a result for this revision, by units title
+        groups = []
+        rows = []
         for units_title in Benchmark.objects.all().values_list(
                 'units_title', flat=True).distinct():
+            group_benchmarks = benchmarks.get(units_title)
+            if not group_benchmarks:
+                continue
+            for bench in group_benchmarks:
+                resobj = results.get((lastrevisions[0].id, bench.id))
+                if resobj is not None:
+                    rows.append((len(groups), bench, resobj))
+            groups.append((units_title, group_benchmarks))
+
+        return dict((depth, self._build_changes_table(
+            columns[depth], results, groups, rows)) for depth in depths)
+
+    def _build_changes_table(self, columns, results, groups, rows):
+        values = np.full((len(rows), len(columns)), np.nan)
+        for i, (group, bench, resobj) in enumerate(rows):
+            for j, rev in enumerate(columns):
+                res = results.get((rev.id, bench.id))
+                if res is not None:
+                    values[i, j] = res.value
+        change_threshold, trend_threshold = get_thresholds()
+        computed = changes.compute_changes(
+            values, slice(2, len(columns)),
+            [group for group, bench, resobj in rows],
+            [group_benchmarks[-1].lessisbetter
+             for units_title, group_benchmarks in groups],
+            change_threshold, trend_threshold)
+
+        def value_or_dash(value):
+            return "-" if np.isnan(value) else float(value)
+
+        tablelist = []
+        for group, (units_title, group_benchmarks) in enumerate(groups):
+            # The units of a group are those of its last benchmark
+            units = group_benchmarks[-1].units
+            lessisbetter = group_benchmarks[-1].lessisbetter
             currentlist = []
-            units = ""
             hasmin = False
             hasmax = False
             has_stddev = False
             smallest = 1000
-            totals = {'change': [], 'trend': []}
-            for bench in Benchmark.objects.filter(units_title=units_title):
-                units = bench.units
-                lessisbetter = bench.lessisbetter
-                resultquery = result_list.filter(benchmark=bench)
-                if not len(resultquery):
+            for i, (row_group, bench, resobj) in enumerate(rows):
+                if row_group != group:
                     continue
 
-                resobj = resultquery.filter(benchmark=bench)[0]
-
                 std_dev = resobj.std_dev
                 if std_dev is not None:
                     has_stddev = True
@@ -474,53 +725,9 @@ class Report(models.Model):
                 else:
                     val_max = "-"
 
-                # Calculate percentage change relative to previous result
-                result = resobj.value
-                change = "-"
-                if len(change_list):
-                    c = change_list.filter(benchmark=bench)
-                    if c.count() and result is not None:
-                        if c[0].value != 0:
-                            change = (result - c[0].value) * 100 / c[0].value
-                            totals['change'].append(result / c[0].value)
-                        elif c[0].value == 0:
-                            if result == 0:
-                                # 0/0 = 1, in our world
-                                change = 0
-                                totals['change'].append(1)
-                            else:
-                                # n/0 = ∞
-                                change = float("inf")
-                                totals['change'].append(float("inf"))
-                        else:
-                            # no previous result, no change available
-                            pass
-
-                # Calculate trend:
-                # percentage change relative to average of 3 previous results
-                # Calculate past average
-                result_sum = 0
-                num_past_results = 0
-                if len(pastrevisions):
-                    for rev in pastrevisions:
-                        past_result = Result.objects.filter(
-                            revision=rev
-                        ).filter(
-                            environment=self.environment
-                        ).filter(
-                            executable=self.executable
-                        ).filter(benchmark=bench)
-                        if past_result.count():
-                            result_sum += past_result[0].value
-                            num_past_results += 1
-                trend = "-"
-                if result_sum:
-                    average = result_sum / num_past_results
-                    trend = (result - average) * 100 / average
-                    totals['trend'].append(result / average)
-
                 # Retain lowest number different than 0
                 # to be used later for calculating significant digits
+                result = resobj.value
                 if result < smallest and result:
                     smallest = result
 
@@ -531,27 +738,22 @@ class Report(models.Model):
                     'std_dev': std_dev,
                     'val_min': val_min,
                     'val_max': val_max,
-                    'change': change,
-                    'trend': trend
+                    'change': value_or_dash(computed['change'][i]),
+                    'change_color': str(computed['change_color'][i]),
+                    'trend': value_or_dash(computed['trend'][i]),
+                    'trend_color': str(computed['trend_color'][i]),
                 })
 
-            # Compute Arithmetic averages
-            for key in totals.keys():
-                if len(totals[key]):
-                    totals[key] = float(sum(totals[key]) / len(totals[key]))
-                else:
-                    totals[key] = "-"
-
-            if totals['change'] != "-":
-                # Transform ratio to percentage
-                totals['change'] = (totals['change'] - 1) * 100
-            if totals['trend'] != "-":
-                # Transform ratio to percentage
-                totals['trend'] = (totals['trend'] - 1) * 100
+            totals = {
+                'change': value_or_dash(computed['total_change'][group]),
+                'change_color': str(computed['total_change_color'][group]),
+                'trend': value_or_dash(computed['total_trend'][group]),
+                'trend_color': str(computed['total_trend_color'][group]),
+            }
 
             # Calculate significant digits
             digits = 2
-            while smallest < 1:
+            while 0 < smallest < 1:
                 smallest *= 10
                 digits += 1
 
@@ -566,8 +768,6 @@ class Report(models.Model):
                 'totals': totals,
                 'rows': currentlist
             })
-        if force_save:
-            self._save_tablecache(tablelist)
         return tablelist
 
     def get_absolute_url(self):
@@ -580,10 +780,122 @@ class Report(models.Model):
         else:
             return self.summary
 
-    def _save_tablecache(self, data):
-        self._tablecache = json.dumps(data)
-
-    def _get_tablecache(self):
+    @classmethod
+    def mark_dirty(cls, revision, executable=None, environment=None):
+        """Marks the reports computed from the results of a revision dirty
+
+        Those are the reports of the revision and of the revisions following
+        it, up to the largest cached trend depth, optionally only those of an
+        executable and environment. Their cached tables are cleared, and the
+        recompute_reports command recalculates them. Returns the number of
+        reports marked.
+        """
+        following = []
+        if revision.position is not None or revision.date is not None:
+            following = list(revision.get_next().values_list(
+                'id', flat=True)[:max(get_trend_depths())])
+        reports = cls.objects.filter(
+            revision_id__in=[revision.id] + following)
+        if executable is not None:
+            reports = reports.filter(executable=executable)
+        if environment is not None:
+            reports = reports.filter(environment=environment)
+        return reports.update(_tablecache='', dirty=True)
+
+    def _save_tablecache(self, tables):
+        self._tablecache = json.dumps(tables)
+
+    def _get_tablecache(self, trend_depth):
+        """Returns the cached table of a trend depth, None if not cached"""
         if self._tablecache == '':
-            return {}
-        return json.loads(self._tablecache)
+            return None
+        tables = json.loads(self._tablecache)
+        if isinstance(tables, list):
+            # Older caches only hold the table of the default trend
+            if trend_depth == get_default_trend():
+                return tables
+            return None
+        return tables.get(str(trend_depth))
+
+
+@python_2_unicode_compatible
+class ResultBatch(models.Model):
+    """Results posted to the API and waiting to be saved
+
+    Only used when settings.QUEUE_RESULTS is True. Batches are drained by
+    the drain_results management command.
+    """
+    PENDING = 'P'
+    RUNNING = 'R'
+    FAILED = 'F'
+    STATUS_TYPES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    payload = models.TextField()
+    num_results = models.IntegerField()
+    status = models.CharField(max_length=1, choices=STATUS_TYPES,
+                              default=PENDING, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+    claimed = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = "result batches"
+
+    def __str__(self):
+        return u"%s results posted on %s" % (self.num_results, self.created)
+
+    def get_results(self):
+        return json.loads(self.payload)
+
+
+@python_2_unicode_compatible
+class PendingCommitLog(models.Model):
+    """A revision whose commit log information still has to be retrieved
+
+    Only used when settings.QUEUE_COMMIT_LOGS is True. Pending logs are
+    retrieved by the fetch_commit_logs management command.
+    """
+    revision = models.OneToOneField(
+        Revision, on_delete=models.CASCADE, related_name="pending_log")
+    created = models.DateTimeField(auto_now_add=True)
+    claimed = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return u"Commit log for %s" % self.revision
+
+
+@python_2_unicode_compatible
+class CommitLog(models.Model):
+    """The commit log information of a commit of a project's repository
+
+    Commits never change, so the logs retrieved from the repository are
+    stored and commits.get_logs serves known ranges from here.
+    """
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, related_name="commit_logs")
+    commitid = models.CharField(max_length=42)
+    short_commit_id = models.CharField(max_length=50, blank=True)
+    # Space separated commit ids of the parent commits
+    parents = models.TextField(blank=True)
+    author = models.CharField(max_length=100, blank=True)
+    author_email = models.CharField(max_length=100, blank=True)
+    date = models.DateTimeField(null=True)
+    message = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    tag = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        unique_together = ("project", "commitid")
+
+    def __str__(self):
+        return u"%s: %s" % (self.project, self.commitid)
+
+    def get_parents(self):
+        return self.parents.split()
@@ -1,26 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import json
 import logging
+from collections import OrderedDict
 from datetime import datetime
 
 from django.core.exceptions import ValidationError
+from django.db import transaction
 
 from .models import (Environment, Project, Branch, Benchmark, Executable,
-                     Revision, Result, Report)
-from . import commits
+                     Revision, Result, Report, DataVersion, order_revisions)
+from .dimensions import get_dimension, get_dimensions, chunked
+from . import commits, enrichment, timelines
 
 logger = logging.getLogger(__name__)
 
 
-def validate_result(item):
-    """
-    Validates that a result dictionary has all needed parameters
-
-    It returns a tuple
-        Environment, False  when no errors where found
-        Errormessage, True  when there is an error
-    """
+def _check_mandatory_keys(item):
+    """Returns an error message when a mandatory key is missing or empty"""
     mandatory_data = [
         'commitid',
         'branch',
@@ -31,35 +29,42 @@ def validate_result(item):
         'result_value',
     ]
 
-    error = True
     for key in mandatory_data:
         if key not in item:
-            return 'Key "' + key + '" missing from request', error
+            return 'Key "' + key + '" missing from request'
         elif key in item and item[key] == "":
-            return 'Value for key "' + key + '" empty in request', error
+            return 'Value for key "' + key + '" empty in request'
+    return None
+
+
+def validate_result(item):
+    """
+    Validates that a result dictionary has all needed parameters
+
+    It returns a tuple
+        Environment, False  when no errors where found
+        Errormessage, True  when there is an error
+    """
+    error = _check_mandatory_keys(item)
+    if error is not None:
+        return error, True
 
     # Check that the Environment exists
-    try:
-        e = Environment.objects.get(name=item['environment'])
-        error = False
-        return e, error
-    except Environment.DoesNotExist:
-        return "Environment %(environment)s not found" % item, error
+    e = get_dimension(Environment, item['environment'])
+    if e is None:
+        return "Environment %(environment)s not found" % item, True
+    return e, False
 
 
 def save_result(data, update_repo=True):
-    res, error = validate_result(data)
+    res, error = save_results([data], update_repo=update_repo)
     if error:
         return res, True
-    else:
-        assert(isinstance(res, Environment))
-        env = res
+    return res[0], False
 
-    p, created = Project.objects.get_or_create(name=data["project"])
-    branch, created = Branch.objects.get_or_create(name=data["branch"],
-                                                   project=p)
-    b, created = Benchmark.objects.get_or_create(name=data["benchmark"])
 
+def _create_benchmark(data):
+    b, created = Benchmark.objects.get_or_create(name=data["benchmark"])
     if created:
         if "description" in data:
             b.description = data["description"]
@@ -71,65 +76,194 @@ def save_result(data, update_repo=True):
             b.lessisbetter = data["lessisbetter"]
         b.full_clean()
         b.save()
+    return b
 
-    try:
-        rev = branch.revisions.get(commitid=data['commitid'])
-    except Revision.DoesNotExist:
-        rev_date = data.get("revision_date")
-        # "None" (as string) can happen when we urlencode the POST data
-        if not rev_date or rev_date in ["", "None"]:
-            rev_date = datetime.today()
-        rev = Revision(branch=branch, project=p, commitid=data['commitid'],
-                       date=rev_date)
-        try:
-            rev.full_clean()
-        except ValidationError as e:
-            return str(e), True
-        if p.repo_type not in ("N", ""):
-            try:
-                commit_logs = commits.get_logs(rev, rev, update=update_repo)
-            except commits.exceptions.CommitLogError as e:
-                logger.warning("unable to save revision %s info: %s", rev, e,
-                               exc_info=True)
-            else:
-                if commit_logs:
-                    log = commit_logs[0]
-                    rev.author = log['author']
-                    rev.date = log['date']
-                    rev.message = log['message']
-                    rev.tag = log['tag']
 
-        rev.save()
+def save_results(items, update_repo=True):
+    """
+    Saves a list of result dictionaries in a single transaction
 
-    exe, created = Executable.objects.get_or_create(
-        name=data['executable'],
-        project=p
-    )
+    All projects, branches, benchmarks, executables, environments and
+    revisions referenced by the items are looked up with a few set based
+    queries, and new results are inserted with bulk_create. Items are
+    validated in order and the first error aborts the whole batch.
 
-    try:
-        r = Result.objects.get(
-            revision=rev, executable=exe, benchmark=b, environment=env)
-    except Result.DoesNotExist:
-        r = Result(revision=rev, executable=exe, benchmark=b, environment=env)
-
-    r.value = data["result_value"]
-    if 'result_date' in data:
-        r.date = data["result_date"]
-    elif rev.date:
-        r.date = rev.date
-    else:
-        r.date = datetime.now()
+    It returns a tuple
+        list of unique (Revision, Executable, Environment), False  on success
+        Errormessage, True                                         on error
+    """
+    valid = [item for item in items if _check_mandatory_keys(item) is None]
+
+    environments = get_dimensions(
+        Environment, set(item['environment'] for item in valid))
+    projects = get_dimensions(
+        Project, set(item['project'] for item in valid))
+    branches = get_dimensions(Branch, set(
+        (projects[item['project']].id, item['branch'])
+        for item in valid if item['project'] in projects))
+    benchmarks = get_dimensions(
+        Benchmark, set(item['benchmark'] for item in valid))
+    executables = get_dimensions(Executable, set(
+        (projects[item['project']].id, item['executable'])
+        for item in valid if item['project'] in projects))
+    revisions = dict(
+        ((r.branch_id, r.commitid), r) for commitids in chunked(
+            set(item['commitid'] for item in valid))
+        for r in Revision.objects.filter(
+            branch__in=list(branches.values()), commitid__in=commitids
+        ).select_related('branch__project'))
+
+    with transaction.atomic():
+        new_revisions = OrderedDict()
+        pending = OrderedDict()
+        for data in items:
+            error = _check_mandatory_keys(data)
+            if error is not None:
+                transaction.set_rollback(True)
+                return error, True
+            env = environments.get(data['environment'])
+            if env is None:
+                transaction.set_rollback(True)
+                return "Environment %(environment)s not found" % data, True
+
+            p = projects.get(data['project'])
+            if p is None:
+                p, created = Project.objects.get_or_create(name=data["project"])
+                projects[p.name] = p
+            branch = branches.get((p.id, data['branch']))
+            if branch is None:
+                branch, created = Branch.objects.get_or_create(
+                    name=data["branch"], project=p)
+                branches[(p.id, branch.name)] = branch
+            b = benchmarks.get(data['benchmark'])
+            if b is None:
+                b = _create_benchmark(data)
+                benchmarks[b.name] = b
+
+            rev_key = (branch.id, data['commitid'])
+            if rev_key not in revisions and rev_key not in new_revisions:
+                rev_date = data.get("revision_date")
+                # "None" (as string) can happen when we urlencode the POST data
+                if not rev_date or rev_date in ["", "None"]:
+                    rev_date = datetime.today()
+                rev = Revision(branch=branch, project=p,
+                               commitid=data['commitid'], date=rev_date)
+                try:
+                    rev.full_clean(exclude=['branch', 'project'],
+                                   validate_unique=False)
+                except ValidationError as e:
+                    transaction.set_rollback(True)
+                    return str(e), True
+                new_revisions[rev_key] = rev
+
+            exe = executables.get((p.id, data['executable']))
+            if exe is None:
+                exe, created = Executable.objects.get_or_create(
+                    name=data['executable'], project=p)
+                executables[(p.id, exe.name)] = exe
+
+            r = Result(executable=exe, benchmark=b, environment=env)
+            r.value = data["result_value"]
+            if 'result_date' in data:
+                r.date = data["result_date"]
+            r.std_dev = data.get('std_dev')
+            r.val_min = data.get('min')
+            r.val_max = data.get('max')
+            r.q1 = data.get('q1')
+            r.q3 = data.get('q3')
+            r.full_clean(
+                exclude=['revision', 'executable', 'benchmark', 'environment'],
+                validate_unique=False)
+            # A result posted twice within the same batch overwrites the
+            # earlier one, as it would when posted in separate requests
+            pending[rev_key + (exe.id, b.id, env.id)] = (rev_key, r)
+
+        if new_revisions:
+            _save_new_revisions(new_revisions.values(), update_repo)
+            for commitids in chunked(
+                    set(key[1] for key in new_revisions)):
+                for r in Revision.objects.filter(
+                        branch__in=set(rev.branch for rev in
+                                       new_revisions.values()),
+                        commitid__in=commitids
+                ).select_related('branch__project'):
+                    revisions[(r.branch_id, r.commitid)] = r
+            if enrichment.queue_enabled():
+                enrichment.queue_commit_logs(
+                    [revisions[key] for key in new_revisions])
 
-    r.std_dev = data.get('std_dev')
-    r.val_min = data.get('min')
-    r.val_max = data.get('max')
-    r.q1 = data.get('q1')
-    r.q3 = data.get('q3')
+        # Ids of the already stored results, keyed like pending
+        existing = {}
+        rev_ids = set(revisions[key[:2]].id for key in pending)
+        exe_ids = set(key[2] for key in pending)
+        env_ids = set(key[4] for key in pending)
+        for ids in chunked(rev_ids):
+            for values in Result.objects.filter(
+                revision__in=ids, executable__in=exe_ids,
+                environment__in=env_ids
+            ).values_list('id', 'revision', 'executable', 'benchmark',
+                          'environment'):
+                existing[values[1:]] = values[0]
 
-    r.full_clean()
-    r.save()
+        new_results = []
+        saved = OrderedDict()
+        saved_results = []
+        for rev_key, r in pending.values():
+            rev = revisions[rev_key]
+            r.revision = rev
+            if r.date is None:
+                r.date = rev.date or datetime.now()
+            key = (rev.id, r.executable_id, r.benchmark_id, r.environment_id)
+            if key in existing:
+                # Django < 2.2 has no bulk_update, but re-posted results
+                # are rare compared to new ones
+                r.pk = existing[key]
+                r.save()
+            else:
+                new_results.append(r)
+            saved[(rev.id, r.executable_id, r.environment_id)] = (
+                rev, r.executable, r.environment)
+            saved_results.append(r)
+        Result.objects.bulk_create(new_results)
+        for env_id, project_id in set(
+                (r.environment_id, r.executable.project_id)
+                for r in new_results):
+            DataVersion.bump(env_id, project_id)
+        if timelines.store_enabled():
+            timelines.update_series(saved_results)
+        else:
+            timelines.drop_results_series(saved_results)
+
+    return list(saved.values()), False
+
+
+def _save_new_revisions(new_revisions, update_repo):
+    """Fills in commit log information and inserts the new revisions
 
-    return (rev, exe, env), False
+    The commit logs of all new revisions of a project are retrieved at
+    once. When commit logs are queued, the revisions are inserted as they
+    are and the logs retrieved later by the fetch_commit_logs command.
+    """
+    if not enrichment.queue_enabled():
+        by_project = OrderedDict()
+        for rev in new_revisions:
+            if enrichment.needs_log(rev):
+                by_project.setdefault(rev.branch.project, []).append(rev)
+        for p, revisions in by_project.items():
+            try:
+                commit_logs = commits.get_commits(
+                    p, [rev.commitid for rev in revisions], update=update_repo)
+            except commits.exceptions.CommitLogError as e:
+                logger.warning("unable to save revisions info for %s: %s",
+                               p, e, exc_info=True)
+                continue
+            for rev in revisions:
+                if rev.commitid in commit_logs:
+                    enrichment.apply_log(rev, commit_logs[rev.commitid])
+    for rev in new_revisions:
+        if rev.position is None:
+            rev.position = enrichment.default_position(rev)
+    Revision.objects.bulk_create(new_revisions)
 
 
 def create_report_if_enough_data(rev, exe, e):
@@ -137,9 +271,16 @@ def create_report_if_enough_data(rev, exe, e):
     if exe.project.track is not True:
         return False
 
-    last_revs = Revision.objects.filter(
-        branch=rev.branch
-    ).order_by('-date')[:2]
+    last_revs = list(order_revisions(Revision.objects.filter(
+        branch=rev.branch))[:2])
+    if last_revs and last_revs[0].pk != rev.pk:
+        # This and the following reports were computed without these results
+        Report.mark_dirty(rev, exe, e)
+    else:
+        # No revision follows this one, only its own report can be outdated
+        Report.objects.filter(
+            revision=rev, executable=exe, environment=e
+        ).update(_tablecache='', dirty=True)
     if len(last_revs) > 1:
         current_results = rev.results.filter(executable=exe, environment=e)
         last_results = last_revs[1].results.filter(
@@ -155,3 +296,73 @@ def create_report_if_enough_data(rev, exe, e):
             report.save()
             logger.debug("Created new report for branch %s and revision %s",
                          rev.branch, rev.commitid)
+
+
+def iter_result_chunks(lines, chunk_size):
+    """
+    Parses an iterable of newline delimited JSON results in chunks
+
+    It yields a tuple (chunk, errors) for every chunk_size valid lines,
+    where chunk is a list of (line number, result dictionary) and errors is
+    a list of {'line': line number, 'error': message} for the lines that
+    could not be parsed or validated. Only one chunk is held in memory.
+    """
+    chunk = []
+    errors = []
+    for lineno, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            errors.append({'line': lineno, 'error': "Invalid JSON: %s" % e})
+            continue
+        if not isinstance(item, dict):
+            errors.append({'line': lineno,
+                           'error': "Result must be a JSON object"})
+            continue
+        res, error = validate_result(item)
+        if error:
+            errors.append({'line': lineno, 'error': res})
+            continue
+        chunk.append((lineno, item))
+        if len(chunk) >= chunk_size:
+            yield chunk, errors
+            chunk = []
+            errors = []
+    if chunk or errors:
+        yield chunk, errors
+
+
+def save_result_chunk(chunk, update_repo=False):
+    """
+    Saves a chunk of (line number, result dictionary) tuples
+
+    The chunk is saved with save_results, and only if that fails every
+    result is saved on its own to find out which lines are wrong. It returns
+    a tuple with the list of unique (Revision, Executable, Environment) and
+    the list of per-line errors.
+    """
+    try:
+        response, error = save_results([item for lineno, item in chunk],
+                                       update_repo=update_repo)
+    except ValidationError as e:
+        response, error = str(e), True
+    if not error:
+        return response, []
+
+    saved = []
+    errors = []
+    for lineno, item in chunk:
+        try:
+            response, error = save_result(item, update_repo=False)
+        except ValidationError as e:
+            response, error = str(e), True
+        if error:
+            errors.append({'line': lineno, 'error': response})
+        else:
+            saved.append(response)
+    return saved, errors
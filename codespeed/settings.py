@@ -51,6 +51,14 @@ TIMELINE_GRID_PAGING = 4   # Number of benchmarks to be send in one grid request
                            # and the database is not fast, it can take a long time
                            # to send all results.
 
+USE_TIMELINE_STORE = True  # Keep the latest results of every timeline series
+                           # packed in the database, updated when saving
+                           # results, instead of sorting the results of every
+                           # series when showing the timeline
+
+TIMELINE_STORE_SIZE = 1000  # Number of results kept per series. Timelines of
+                            # more revisions are read from the results
+
 #TIMELINE_BRANCHES = True # NOTE: Only the default branch is currently shown
                          # Get timeline results for specific branches
                          # Set to False if you want timeline plots and results only for trunk.
@@ -76,6 +84,60 @@ COMP_EXECUTABLES = None  # Which executable + revision should be checked as defa
 
 USE_MEDIAN_BANDS = True # True to enable median bands on Timeline view
 
+## Result saving options ##
+USE_DIMENSION_CACHE = True  # Cache environments, projects, branches, benchmarks
+                            # and executables in memory when saving results
+
+DIMENSION_CACHE_SIZE = 1000  # Maximum number of cached dimension entries
+
+DIMENSION_CACHE_TIMEOUT = 300  # Seconds a cached entry is used. Bounds how long
+                               # other server processes may use an entry after
+                               # it was changed in the admin
+
+NDJSON_CHUNK_SIZE = 500  # Number of results saved at a time by the
+                         # result/add/ndjson/ API
+
+QUEUE_RESULTS = False  # True to only validate and queue posted results. They
+                       # are then saved by running "manage.py drain_results"
+
+QUEUE_COMMIT_LOGS = False  # True to save new revisions without waiting for
+                           # their commit log. Logs are then retrieved by
+                           # running "manage.py fetch_commit_logs"
+
+COMMIT_LOG_ATTEMPTS = 5  # Number of times a queued commit log is retrieved
+                         # before giving up
+
+QUEUE_CLAIM_TIMEOUT = 600  # Seconds after which a queued batch claimed by a
+                           # worker that has not finished is claimed again
+
+## Repository options ##
+BACKGROUND_REPO_FETCH = False  # True to never pull repositories while saving
+                               # results or showing logs. They are then
+                               # updated by running "manage.py fetch_repos"
+
+REPO_FETCH_INTERVAL = 300  # Seconds between two fetches of a repository
+
+REPO_FETCH_MAX_BACKOFF = 3600  # Maximum seconds to wait before retrying a
+                               # repository that failed to fetch
+
+GITHUB_API_URL = 'https://api.github.com'  # Base URL of the Github API used
+                                           # by Github projects
+
+GITHUB_TAGS_REFRESH_INTERVAL = 300  # Seconds between two reads of the tag
+                                    # list of a Github repository
+
+SVN_TAGS_REFRESH_INTERVAL = 300  # Seconds between two listings of the tags
+                                 # of a Subversion repository
+
+HG_USE_CMDSERVER = False  # True to run the hg commands of mercurial projects
+                          # in a long-lived "hg serve --cmdserver" process
+
+GIT_CAT_FILE_PROCESSES = 2  # Maximum number of long-lived "git cat-file"
+                            # processes reading commits of a repository
+
+GIT_CAT_FILE_IDLE_TIMEOUT = 300  # Seconds after which an unused "git
+                                 # cat-file" process is stopped
+
 
 ALLOW_ANONYMOUS_POST = True  # Whether anonymous users can post results
 REQUIRE_SECURE_AUTH = True  # Whether auth needs to be over a secure channel
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Signal handlers keeping the codespeed caches consistent"""
+from __future__ import absolute_import
+
+from django.db.models.signals import post_save, post_delete
+
+from . import timelines
+from .dimensions import DIMENSION_MODELS, dimension_cache
+from .models import DataVersion, Result, Revision
+
+
+def invalidate_dimension_cache(sender, **kwargs):
+    # Dimensions change rarely, so dropping all entries is cheaper than
+    # tracking which cached branches or executables hold a stale project
+    dimension_cache.clear()
+
+
+def bump_all_data_versions(sender, **kwargs):
+    # Names and units are part of the JSON data of every project
+    DataVersion.bump()
+
+
+def bump_revision_data_version(sender, instance, **kwargs):
+    DataVersion.bump(project_id=instance.project_id)
+
+
+def bump_result_data_version(sender, instance, **kwargs):
+    if kwargs.get('signal') is post_delete:
+        # The executable may be deleted along with its results
+        DataVersion.bump(environment_id=instance.environment_id)
+    else:
+        DataVersion.bump(instance.environment_id,
+                         instance.executable.project_id)
+
+
+def drop_timeline_series(sender, instance, **kwargs):
+    # Results saved by save_results update their series afterwards. Series
+    # are dropped while the store is disabled too, or they would be stale
+    # once it is enabled again
+    timelines.drop_series(instance.benchmark_id, instance.executable_id,
+                          instance.environment_id)
+
+
+def connect_signals():
+    for model in DIMENSION_MODELS:
+        post_save.connect(invalidate_dimension_cache, sender=model,
+                          dispatch_uid='codespeed_dimensions_save_%s' %
+                          model.__name__)
+        post_delete.connect(invalidate_dimension_cache, sender=model,
+                            dispatch_uid='codespeed_dimensions_delete_%s' %
+                            model.__name__)
+        post_save.connect(bump_all_data_versions, sender=model,
+                          dispatch_uid='codespeed_versions_save_%s' %
+                          model.__name__)
+        post_delete.connect(bump_all_data_versions, sender=model,
+                            dispatch_uid='codespeed_versions_delete_%s' %
+                            model.__name__)
+    # Results saved in bulk bump their versions in save_results
+    for model, handler in ((Revision, bump_revision_data_version),
+                           (Result, bump_result_data_version)):
+        post_save.connect(handler, sender=model,
+                          dispatch_uid='codespeed_versions_save_%s' %
+                          model.__name__)
+        post_delete.connect(handler, sender=model,
+                            dispatch_uid='codespeed_versions_delete_%s' %
+                            model.__name__)
+    post_save.connect(drop_timeline_series, sender=Result,
+                      dispatch_uid='codespeed_timelines_save')
+    post_delete.connect(drop_timeline_series, sender=Result,
+                        dispatch_uid='codespeed_timelines_delete')
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Queue of posted results that are saved by a background worker
+
+When settings.QUEUE_RESULTS is True the results API only validates the
+posted data and stores it as a ResultBatch. The drain_results management
+command then saves the queued batches with save_results and creates the
+reports, so that benchmark runners do not wait for it.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q, Sum
+
+from .models import ResultBatch
+from .results import (validate_result, save_results,
+                      create_report_if_enough_data)
+
+logger = logging.getLogger(__name__)
+
+
+def queue_enabled():
+    return getattr(settings, 'QUEUE_RESULTS', False)
+
+
+def queue_results(items):
+    """
+    Validates and queues a list of result dictionaries
+
+    It returns a tuple
+        ResultBatch, False  when no errors where found
+        Errormessage, True  when there is an error
+    """
+    for item in items:
+        res, error = validate_result(item)
+        if error:
+            return res, True
+    batch = ResultBatch.objects.create(
+        payload=json.dumps(items), num_results=len(items))
+    return batch, False
+
+
+def claim_batches(limit):
+    """Marks up to limit pending batches as running and returns them
+
+    A batch that has been running for longer than
+    settings.QUEUE_CLAIM_TIMEOUT seconds is considered abandoned by a
+    crashed worker and can be claimed again.
+    """
+    timeout = getattr(settings, 'QUEUE_CLAIM_TIMEOUT', 600)
+    now = datetime.now()
+    claimable = ResultBatch.objects.filter(
+        Q(status=ResultBatch.PENDING) |
+        Q(status=ResultBatch.RUNNING,
+          claimed__lt=now - timedelta(seconds=timeout)))
+    claimed = []
+    for batch in claimable.order_by('id')[:limit]:
+        # Another worker may claim the same batch concurrently, only the
+        # one whose update succeeds keeps it
+        if ResultBatch.objects.filter(
+                pk=batch.pk, status=batch.status, claimed=batch.claimed
+        ).update(status=ResultBatch.RUNNING, claimed=now):
+            batch.status = ResultBatch.RUNNING
+            batch.claimed = now
+            claimed.append(batch)
+    return claimed
+
+
+def save_batch(batch):
+    """Saves the results of a claimed batch and creates its reports
+
+    Successfully saved batches are deleted. Failed ones are kept with
+    their error message for inspection in the admin.
+    """
+    batch.attempts += 1
+    try:
+        response, error = save_results(batch.get_results())
+    except Exception as e:
+        logger.exception("Could not save result batch %s", batch.pk)
+        response, error = str(e), True
+
+    if error:
+        logger.error("Could not save result batch %s: %s", batch.pk, response)
+        batch.status = ResultBatch.FAILED
+        batch.error = response
+        batch.save()
+        return False
+
+    for rep in response:
+        create_report_if_enough_data(rep[0], rep[1], rep[2])
+    batch.delete()
+    return True
+
+
+def drain(limit):
+    """Saves up to limit queued batches
+
+    Returns a dict with the number of batches and results saved and failed,
+    and the time it took.
+    """
+    stats = {'batches': 0, 'results': 0, 'failed': 0, 'seconds': 0.0}
+    start = time.time()
+    for batch in claim_batches(limit):
+        if save_batch(batch):
+            stats['batches'] += 1
+            stats['results'] += batch.num_results
+        else:
+            stats['failed'] += 1
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def get_backlog():
+    """Returns the number of queued batches and results, and the age of
+    the oldest queued batch in seconds"""
+    pending = ResultBatch.objects.exclude(status=ResultBatch.FAILED)
+    num_results = pending.aggregate(n=Sum('num_results'))['n']
+    oldest = pending.order_by('created').values_list(
+        'created', flat=True).first()
+    return {
+        'batches': pending.count(),
+        'results': num_results or 0,
+        'failed': ResultBatch.objects.filter(
+            status=ResultBatch.FAILED).count(),
+        'oldest': (datetime.now() - oldest).total_seconds() if oldest else 0,
+    }
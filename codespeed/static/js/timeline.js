@@ -62,6 +62,56 @@ function getConfiguration() {
   return config;
 }
 
+// Configuration of the data requests: long series are downsampled by the
+// server to about one point per pixel of the plot, and sent as columns
+function getDataConfiguration() {
+  var config = getConfiguration();
+  config.points = Math.max(Math.round($("#plotgrid").width()), 100);
+  config.format = "columnar";
+  return config;
+}
+
+function pad(number) {
+  return (number < 10 ? "0" : "") + number;
+}
+
+// Formats seconds since the epoch like the dates of timeline points
+function formatTimestamp(seconds) {
+  var date = new Date(seconds * 1000);
+  return date.getUTCFullYear() + "/" + pad(date.getUTCMonth() + 1) + "/" +
+    pad(date.getUTCDate()) + " " + pad(date.getUTCHours()) + ":" +
+    pad(date.getUTCMinutes()) + ":" + pad(date.getUTCSeconds()) + " ";
+}
+
+// Converts the series of a timeline sent with format=columnar to the
+// points the plots are rendered from
+function decodeColumnarTimeline(timeline) {
+  var stats = (timeline.data_type === 'M') ?
+    ['value', 'max', 'q3', 'q1', 'min'] : ['value', 'std_dev'];
+  for (var branch in timeline.branches) {
+    for (var exe_id in timeline.branches[branch]) {
+      var columns = timeline.branches[branch][exe_id];
+      var points = new Array(columns.date.length);
+      for (var i = 0; i < columns.date.length; i++) {
+        var point = [formatTimestamp(columns.date[i])];
+        for (var j = 0; j < stats.length; j++) {
+          var value = columns[stats[j]][i];
+          point.push(value === null ? "" : value);
+        }
+        point.push(timeline.strings[columns.commit[i]],
+                   timeline.strings[columns.tag[i]], branch);
+        points[i] = point;
+      }
+      timeline.branches[branch][exe_id] = points;
+    }
+  }
+  if (timeline.baseline !== "None") {
+    for (var k = 0; k < timeline.baseline.length; k++) {
+      timeline.baseline[k][0] = formatTimestamp(timeline.baseline[k][0]);
+    }
+  }
+}
+
 function permalinkToChanges(commitid, executableid, environment) {
   window.location=CHANGES_URL + "?rev=" + commitid + "&" + "exe=" + executableid + "&env=" + environment;
 }
@@ -288,6 +338,11 @@ function renderMiniplot(plotid, data) {
 }
 
 function render(data) {
+  for (var t in data.timelines) {
+    if (data.timelines[t].strings !== undefined) {
+      decodeColumnarTimeline(data.timelines[t]);
+    }
+  }
   $("#revisions").attr("disabled", false);
   $("#equidistant").attr("disabled", false);
   $("span.options.median").css("display", "none");
@@ -306,7 +361,7 @@ function render(data) {
     $("#plotgrid").html(getLoadText("No data available", h));
   } else if ($("input[name='benchmark']:checked").val() === "grid") {
     if (data.nextBenchmarks !== false) {
-      var config = getConfiguration();
+      var config = getDataConfiguration();
       config.nextBenchmarks = data.nextBenchmarks;
       $.getJSON("json/", config, render);
     }
@@ -335,7 +390,7 @@ function refreshContent() {
   var h = $("#content").height();//get height for loading text
   $("#plotgrid").fadeOut("fast", function() {
     $("#plotgrid").html(getLoadText("Loading...", h)).show();
-    $.getJSON("json/", getConfiguration(), render);
+    $.getJSON("json/", getDataConfiguration(), render);
   });
 }
 
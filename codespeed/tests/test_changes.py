@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from codespeed.changes import compute_changes, get_colors
+
+nan = float('nan')
+
+
+class TestComputeChanges(SimpleTestCase):
+
+    def test_changes_and_trends(self):
+        values = [
+            # current, previous, past results
+            [11.0, 10.0, 10.0, 12.0],
+            [10.0, 10.0, nan, nan],
+            [0.0, 0.0, 1.0, 1.0],
+            [2.0, 0.0, nan, 4.0],
+        ]
+        computed = compute_changes(values, slice(2, 4), [0, 0, 1, 1],
+                                   [True, False], 3.0, 5.0)
+
+        self.assertAlmostEqual(computed['change'][0], 10.0)
+        self.assertEqual(computed['change'][1], 0)
+        # 0/0 is no change, n/0 an infinite one
+        self.assertEqual(computed['change'][2], 0)
+        self.assertEqual(computed['change'][3], float('inf'))
+
+        self.assertEqual(computed['trend'][0], 0)
+        self.assertTrue(math.isnan(computed['trend'][1]))
+        self.assertEqual(computed['trend'][2], -100)
+        self.assertEqual(computed['trend'][3], -50)
+
+        self.assertEqual(list(computed['change_color']),
+                         ['red', 'none', 'none', 'green'])
+        self.assertEqual(list(computed['trend_color']),
+                         ['none', 'none', 'red', 'red'])
+
+        # Arithmetic means of the ratios
+        self.assertAlmostEqual(computed['total_change'][0], 5.0)
+        self.assertEqual(computed['total_change'][1], float('inf'))
+        self.assertEqual(computed['total_trend'][0], 0)
+        self.assertEqual(computed['total_trend'][1], -75)
+        self.assertEqual(list(computed['total_change_color']),
+                         ['red', 'green'])
+
+    def test_first_revision(self):
+        computed = compute_changes([[1.0], [2.0]], slice(2, 1), [0, 1],
+                                   [True, True], 3.0, 5.0)
+        self.assertTrue(all(math.isnan(v) for v in computed['change']))
+        self.assertTrue(all(math.isnan(v) for v in computed['trend']))
+        self.assertTrue(all(math.isnan(v) for v in computed['total_change']))
+        self.assertEqual(list(computed['total_trend_color']),
+                         ['none', 'none'])
+
+    def test_no_results(self):
+        computed = compute_changes(np.empty((0, 3)), slice(2, 3), [], [False],
+                                   3.0, 5.0)
+        self.assertEqual(len(computed['change']), 0)
+        self.assertTrue(math.isnan(computed['total_change'][0]))
+
+    def test_colors(self):
+        self.assertEqual(list(get_colors([-4, -2, 4, nan], True, 3)),
+                         ['green', 'none', 'red', 'none'])
+        self.assertEqual(list(get_colors([-4, -2, 4, nan], False, 3)),
+                         ['red', 'none', 'green', 'none'])
@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from datetime import datetime
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from codespeed.commits import (get_logs, git, github, gitpool, hgserver,
+                               mercurial, repos, store, subversion)
+from codespeed.commits.exceptions import CommitLogError
+from codespeed.commits.logs import _matches
+from codespeed.models import CommitLog, Project, Branch, Revision
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+@skipUnless(which('git'), "git is not installed")
+class TestGitTags(TestCase):
+
+    def setUp(self):
+        self.working_copy = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.working_copy)
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.com')
+        self.git('config', 'user.name', 'Test')
+        self.git('commit', '-q', '--allow-empty', '-m', 'first')
+        self.git('commit', '-q', '--allow-empty', '-m', 'second')
+        self.first, self.second = self.git(
+            'log', '--format=%H').split()[::-1]
+
+    def git(self, *args):
+        return subprocess.check_output(
+            ('git',) + args, cwd=self.working_copy).decode('utf-8')
+
+    def logs(self):
+        p = subprocess.Popen(['git', 'log', git._log_format()],
+                             stdout=subprocess.PIPE, cwd=self.working_copy)
+        return dict((log['commitid'], log['tag']) for log in
+                    git._parse_logs(p.communicate()[0], self.working_copy))
+
+    def test_lightweight_and_annotated_tags(self):
+        self.git('tag', 'v1.0', self.first)
+        self.git('tag', '-a', '-m', 'Release', 'v2.0', self.second)
+        self.git('tag', 'latest', self.second)
+
+        self.assertEqual(self.logs(), {self.first: 'v1.0',
+                                       self.second: 'latest\nv2.0'})
+
+    def test_new_tag_refreshes_cached_map(self):
+        self.assertEqual(self.logs()[self.second], '')
+        self.git('tag', 'v1.0', self.second)
+        self.assertEqual(self.logs()[self.second], 'v1.0')
+        self.git('pack-refs', '--all')
+        self.git('tag', '-d', 'v1.0')
+        self.assertFalse(os.path.exists(os.path.join(
+            self.working_copy, '.git', 'refs', 'tags', 'v1.0')))
+        self.assertEqual(self.logs()[self.second], '')
+
+
+@skipUnless(which('git'), "git is not installed")
+class TestGitCatFilePool(TestCase):
+
+    def setUp(self):
+        self.working_copy = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.working_copy)
+        for args in (('init', '-q'),
+                     ('config', 'user.email', 'test@example.com'),
+                     ('config', 'user.name', 'Test')):
+            self.git(*args)
+        self.git('commit', '-q', '--allow-empty', '-m', 'first')
+        self.git('commit', '-q', '--allow-empty', '-m',
+                 'Speed up\nRichards\n\nBy caching the tasks.\n\nAnd more.')
+        self.git('tag', 'v1.0')
+        self.project = mock.Mock(working_copy=self.working_copy)
+
+    def git(self, *args):
+        return subprocess.check_output(
+            ('git',) + args, cwd=self.working_copy).decode('utf-8')
+
+    def test_same_logs_as_git_log(self):
+        p = subprocess.Popen(['git', 'log', git._log_format()],
+                             stdout=subprocess.PIPE, cwd=self.working_copy)
+        expected = git._parse_logs(p.communicate()[0], self.working_copy)
+        for log, position in zip(expected, (2, 1)):
+            log['short_commit_id'] = log['commitid'][:7]
+            log['position'] = position
+
+        commitids = [log['commitid'] for log in expected]
+        self.assertEqual(git.getcommits(self.project, commitids), expected)
+        self.assertEqual(
+            git.getcommits(self.project, ['v1.0', 'deadbeef']), expected[:1])
+
+    def test_positions_counted_in_one_process(self):
+        self.git('checkout', '-q', '-b', 'feature', 'HEAD~1')
+        self.git('commit', '-q', '--allow-empty', '-m', 'feature')
+        self.git('checkout', '-q', '-')
+        self.git('merge', '-q', '--no-ff', '-m', 'merge', 'feature')
+        commitids = self.git('rev-list', '--all').split()
+        expected = dict(
+            (commitid, int(self.git('rev-list', '--first-parent', '--count',
+                                    commitid)))
+            for commitid in commitids)
+        self.assertEqual(sorted(expected.values()), [1, 2, 2, 3])
+
+        git.getcommits(self.project, commitids[:1])
+        with mock.patch('codespeed.commits.git.Popen',
+                        wraps=subprocess.Popen) as popen:
+            logs = git.getcommits(self.project, commitids)
+        self.assertEqual(popen.call_count, 1)
+        self.assertEqual(
+            dict((log['commitid'], log['position']) for log in logs),
+            expected)
+
+    def test_processes_are_reused(self):
+        pool = gitpool.CatFilePool(self.working_copy, 1, 300)
+        self.addCleanup(pool.close)
+        sha = pool.read('HEAD')[0]
+        with mock.patch('codespeed.commits.gitpool.Popen') as popen:
+            self.assertEqual(pool.read('HEAD')[0], sha)
+            self.assertFalse(popen.called)
+
+        with pool.process() as process:
+            process.process.kill()
+            process.process.wait()
+        self.assertEqual(pool.running, 0)
+        self.assertEqual(pool.read('HEAD')[0], sha)
+
+    def test_invalid_names_are_rejected(self):
+        pool = gitpool.CatFilePool(self.working_copy, 1, 300)
+        self.addCleanup(pool.close)
+        first = self.git('rev-parse', 'HEAD~1').strip()
+        for name in (first + "\nHEAD", "HEAD HEAD", "HEAD\t", ""):
+            with self.assertRaises(CommitLogError):
+                pool.read(name)
+        # The process still answers with the requested objects
+        self.assertEqual(pool.read(first)[0], first)
+        self.assertEqual(pool.running, 1)
+
+    def test_idle_processes_are_stopped(self):
+        pool = gitpool.CatFilePool(self.working_copy, 2, -1)
+        self.addCleanup(pool.close)
+        with pool.process() as first:
+            first.read('HEAD')
+        with pool.process() as second:
+            self.assertIsNot(second, first)
+            self.assertEqual(pool.running, 1)
+        self.assertFalse(first.is_alive())
+
+
+@skipUnless(which('git'), "git is not installed")
+class TestCommitLogStore(TestCase):
+
+    def setUp(self):
+        base_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_path)
+        self.working_copy = os.path.join(base_path, 'repo')
+        os.mkdir(self.working_copy)
+        for args in (('init', '-q'),
+                     ('config', 'user.email', 'test@example.com'),
+                     ('config', 'user.name', 'Test')):
+            self.git(*args)
+        for message in ('first', 'second', 'third'):
+            self.git('commit', '-q', '--allow-empty', '-m', message)
+        commitids = self.git('log', '--format=%H').split()
+
+        settings = override_settings(REPOSITORY_BASE_PATH=base_path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.project = Project.objects.create(
+            name='repo', repo_type=Project.GIT, repo_path='/src/repo.git')
+        branch = Branch.objects.create(name='master', project=self.project)
+        self.third, self.second, self.first = [
+            Revision.objects.create(commitid=commitid, branch=branch,
+                                    project=self.project)
+            for commitid in commitids]
+
+    def git(self, *args):
+        return subprocess.check_output(
+            ('git',) + args, cwd=self.working_copy).decode('utf-8')
+
+    def test_known_range_does_not_run_git(self):
+        logs = get_logs(self.third, self.first)
+        self.assertEqual([log['message'] for log in logs],
+                         ['third', 'second'])
+        self.assertEqual(CommitLog.objects.count(), 2)
+
+        with mock.patch('codespeed.commits.git.Popen') as popen:
+            self.assertEqual(get_logs(self.third, self.first), logs)
+            self.assertEqual(get_logs(self.second, self.second), logs[1:])
+            self.assertFalse(popen.called)
+
+    def test_unknown_range_runs_git(self):
+        get_logs(self.third, self.second)
+        logs = get_logs(self.third, self.first)
+        self.assertEqual([log['message'] for log in logs],
+                         ['third', 'second'])
+
+    def test_octopus_merge_is_stored(self):
+        parents = ['%040x' % number for number in range(6)]
+        store.save_logs(self.project, [{
+            'commitid': 'f' * 40, 'parents': parents, 'author': 'Miquel',
+            'date': '2019-01-10 12:00:00+02:00', 'message': 'Merge'}])
+        commit_log = CommitLog.objects.get(commitid='f' * 40)
+        self.assertEqual(commit_log.get_parents(), parents)
+        self.assertEqual(commit_log.date, datetime(2019, 1, 10, 10))
+
+    def test_moved_tag_is_shown(self):
+        get_logs(self.third, self.first)
+        self.git('tag', 'v1.0', self.third.commitid)
+        self.assertEqual(get_logs(self.third, self.first)[0]['tag'], 'v1.0')
+
+
+class TestRepoFetch(TestCase):
+
+    def setUp(self):
+        base_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_path)
+        settings = override_settings(REPOSITORY_BASE_PATH=base_path,
+                                     REPO_FETCH_INTERVAL=300,
+                                     REPO_FETCH_MAX_BACKOFF=3600)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.project = Project.objects.create(
+            name='repo', repo_type=Project.GIT, repo_path='/src/repo.git')
+
+    @mock.patch('codespeed.commits.git.updaterepo')
+    def test_fetch_interval(self, updaterepo):
+        self.assertIsNone(repos.get_staleness(self.project))
+        self.assertTrue(repos.fetch_project(self.project))
+        self.assertFalse(repos.fetch_project(self.project))
+        self.assertEqual(updaterepo.call_count, 1)
+        self.assertLess(repos.get_staleness(self.project), 60)
+
+    @mock.patch('codespeed.commits.git.updaterepo')
+    def test_failures_back_off(self, updaterepo):
+        updaterepo.side_effect = CommitLogError("git pull returned 1")
+        for _ in range(2):
+            with self.assertRaises(CommitLogError):
+                repos.fetch_project(self.project, force=True)
+        state = repos.get_fetch_state(self.project)
+        self.assertEqual(state['failures'], 2)
+        self.assertEqual(state['error'], "git pull returned 1")
+        self.assertEqual(repos.get_backoff(state), 1200)
+        self.assertIsNone(state['last_success'])
+
+    @mock.patch('codespeed.commits.git.updaterepo')
+    def test_background_fetch_does_not_pull(self, updaterepo):
+        with override_settings(BACKGROUND_REPO_FETCH=True):
+            repos.update_working_copy(self.project)
+            with self.assertRaises(CommitLogError):
+                repos.check_working_copy(self.project)
+        self.assertFalse(updaterepo.called)
+
+
+def github_commit(sha, parent, date):
+    return {
+        'sha': sha,
+        'parents': [{'sha': parent}],
+        'commit': {
+            'message': 'Commit %s' % sha,
+            'author': {'name': 'Miquel', 'email': 'm@example.com'},
+            'committer': {'date': date},
+        },
+    }
+
+
+class GithubAPIHandler(BaseHTTPRequestHandler):
+    """Serves the responses of a stand-in Github API from server.responses"""
+
+    def do_GET(self):
+        self.server.requests.append(
+            (self.path, self.headers.get('If-None-Match')))
+        if self.path not in self.server.responses:
+            self.send_response(404)
+            body = {'message': 'Not Found'}
+        else:
+            body = self.server.responses[self.path]
+            etag = '"%s"' % abs(hash(json.dumps(body, sort_keys=True)))
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGithubBackend(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.server = HTTPServer(('127.0.0.1', 0), GithubAPIHandler)
+        self.server.requests = []
+        self.server.responses = {
+            '/repos/tobami/codespeed/tags?per_page=100&page=1': [
+                {'name': 'v1.0', 'commit': {'sha': 'c3'}},
+                {'name': 'latest', 'commit': {'sha': 'c3'}}],
+        }
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings = override_settings(
+            GITHUB_API_URL='http://127.0.0.1:%d' % self.server.server_port)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        project = Project.objects.create(
+            name='codespeed', repo_type=Project.GITHUB,
+            repo_path='https://github.com/tobami/codespeed.git')
+        branch = Branch.objects.create(name='master', project=project)
+        self.start, self.end = [
+            Revision.objects.create(commitid=commitid, branch=branch,
+                                    project=project)
+            for commitid in ('c0', 'c3')]
+
+    @mock.patch.object(github, 'GITHUB_COMMITS_PER_PAGE', 2)
+    def test_compare_pages(self):
+        compare = '/repos/tobami/codespeed/compare/c0...c3?per_page=2&page=%d'
+        self.server.responses[compare % 1] = {
+            'total_commits': 3,
+            'commits': [github_commit('c1', 'c0', '2019-01-01T10:00:00Z'),
+                        github_commit('c2', 'c1', '2019-01-02T10:00:00Z')]}
+        self.server.responses[compare % 2] = {
+            'total_commits': 3,
+            'commits': [github_commit('c3', 'c2', '2019-01-03T10:00:00Z')]}
+
+        logs = github.getlogs(self.end, self.start)
+
+        self.assertEqual([log['commitid'] for log in logs],
+                         ['c3', 'c2', 'c1'])
+        self.assertEqual([log['tag'] for log in logs],
+                         ['latest\nv1.0', '', ''])
+
+        # Comparisons never change and tags are only read again after
+        # GITHUB_TAGS_REFRESH_INTERVAL
+        del self.server.requests[:]
+        self.assertEqual(github.getlogs(self.end, self.start), logs)
+        self.assertEqual(self.server.requests, [])
+
+    def test_tags_are_revalidated(self):
+        self.assertEqual(github.retrieve_tag('c3', 'tobami', 'codespeed'),
+                         'latest\nv1.0')
+        with override_settings(GITHUB_TAGS_REFRESH_INTERVAL=0):
+            self.assertEqual(
+                github.retrieve_tag('c3', 'tobami', 'codespeed'),
+                'latest\nv1.0')
+        self.assertEqual(len(self.server.requests), 2)
+        path, etag = self.server.requests[1]
+        self.assertEqual(path,
+                         '/repos/tobami/codespeed/tags?per_page=100&page=1')
+        self.assertIsNotNone(etag)
+
+    def test_not_found(self):
+        with self.assertRaises(github.CommitLogError):
+            github.getlogs(self.end, self.start)
+
+
+class TestSubversionTags(TestCase):
+
+    def setUp(self):
+        subversion._tag_maps.clear()
+        self.client = mock.Mock()
+        self.client.ls.return_value = [
+            {'name': 'file:///svn/repo/tags/v1.0',
+             'created_rev': mock.Mock(number=3)},
+        ]
+
+    def test_listing_is_cached(self):
+        for rev_num in (1, 2, 3):
+            subversion.get_tag(rev_num, 'file:///svn/repo', self.client)
+        self.assertEqual(
+            subversion.get_tag(3, 'file:///svn/repo', self.client), 'v1.0')
+        self.assertEqual(self.client.ls.call_count, 1)
+
+    def test_newer_revision_lists_again(self):
+        subversion.get_tag(3, 'file:///svn/repo', self.client)
+        self.client.ls.return_value.append(
+            {'name': 'file:///svn/repo/tags/v2.0',
+             'created_rev': mock.Mock(number=5)})
+        self.assertEqual(
+            subversion.get_tag(5, 'file:///svn/repo', self.client), 'v2.0')
+        self.assertEqual(self.client.ls.call_count, 2)
+
+    @override_settings(SVN_TAGS_REFRESH_INTERVAL=0)
+    def test_refresh_interval(self):
+        subversion.get_tag(3, 'file:///svn/repo', self.client)
+        subversion.get_tag(3, 'file:///svn/repo', self.client)
+        self.assertEqual(self.client.ls.call_count, 2)
+
+
+try:
+    import pysvn  # noqa
+except ImportError:
+    pysvn = None
+
+
+@skipUnless(pysvn and which('svnadmin') and which('svn'),
+            "pysvn and subversion are not installed")
+class TestSubversionBackend(TestCase):
+
+    def setUp(self):
+        subversion._tag_maps.clear()
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        repo = os.path.join(path, 'repo')
+        subprocess.check_call(['svnadmin', 'create', repo])
+        url = 'file://' + repo
+        for args in (['mkdir', '-m', 'layout', url + '/trunk',
+                      url + '/tags'],
+                     ['mkdir', '-m', 'work', url + '/trunk/src'],
+                     ['copy', '-m', 'release', url + '/trunk',
+                      url + '/tags/v1.0']):
+            subprocess.check_call(['svn', '-q'] + args)
+
+        self.project = Project.objects.create(
+            name='repo', repo_type=Project.SUBVERSION, repo_path=url)
+        branch = Branch.objects.create(name='trunk', project=self.project)
+        self.start, self.end = [
+            Revision.objects.create(commitid=commitid, branch=branch,
+                                    project=self.project)
+            for commitid in ('1', '3')]
+
+    def test_tags_of_log_range(self):
+        with mock.patch.object(subversion, '_list_tags',
+                               wraps=subversion._list_tags) as list_tags:
+            logs = subversion.getlogs(self.end, self.start)
+        self.assertEqual([(log['commitid'], log['tag']) for log in logs],
+                         [(3, 'v1.0'), (2, ''), (1, '')])
+        self.assertEqual(list_tags.call_count, 1)
+
+
+class TestCommitMatching(TestCase):
+
+    def test_revision_numbers_are_not_abbreviated(self):
+        self.assertTrue(_matches('123', {'commitid': 123}))
+        self.assertFalse(_matches('12', {'commitid': 123}))
+        self.assertFalse(_matches(1, {'commitid': 10}))
+
+    def test_hashes_are_abbreviated(self):
+        log = {'commitid': 'abc1234def', 'short_commit_id': '12:abc1234def'}
+        for commitid in ('abc1234def', 'abc1', '12'):
+            self.assertTrue(_matches(commitid, log))
+        self.assertFalse(_matches('1', log))
+
+
+@skipUnless(which('hg'), "mercurial is not installed")
+class TestMercurialCommandServer(TestCase):
+
+    def setUp(self):
+        self.working_copy = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.working_copy)
+        self.addCleanup(hgserver.close_all)
+        subprocess.check_call(['hg', 'init'], cwd=self.working_copy)
+        for message in ('first', 'second'):
+            with open(os.path.join(self.working_copy, 'file'), 'a') as f:
+                f.write(message)
+            subprocess.check_call(
+                ['hg', 'commit', '-q', '-A', '-u', 'Test <test@example.com>',
+                 '-m', message], cwd=self.working_copy)
+        subprocess.check_call(['hg', 'tag', '-u', 'Test', '-r', '0', 'v1.0'],
+                              cwd=self.working_copy)
+
+    def test_same_logs_as_hg(self):
+        expected = mercurial._hg_log(self.working_copy, '0:2')
+        with override_settings(HG_USE_CMDSERVER=True):
+            self.assertEqual(mercurial._hg_log(self.working_copy, '0:2'),
+                             expected)
+            self.assertEqual(expected[0]['tag'], 'v1.0')
+
+            with mock.patch('codespeed.commits.mercurial.Popen') as popen:
+                mercurial._hg_log(self.working_copy, '1')
+                self.assertFalse(popen.called)
+
+    def test_restarted_after_failure(self):
+        with override_settings(HG_USE_CMDSERVER=True):
+            mercurial._hg_log(self.working_copy, '0')
+            server = hgserver._get_server(self.working_copy)[0]
+            server.process.kill()
+            server.process.wait()
+            self.assertEqual(
+                len(mercurial._hg_log(self.working_copy, '0:1')), 2)
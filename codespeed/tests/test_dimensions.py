@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase, override_settings
+
+from codespeed.dimensions import (DimensionCache, dimension_cache,
+                                  get_dimension, get_dimensions)
+from codespeed.models import Environment, Project, Executable
+
+
+class TestDimensionCache(TestCase):
+
+    def setUp(self):
+        dimension_cache.clear()
+        self.env = Environment.objects.create(name='Dual Core')
+        self.project = Project.objects.create(name='MyProject')
+        self.exe = Executable.objects.create(name='myexe',
+                                             project=self.project)
+
+    def test_hit_does_not_query(self):
+        self.assertEqual(get_dimension(Environment, 'Dual Core'), self.env)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dimension(Environment, 'Dual Core'),
+                             self.env)
+
+    def test_project_scoped_lookup(self):
+        found = get_dimensions(
+            Executable, [(self.project.id, 'myexe'), (self.project.id, 'x')])
+        self.assertEqual(found, {(self.project.id, 'myexe'): self.exe})
+
+    def test_missing_name_is_not_cached(self):
+        self.assertIsNone(get_dimension(Environment, 'Quad Core'))
+        env = Environment.objects.create(name='Quad Core')
+        self.assertEqual(get_dimension(Environment, 'Quad Core'), env)
+
+    def test_save_invalidates(self):
+        get_dimension(Environment, 'Dual Core')
+        self.env.cpu = 'Core 2 Duo 8200'
+        self.env.save()
+        self.assertEqual(len(dimension_cache), 0)
+
+    def test_delete_invalidates(self):
+        get_dimension(Environment, 'Dual Core')
+        self.env.delete()
+        self.assertIsNone(get_dimension(Environment, 'Dual Core'))
+
+    @override_settings(USE_DIMENSION_CACHE=False)
+    def test_disabled(self):
+        get_dimension(Environment, 'Dual Core')
+        with self.assertNumQueries(1):
+            get_dimension(Environment, 'Dual Core')
+
+    def test_size_is_bounded(self):
+        cache = DimensionCache(size=2)
+        for name in ('a', 'b', 'c'):
+            cache.set(Environment, name, name)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(Environment, 'a'))
+        self.assertEqual(cache.get(Environment, 'c'), 'c')
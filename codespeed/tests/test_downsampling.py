@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from django.test import SimpleTestCase
+
+from codespeed.downsampling import downsample
+
+
+class TestDownsample(SimpleTestCase):
+
+    def test_short_series_are_kept(self):
+        self.assertEqual(list(downsample([3.0, 1.0, 2.0], 5)), [0, 1, 2])
+
+    def test_extremes_are_kept(self):
+        random = np.random.RandomState(0)
+        values = random.uniform(1.0, 2.0, 10000)
+        values[1234] = 10.0
+        values[5678] = 0.1
+        keep = np.zeros(len(values), dtype=bool)
+        keep[4321] = True
+
+        indices = downsample(values, 200, keep)
+        self.assertLessEqual(len(indices), 200)
+        self.assertTrue((np.diff(indices) > 0).all())
+        for index in (0, 1234, 4321, 5678, len(values) - 1):
+            self.assertIn(index, indices)
+        self.assertEqual(values[indices].min(), values.min())
+        self.assertEqual(values[indices].max(), values.max())
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+from codespeed import enrichment
+from codespeed.commits.exceptions import CommitLogError
+from codespeed.models import (Environment, Project, PendingCommitLog,
+                              Report, Result, Revision)
+from codespeed.results import save_results
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+@override_settings(QUEUE_COMMIT_LOGS=True)
+class TestQueuedCommitLogs(TestCase):
+
+    def setUp(self):
+        Environment.objects.create(name='bigdog')
+        Project.objects.create(name='pypy', repo_type=Project.GIT,
+                               repo_path='/tmp/pypy.git')
+        self.data = {
+            'commitid': 'abc123',
+            'project': 'pypy',
+            'branch': 'master',
+            'executable': 'pypy-c',
+            'benchmark': 'Richards',
+            'environment': 'bigdog',
+            'result_value': 456,
+            'revision_date': '2019-01-01 10:00:00',
+        }
+        self.log = {
+            'author': 'Miquel',
+            'date': '2019-01-01 09:00:00',
+            'message': 'Speed up Richards',
+            'tag': 'v1.0',
+        }
+
+    @mock.patch('codespeed.commits.get_commits')
+    def test_revision_saved_without_log(self, get_commits):
+        response, error = save_results([self.data])
+
+        self.assertFalse(error)
+        self.assertFalse(get_commits.called)
+        rev = Revision.objects.get(commitid='abc123')
+        self.assertEqual(rev.author, '')
+        self.assertEqual(rev.date, datetime(2019, 1, 1, 10))
+        self.assertEqual(PendingCommitLog.objects.get().revision, rev)
+
+    @mock.patch('codespeed.commits.get_commits')
+    def test_fetch_pending_logs(self, get_commits):
+        save_results([self.data])
+        get_commits.return_value = {'abc123': self.log}
+
+        stats = enrichment.fetch_pending_logs(10)
+
+        self.assertEqual(stats, {'saved': 1, 'failed': 0})
+        rev = Revision.objects.get(commitid='abc123')
+        self.assertEqual(rev.author, 'Miquel')
+        self.assertEqual(rev.tag, 'v1.0')
+        self.assertEqual(rev.date, datetime(2019, 1, 1, 9))
+        self.assertEqual(Result.objects.get().date, rev.date)
+        self.assertEqual(PendingCommitLog.objects.count(), 0)
+
+    @mock.patch('codespeed.commits.get_commits')
+    def test_failed_log_is_retried(self, get_commits):
+        save_results([self.data])
+        get_commits.side_effect = CommitLogError("git pull returned 1")
+
+        stats = enrichment.fetch_pending_logs(10)
+
+        self.assertEqual(stats, {'saved': 0, 'failed': 1})
+        pending = PendingCommitLog.objects.get()
+        self.assertEqual(pending.attempts, 1)
+        self.assertEqual(pending.error, "git pull returned 1")
+        self.assertEqual(len(enrichment.claim_pending_logs(10)), 1)
+
+    @mock.patch('codespeed.commits.get_commits')
+    def test_long_tags_are_truncated(self, get_commits):
+        save_results([self.data])
+        self.log['tag'] = 'release-2019.01.10-rc1\nv1.0'
+        self.log['author'] = 'M' * 150
+        get_commits.return_value = {'abc123': self.log}
+
+        self.assertEqual(enrichment.fetch_pending_logs(10),
+                         {'saved': 1, 'failed': 0})
+        rev = Revision.objects.get(commitid='abc123')
+        self.assertEqual(rev.tag, 'release-2019.01.10-r')
+        self.assertEqual(rev.author, 'M' * 100)
+
+    @mock.patch('codespeed.commits.get_commits')
+    def test_invalid_log_is_a_failed_attempt(self, get_commits):
+        save_results([self.data, dict(self.data, commitid='abc124')])
+        get_commits.return_value = {'abc123': self.log, 'abc124': self.log}
+
+        with mock.patch.object(Revision, 'full_clean', autospec=True,
+                               side_effect=[ValidationError("Too long"),
+                                            None]):
+            stats = enrichment.fetch_pending_logs(10)
+
+        self.assertEqual(stats, {'saved': 1, 'failed': 1})
+        pending = PendingCommitLog.objects.get()
+        self.assertEqual(pending.attempts, 1)
+        self.assertIn("Too long", pending.error)
+        self.assertIsNone(pending.claimed)
+
+    @mock.patch('codespeed.commits.get_commits')
+    def test_reports_marked_at_old_place(self, get_commits):
+        save_results([self.data])
+        rev = Revision.objects.get(commitid='abc123')
+        Revision.objects.filter(pk=rev.pk).update(position=3)
+        rev.refresh_from_db()
+        self.log['position'] = 7
+
+        with mock.patch.object(Report, 'mark_dirty') as mark_dirty:
+            enrichment.save_log(rev, self.log)
+
+        self.assertEqual(mark_dirty.call_count, 2)
+        self.assertEqual(mark_dirty.call_args_list[0][0][0], rev)
+        old_place = mark_dirty.call_args_list[1][0][0]
+        self.assertEqual((old_place.pk, old_place.position, old_place.date),
+                         (rev.pk, 3, datetime(2019, 1, 1, 10)))
+
+
+class TestBatchedCommitLogs(TestCase):
+
+    def setUp(self):
+        Environment.objects.create(name='bigdog')
+        Project.objects.create(name='pypy', repo_type=Project.GIT,
+                               repo_path='/tmp/pypy.git')
+
+    @mock.patch('codespeed.commits.get_commits')
+    def test_one_call_per_project(self, get_commits):
+        get_commits.return_value = {
+            'abc123': {'author': 'Miquel', 'date': '2019-01-01 09:00:00',
+                       'message': 'Speed up Richards', 'tag': '',
+                       'position': 7},
+        }
+        data = []
+        for commitid in ('abc123', 'def456'):
+            data.append({
+                'commitid': commitid,
+                'project': 'pypy',
+                'branch': 'master',
+                'executable': 'pypy-c',
+                'benchmark': 'Richards',
+                'environment': 'bigdog',
+                'result_value': 456,
+                'revision_date': '2019-01-02 10:00:00',
+            })
+
+        response, error = save_results(data)
+
+        self.assertFalse(error)
+        self.assertEqual(get_commits.call_count, 1)
+        self.assertEqual(sorted(get_commits.call_args[0][1]),
+                         ['abc123', 'def456'])
+        self.assertEqual(Revision.objects.get(commitid='abc123').author,
+                         'Miquel')
+        self.assertEqual(Revision.objects.get(commitid='def456').date,
+                         datetime(2019, 1, 2, 10))
+        self.assertEqual(Revision.objects.get(commitid='abc123').position, 7)
+        self.assertIsNone(Revision.objects.get(commitid='def456').position)
@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
+import json
 import os
+import tempfile
 
 from django.conf import settings
+from django.core.management import call_command
 from django.test import TestCase, override_settings
+from django.utils.six import StringIO
 
 from codespeed.models import (Project, Report, Revision, Branch, Environment,
-                              Benchmark, Executable, Result)
+                              Benchmark, Executable, Result, DataVersion,
+                              TREND_DEPTHS, order_revisions, revision_ordering)
+from codespeed.results import create_report_if_enough_data, save_results
 from datetime import timedelta, datetime
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 
 @override_settings(CHANGE_THRESHOLD=3.0, TREND_THRESHOLD=5.0)
 class TestReport(TestCase):
@@ -198,6 +209,87 @@ class TestReport(TestCase):
         self.assertRegexpMatches(rep.summary, '[sS]pace')
         self.assertEquals('red', rep.colorcode)
 
+    def test_changes_table_queries(self):
+        benchmarks = [self.make_bench('b%d' % i) for i in range(5)]
+        for value in self.make_bad_trend():
+            rev = self.make_result(value)
+            for bench in benchmarks:
+                self.make_result(value, rev=rev, benchmark=bench)
+
+        self.make_report(rev)
+        rep = Report.objects.select_related(
+            'revision', 'environment', 'executable').get(revision=rev)
+        # Revisions, results, benchmarks and units titles
+        with self.assertNumQueries(4):
+            table = rep.get_changes_table(force_save=True)
+        self.assertEqual([row['bench_name'] for row in table[0]['rows']],
+                         ['TestBench'] + [b.name for b in benchmarks])
+        self.assertAlmostEqual(table[0]['totals']['change'],
+                               table[0]['rows'][0]['change'])
+
+    def test_tables_cached_for_every_trend_depth(self):
+        for value in self.make_bad_trend():
+            rev = self.make_result(value)
+        rep = self.make_report(rev)
+        with self.assertNumQueries(0):
+            tables = dict((depth, rep.get_changes_table(depth))
+                          for depth in TREND_DEPTHS)
+        for depth in TREND_DEPTHS:
+            self.assertEqual(tables[depth],
+                             rep.get_changes_table(depth, force_save=True))
+        self.assertNotEqual(tables[5][0]['rows'][0]['trend'],
+                            tables[10][0]['rows'][0]['trend'])
+
+    def test_invalidated_tables_are_recomputed(self):
+        s1 = self.make_result(10)
+        s2 = self.make_result(10)
+        rep = self.make_report(s2)
+        self.assertEqual(rep.get_changes_table(5)[0]['totals']['change'], 0)
+
+        Result.objects.filter(revision=s1).update(value=5)
+        Report.mark_dirty(s1, self.exe, self.env)
+        rep = Report.objects.get(pk=rep.pk)
+        self.assertEqual(rep._tablecache, '')
+        self.assertTrue(rep.dirty)
+        self.assertEqual(rep.get_changes_table(5)[0]['totals']['change'], 100)
+
+        # The recomputed tables were cached
+        rep = Report.objects.get(pk=rep.pk)
+        with self.assertNumQueries(0):
+            table = rep.get_changes_table(20)
+        self.assertEqual(table[0]['totals']['change'], 100)
+
+    def test_late_results_mark_following_reports_dirty(self):
+        s1 = self.make_result(10)
+        s2 = self.make_result(10)
+        rep = self.make_report(s2)
+        self.assertEqual(rep.colorcode, 'none')
+
+        # Results of the previous revision are saved again
+        Result.objects.filter(revision=s1).update(value=5)
+        create_report_if_enough_data(s1, self.exe, self.env)
+        rep = Report.objects.get(pk=rep.pk)
+        self.assertTrue(rep.dirty)
+        self.assertEqual(rep.colorcode, 'none')
+        self.assertFalse(Report.objects.get(revision=s1).dirty)
+
+        out = StringIO()
+        call_command('recompute_reports', stdout=out)
+        self.assertIn("Recalculated 1 reports", out.getvalue())
+        rep = Report.objects.get(pk=rep.pk)
+        self.assertFalse(rep.dirty)
+        self.assertEqual(rep.colorcode, 'red')
+
+    def test_latest_results_leave_previous_reports(self):
+        s1 = self.make_result(10)
+        self.make_report(s1)
+        s2 = self.make_result(10)
+        with mock.patch.object(Report, 'mark_dirty') as mark_dirty:
+            create_report_if_enough_data(s2, self.exe, self.env)
+        self.assertFalse(mark_dirty.called)
+        self.assertFalse(Report.objects.get(revision=s1).dirty)
+        self.assertFalse(Report.objects.get(revision=s2).dirty)
+
     def make_result(self, value, rev=None, benchmark=None):
         from uuid import uuid4
 
@@ -295,3 +387,149 @@ class TestProject(TestCase):
         self.github_project.save()
         self.assertEquals(self.github_project.commit_browsing_url,
                           'https://example.com/{commitid}')
+
+
+class TestRevision(TestCase):
+
+    def setUp(self):
+        project = Project.objects.create(name='project',
+                                         repo_type=Project.GIT)
+        self.branch = Branch.objects.create(name='default', project=project)
+        # A rebased commit can be dated before the commit it follows
+        self.revisions = [
+            Revision.objects.create(
+                commitid=str(position), branch=self.branch,
+                position=position, date=datetime(2019, 1, 10 - position))
+            for position in range(1, 4)]
+
+    def test_ordered_by_position(self):
+        first, second, third = self.revisions
+        self.assertEqual(list(third.get_previous()), [second, first])
+        self.assertEqual(list(second.get_previous(include_self=True)),
+                         [second, first])
+        self.assertEqual(list(first.get_next()), [second, third])
+
+    def test_unknown_position_is_last(self):
+        unknown = Revision.objects.create(
+            commitid='x', branch=self.branch, date=datetime(2019, 2, 1))
+        self.assertEqual(
+            list(Revision.objects.order_by(*revision_ordering())),
+            self.revisions[::-1] + [unknown])
+        # Without a position, the revisions before it are found by date
+        self.assertEqual(list(unknown.get_previous()), self.revisions)
+
+    def test_same_position_ordered_by_date(self):
+        first, second, third = self.revisions
+        tied = [Revision.objects.create(
+            commitid=commitid, branch=self.branch, position=3,
+            date=datetime(2019, 1, 7)) for commitid in ('t1', 't2')]
+        self.assertEqual(list(tied[1].get_previous()),
+                         [tied[0], third, second, first])
+        self.assertEqual(list(third.get_next()), tied)
+        self.assertEqual(list(tied[0].get_previous(include_self=True)),
+                         [tied[0], third, second, first])
+        self.assertEqual(list(order_revisions(Revision.objects.all())),
+                         tied[::-1] + self.revisions[::-1])
+        # The report of a revision compares it to the revisions before it
+        report = Report(revision=tied[0])
+        self.assertEqual(list(report.get_last_revisions(1)),
+                         [tied[0], third])
+
+    def test_revisions_saved_within_a_second(self):
+        Environment.objects.create(name='env')
+        # Dated when they are saved, in the same second
+        response, error = save_results([{
+            'commitid': commitid, 'branch': 'default', 'project': 'nologs',
+            'executable': 'exe', 'benchmark': 'bench', 'environment': 'env',
+            'result_value': 1} for commitid in ('a1', 'a2')],
+            update_repo=False)
+        self.assertFalse(error)
+        a1, a2 = [Revision.objects.get(commitid=commitid)
+                  for commitid in ('a1', 'a2')]
+        self.assertLess(a1.position, a2.position)
+        self.assertEqual(list(a2.get_previous()), [a1])
+
+    def test_unknown_positions_order_by_date(self):
+        first, second, third = self.revisions
+        unknown = Revision.objects.create(
+            commitid='x', branch=self.branch, date=datetime(2019, 1, 8, 12))
+        self.assertEqual(list(order_revisions(Revision.objects.all())),
+                         [first, unknown, second, third])
+        # Revisions without a position are not left out
+        self.assertEqual(list(first.get_previous()), [unknown, second, third])
+        self.assertEqual(list(third.get_next()), [second, unknown, first])
+
+
+class TestRebuildReports(TestCase):
+
+    def setUp(self):
+        project = Project.objects.create(name='project')
+        branch = Branch.objects.create(name='default', project=project)
+        env = Environment.objects.create(name='env')
+        bench = Benchmark.objects.create(name='bench')
+        self.exes = [Executable.objects.create(name=name, project=project)
+                     for name in ('exe1', 'exe2')]
+        for day, value in enumerate((10, 20)):
+            rev = Revision.objects.create(
+                commitid=str(day), branch=branch, project=project,
+                date=datetime(2019, 1, day + 1), position=day)
+            for exe in self.exes:
+                Result.objects.create(value=value, revision=rev,
+                                      executable=exe, environment=env,
+                                      benchmark=bench)
+                Report.objects.create(revision=rev, executable=exe,
+                                      environment=env)
+        Report.objects.update(summary='', colorcode='none')
+
+    def test_rebuild(self):
+        out = StringIO()
+        call_command('rebuild_reports', workers=1, stdout=out)
+        self.assertIn("Recalculated 4 reports of 2 partitions",
+                      out.getvalue())
+        self.assertEqual(
+            sorted(Report.objects.values_list('colorcode', flat=True)),
+            ['none', 'none', 'red', 'red'])
+
+    def test_resume_and_since(self):
+        state_file = os.path.join(tempfile.mkdtemp(), 'state.json')
+        branch_id = Branch.objects.get().id
+        env_id = Environment.objects.get().id
+        with open(state_file, 'w') as f:
+            json.dump({'filters': {'since': '2019-01-02', 'project': None},
+                       'done': [[self.exes[0].id, env_id, branch_id]]}, f)
+
+        out = StringIO()
+        call_command('rebuild_reports', workers=1, since='2019-01-02',
+                     state_file=state_file, stdout=out)
+        self.assertIn("Recalculated 1 reports of 1 partitions",
+                      out.getvalue())
+        self.assertEqual(Report.objects.get(colorcode='red').executable,
+                         self.exes[1])
+        self.assertFalse(os.path.exists(state_file))
+
+
+class TestUpdateRevisionPositions(TestCase):
+
+    def setUp(self):
+        self.project = Project.objects.create(name='project')
+        branch = Branch.objects.create(name='default', project=self.project)
+        env = Environment.objects.create(name='env')
+        exe = Executable.objects.create(name='exe', project=self.project)
+        rev = Revision.objects.create(
+            commitid='1', branch=branch, project=self.project,
+            date=datetime(2019, 1, 1))
+        Report.objects.create(revision=rev, executable=exe, environment=env)
+        self.version = DataVersion.objects.create(
+            environment=env, project=self.project, version=1,
+            modified=datetime(2019, 1, 1))
+
+    def test_positions_invalidate_reports_and_data(self):
+        out = StringIO()
+        call_command('update_revision_positions', stdout=out)
+        self.assertIn("Updated 1 revisions of project", out.getvalue())
+        self.assertIsNotNone(Revision.objects.get().position)
+        report = Report.objects.get()
+        self.assertTrue(report.dirty)
+        self.assertEqual(report._tablecache, '')
+        self.assertEqual(
+            DataVersion.objects.get(pk=self.version.pk).version, 2)
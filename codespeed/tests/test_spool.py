@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.six import StringIO
+
+from codespeed.models import Environment, Result, Report, ResultBatch
+from codespeed import spool
+
+
+@override_settings(ALLOW_ANONYMOUS_POST=True, QUEUE_RESULTS=True)
+class TestQueuedResults(TestCase):
+
+    def setUp(self):
+        Environment.objects.create(name='bigdog')
+        self.data = [
+            {'commitid': str(commitid),
+             'project': 'pypy',
+             'branch': 'default',
+             'executable': 'pypy-c',
+             'benchmark': 'Richards',
+             'environment': 'bigdog',
+             'result_value': value} for commitid, value in (
+                 (123, 456), (456, 457))
+        ]
+
+    def test_post_only_queues(self):
+        response = self.client.post(reverse('add-json-results'),
+                                    {'json': json.dumps(self.data)})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.content.decode(),
+                         "All result data queued successfully")
+        self.assertEqual(Result.objects.count(), 0)
+        self.assertEqual(spool.get_backlog()['results'], 2)
+
+    def test_invalid_post_is_not_queued(self):
+        self.data[1]['environment'] = 'bigdog1'
+        response = self.client.post(reverse('add-json-results'),
+                                    {'json': json.dumps(self.data)})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode(),
+                         "Environment bigdog1 not found")
+        self.assertEqual(ResultBatch.objects.count(), 0)
+
+    def test_drain_saves_results_and_reports(self):
+        for item in self.data:
+            self.client.post(reverse('add-result'), item)
+        self.assertEqual(ResultBatch.objects.count(), 2)
+
+        out = StringIO()
+        call_command('drain_results', stdout=out)
+
+        self.assertIn('Saved 2 results in 2 batches', out.getvalue())
+        self.assertEqual(Result.objects.count(), 2)
+        self.assertEqual(Report.objects.count(), 1)
+        self.assertEqual(ResultBatch.objects.count(), 0)
+
+    def test_failed_batch_is_kept(self):
+        spool.queue_results(self.data)
+        Environment.objects.all().delete()
+
+        stats = spool.drain(10)
+
+        self.assertEqual(stats['failed'], 1)
+        batch = ResultBatch.objects.get()
+        self.assertEqual(batch.status, ResultBatch.FAILED)
+        self.assertEqual(batch.error, "Environment bigdog not found")
+        self.assertEqual(spool.get_backlog()['batches'], 0)
+
+    def test_claimed_batch_is_not_claimed_twice(self):
+        spool.queue_results(self.data)
+        self.assertEqual(len(spool.claim_batches(10)), 1)
+        self.assertEqual(spool.claim_batches(10), [])
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.six import StringIO
+
+from codespeed import enrichment, timelines
+from codespeed.models import (Environment, Executable, Result, Revision,
+                              TimelineSeries)
+from codespeed.results import save_results
+
+
+class TestTimelineStore(TestCase):
+
+    def setUp(self):
+        self.env = Environment.objects.create(name='env')
+        for day, value in enumerate((10, 12, 11, 13)):
+            self.save(day, value)
+        self.exe = Executable.objects.get()
+        self.project = self.exe.project
+        self.project.track = True
+        self.project.default_branch = 'default'
+        self.project.save()
+
+    def save(self, day, value, **kwargs):
+        item = {
+            'commitid': str(day), 'branch': 'default', 'project': 'project',
+            'executable': 'exe', 'benchmark': 'bench', 'environment': 'env',
+            'result_value': value,
+            'revision_date': datetime(2019, 1, 10) + timedelta(days=day),
+        }
+        item.update(kwargs)
+        response, error = save_results([item], update_repo=False)
+        self.assertFalse(error)
+
+    def stored_values(self):
+        return list(timelines.unpack(
+            TimelineSeries.objects.get().points)['value'])
+
+    def get_timeline(self):
+        response = self.client.get(reverse('gettimelinedata'), {
+            "exe": self.exe.id, "ben": "bench", "env": self.env.id,
+            "revs": 10})
+        return json.loads(response.getvalue().decode())
+
+    def test_series_updated_on_save(self):
+        self.assertEqual(self.stored_values(), [13, 11, 12, 10])
+        # Results of older revisions are put in order, and saved results
+        # replace the stored ones
+        self.save(-1, 9)
+        self.save(3, 14, std_dev=0.5)
+        self.assertEqual(self.stored_values(), [14, 11, 12, 10, 9])
+        std_devs = timelines.unpack(
+            TimelineSeries.objects.get().points)['std_dev']
+        self.assertEqual(std_devs[0], 0.5)
+        self.assertTrue(np.isnan(std_devs[1]))
+
+        with self.settings(TIMELINE_STORE_SIZE=3):
+            self.save(4, 15)
+        self.assertEqual(self.stored_values(), [15, 14, 11])
+
+    def test_null_positions_ordered_by_date(self):
+        points = timelines.pack_results(
+            Result.objects.select_related('revision').order_by('id'))
+        points['position'] = [2, 4, 1, 3]
+        merged = timelines.merge_points(points[:0], points, 10)
+        self.assertEqual(list(merged['value']), [12, 13, 10, 11])
+        # Positions of revisions without one can't be compared to others
+        points['position'][1] = timelines.NULL_POSITION
+        merged = timelines.merge_points(points[:0], points, 10)
+        self.assertEqual(list(merged['value']), [13, 11, 12, 10])
+
+    def test_revision_logs_reorder_series(self):
+        rev = Revision.objects.get(commitid='0')
+        enrichment.save_log(rev, {
+            'author': 'me', 'date': '', 'message': 'first', 'tag': '',
+            'position': 10 ** 17})
+        self.assertEqual(self.stored_values(), [10, 13, 11, 12])
+
+    def test_concurrently_stored_series_are_merged(self):
+        results = list(Result.objects.select_related('revision'))
+        key = timelines.series_key(results[0])
+        # Stored by another transaction before the last results were saved
+        TimelineSeries.objects.update(points=timelines.pack_results(
+            [res for res in results if res.value < 13]).tobytes())
+        timelines.save_series({key: [
+            res for res in results if res.value >= 12]})
+        self.assertEqual(self.stored_values(), [13, 11, 12, 10])
+
+    def test_timeline_served_from_store(self):
+        with override_settings(USE_TIMELINE_STORE=False):
+            expected = self.get_timeline()
+        TimelineSeries.objects.all().delete()
+        # Built from the results the first time
+        self.assertEqual(self.get_timeline(), expected)
+        self.assertEqual(TimelineSeries.objects.count(), 1)
+        TimelineSeries.objects.update(points=timelines.merge_points(
+            timelines.unpack(TimelineSeries.objects.get().points)[:0],
+            timelines.pack_results(Result.objects.select_related(
+                'revision').filter(value__lt=12)), 10).tobytes())
+        timeline = self.get_timeline()['timelines'][0]
+        self.assertEqual(
+            [point[1] for point in timeline['branches']['default']
+             [str(self.exe.id)]], [11, 10])
+
+    def test_changed_results_drop_series(self):
+        Result.objects.filter(value=13).delete()
+        self.assertFalse(TimelineSeries.objects.exists())
+        self.assertEqual(
+            [point[1] for point in self.get_timeline()['timelines'][0]
+             ['branches']['default'][str(self.exe.id)]], [11, 12, 10])
+
+    def test_series_dropped_while_store_disabled(self):
+        with override_settings(USE_TIMELINE_STORE=False):
+            self.save(4, 15)
+            self.assertFalse(TimelineSeries.objects.exists())
+            self.get_timeline()
+            self.assertFalse(TimelineSeries.objects.exists())
+        self.get_timeline()
+        self.assertEqual(self.stored_values(), [15, 13, 11, 12, 10])
+
+        with override_settings(USE_TIMELINE_STORE=False):
+            Result.objects.get(value=15).delete()
+        self.assertFalse(TimelineSeries.objects.exists())
+        self.assertEqual(
+            [point[1] for point in self.get_timeline()['timelines'][0]
+             ['branches']['default'][str(self.exe.id)]], [13, 11, 12, 10])
+
+    def test_rebuild(self):
+        TimelineSeries.objects.update(points=b'')
+        out = StringIO()
+        call_command('rebuild_timelines', project='project', stdout=out)
+        self.assertIn("Rebuilt 1 series of project, branch default",
+                      out.getvalue())
+        self.assertEqual(self.stored_values(), [13, 11, 12, 10])
+        self.assertEqual(
+            Revision.objects.filter(
+                id__in=timelines.unpack(TimelineSeries.objects.get().points)
+                ['revision']).count(), 4)
@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime, timedelta
 import copy
+import gzip
+import io
 import json
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from codespeed.models import (Project, Benchmark, Revision, Branch, Executable,
                               Environment, Result, Report)
+from codespeed.results import save_results
 
 
 @override_settings(ALLOW_ANONYMOUS_POST=True)
@@ -303,6 +312,33 @@ class TestAddJSONResults(TestCase):
                 response.content.decode(), 'Key "' + key + '" missing from request')
             data[key] = backup
 
+    def test_error_saves_nothing(self):
+        """Should not save any result when one item of the batch is invalid"""
+        self.data[3]['environment'] = 'bigdog1'
+        response = self.client.post(self.path,
+                                    {'json': json.dumps(self.data)})
+
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(Result.objects.count(), 0)
+        self.assertEquals(Revision.objects.count(), 0)
+        self.assertEquals(Project.objects.count(), 0)
+
+    def test_resubmitted_results_are_updated(self):
+        """Should update existing results instead of duplicating them"""
+        self.client.post(self.path, {'json': json.dumps(self.data)})
+        self.data[0]['result_value'] = 400
+        self.data.append(dict(self.data[1], result_value=500))
+        response = self.client.post(self.path,
+                                    {'json': json.dumps(self.data)})
+
+        self.assertEquals(response.status_code, 202)
+        self.assertEquals(Result.objects.count(), 4)
+        self.assertEquals(
+            Result.objects.get(revision__commitid='123').value, 400)
+        self.assertEquals(
+            Result.objects.get(revision__commitid='456',
+                               benchmark__name='Richards').value, 500)
+
     def test_report_is_created(self):
         '''Should create a report when adding json results for two revisions
         plus a third revision with one result less than the last one'''
@@ -319,6 +355,100 @@ class TestAddJSONResults(TestCase):
         self.assertEquals(number_of_reports, 1)
 
 
+@override_settings(ALLOW_ANONYMOUS_POST=True, NDJSON_CHUNK_SIZE=2)
+class TestAddNDJSONResults(TestCase):
+
+    def setUp(self):
+        self.path = reverse('add-ndjson-results')
+        Environment.objects.create(name='bigdog')
+        self.data = [
+            {'commitid': commitid,
+             'project': 'pypy',
+             'branch': 'default',
+             'executable': 'pypy-c',
+             'benchmark': benchmark,
+             'environment': 'bigdog',
+             'result_value': 1} for commitid, benchmark in (
+                 ('123', 'Richards'), ('456', 'Richards'),
+                 ('456', 'Richards2'), ('789', 'Richards'))
+        ]
+
+    def post(self, body, **extra):
+        return self.client.post(self.path, body,
+                                content_type='application/x-ndjson', **extra)
+
+    def test_add_correct_results(self):
+        """Should save every line in chunks"""
+        body = "\n".join(json.dumps(item) for item in self.data) + "\n"
+        response = self.post(body)
+
+        self.assertEquals(response.status_code, 202)
+        summary = json.loads(response.content.decode())
+        self.assertEquals(summary['saved'], 4)
+        self.assertEquals(summary['errors'], [])
+        self.assertEquals(
+            [chunk['saved'] for chunk in summary['chunks']], [2, 2])
+        self.assertEquals(Result.objects.count(), 4)
+        self.assertEquals(Report.objects.count(), 1)
+
+    def test_gzip_body(self):
+        """Should decompress a gzip encoded body"""
+        body = "\n".join(json.dumps(item) for item in self.data)
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+            f.write(body.encode('utf-8'))
+        response = self.post(buf.getvalue(), HTTP_CONTENT_ENCODING='gzip')
+
+        self.assertEquals(response.status_code, 202)
+        self.assertEquals(Result.objects.count(), 4)
+
+    def test_per_line_errors(self):
+        """Should save valid lines and report the invalid ones"""
+        self.data[1]['environment'] = 'bigdog1'
+        self.data[2]['result_value'] = 'fast'
+        lines = [json.dumps(item) for item in self.data] + ['{not json']
+        response = self.post("\n".join(lines))
+
+        self.assertEquals(response.status_code, 207)
+        summary = json.loads(response.content.decode())
+        self.assertEquals(summary['saved'], 2)
+        self.assertEquals(
+            [error['line'] for error in summary['errors']], [2, 3, 5])
+        self.assertEquals(summary['errors'][0]['error'],
+                          "Environment bigdog1 not found")
+        self.assertEquals(Result.objects.count(), 2)
+
+    def test_only_errors(self):
+        """Should respond 400 when no line could be saved"""
+        response = self.post('{not json\n')
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(
+            json.loads(response.content.decode())['failed'], 1)
+
+    def test_corrupt_gzip_body(self):
+        """Should keep the results read before a corrupt gzip stream"""
+        def compress(lines):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write("".join(line + "\n" for line in lines).encode())
+            return buf.getvalue()
+
+        # A gzip header followed by an invalid deflate block
+        corrupt = compress([])[:10] + b'\xff' * 20
+        response = self.post(corrupt, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEquals(response.status_code, 400)
+        self.assertIn("Could not read request body",
+                      response.content.decode())
+
+        body = compress(json.dumps(item) for item in self.data) + corrupt
+        response = self.post(body, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEquals(response.status_code, 207)
+        summary = json.loads(response.content.decode())
+        self.assertEquals(summary['saved'], 4)
+        self.assertIn("Could not read request body", summary['error'])
+        self.assertEquals(Result.objects.count(), 4)
+
+
 class TestTimeline(TestCase):
     fixtures = ["timeline_tests.json"]
 
@@ -375,6 +505,175 @@ class TestTimeline(TestCase):
             responsedata['timelines'][0]['branches']['master']['1'][1],
             [u'2011/04/13 17:04:22 ', 2000.0, 1.11111, u'2', u'', u'master'])
 
+    def get_grid(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('gettimelinedata'), {
+                "exe": "1,2", "base": "3+8", "ben": "grid", "env": "1"})
+            responsedata = json.loads(response.getvalue().decode())
+        return responsedata, len(queries)
+
+    @override_settings(TIMELINE_GRID_PAGING=20, USE_TIMELINE_STORE=False)
+    def test_grid_queries(self):
+        """The results of a grid page are read at once"""
+        responsedata, num_queries = self.get_grid()
+        self.assertEqual(len(responsedata['timelines']), 1)
+
+        env = Environment.objects.get()
+        exe = Executable.objects.get(pk=1)
+        for i in range(10):
+            bench = Benchmark.objects.create(name='bench%d' % i)
+            for rev in Revision.objects.filter(branch__name='master'):
+                Result.objects.create(value=i, benchmark=bench, revision=rev,
+                                      executable=exe, environment=env)
+        responsedata, more_queries = self.get_grid()
+        self.assertEqual(len(responsedata['timelines']), 11)
+        self.assertEqual(num_queries, more_queries)
+
+        # Databases without window functions get the same timelines
+        with mock.patch('codespeed.views_data.supports_window_functions',
+                        return_value=False):
+            fallback_data, fallback_queries = self.get_grid()
+        self.assertEqual(fallback_data, responsedata)
+        self.assertGreater(fallback_queries, more_queries)
+
+    @override_settings(TIMELINE_GRID_PAGING=4)
+    def test_grid_paging(self):
+        env = Environment.objects.get()
+        exe = Executable.objects.get(pk=1)
+        rev = Revision.objects.get(pk=1)
+        # Benchmarks without results are skipped
+        for i in range(10):
+            bench = Benchmark.objects.create(name='bench%d' % i)
+            if i % 2:
+                Result.objects.create(value=i, benchmark=bench, revision=rev,
+                                      executable=exe, environment=env)
+        response = self.client.get(reverse('gettimelinedata'), {
+            "exe": "1", "ben": "grid", "env": "1"})
+        responsedata = json.loads(response.getvalue().decode())
+        self.assertEqual([t['benchmark'] for t in responsedata['timelines']],
+                         ['bench1', 'bench3', 'bench5', 'bench7'])
+        self.assertEqual(responsedata['nextBenchmarks'], 8)
+
+    def test_downsampled_timeline(self):
+        env = Environment.objects.get()
+        exe = Executable.objects.get(pk=1)
+        bench = Benchmark.objects.get(name='float')
+        branch = Revision.objects.get(pk=1).branch
+        for i in range(100):
+            rev = Revision.objects.create(
+                commitid='d%d' % i, branch=branch, project=branch.project,
+                date=datetime(2012, 1, 1) + timedelta(days=i),
+                tag='v%d' % i if i == 20 else '')
+            Result.objects.create(value=100 if i == 60 else 10 + i % 3,
+                                  benchmark=bench, revision=rev,
+                                  executable=exe, environment=env)
+        data = {"exe": "1", "ben": "float", "env": "1", "revs": "1000"}
+        response = self.client.get(reverse('gettimelinedata'), data)
+        points = json.loads(response.getvalue().decode())[
+            'timelines'][0]['branches']['master']['1']
+        self.assertEqual(len(points), 103)
+
+        data['points'] = 20
+        response = self.client.get(reverse('gettimelinedata'), data)
+        downsampled = json.loads(response.getvalue().decode())[
+            'timelines'][0]['branches']['master']['1']
+        self.assertLessEqual(len(downsampled), 20)
+        self.assertEqual(downsampled[0], points[0])
+        self.assertEqual(downsampled[-1], points[-1])
+        self.assertIn(100, [point[1] for point in downsampled])
+        self.assertIn('v20', [point[4] for point in downsampled])
+
+        data['points'] = 'many'
+        response = self.client.get(reverse('gettimelinedata'), data)
+        self.assertEqual(json.loads(response.content.decode())['error'],
+                         "The number of points must be at least 3")
+
+    def test_columnar_timeline(self):
+        data = {"exe": "1,2", "base": "3+8", "ben": "float", "env": "1"}
+        response = self.client.get(reverse('gettimelinedata'), data)
+        rows = json.loads(response.getvalue().decode())['timelines'][0]
+        data['format'] = 'columnar'
+        response = self.client.get(reverse('gettimelinedata'), data)
+        columnar = json.loads(response.getvalue().decode())['timelines'][0]
+
+        strings = columnar.pop('strings')
+        columns = columnar['branches']['master']['1']
+        self.assertEqual(columns['date'],
+                         [1302808385, 1302714262, 1302626600])
+        self.assertEqual(columns['value'], [2100.0, 2000.0, 4000.0])
+        self.assertEqual([strings[i] for i in columns['commit']],
+                         ['5', '2', '1'])
+        self.assertEqual(len(strings), len(set(strings)))
+        for branch, series in rows['branches'].items():
+            for exe_id, points in series.items():
+                columns = columnar['branches'][branch][exe_id]
+                self.assertEqual(
+                    [point[1:5] for point in points],
+                    [list(values) for values in zip(
+                        columns['value'], columns['std_dev'],
+                        [strings[i] for i in columns['commit']],
+                        [strings[i] for i in columns['tag']])])
+        self.assertEqual([value for date, value in columnar['baseline']],
+                         [value for date, value in rows['baseline']])
+        del rows['branches'], rows['baseline']
+        del columnar['branches'], columnar['baseline']
+        self.assertEqual(rows, columnar)
+
+        data['format'] = 'xml'
+        response = self.client.get(reverse('gettimelinedata'), data)
+        self.assertEqual(json.loads(response.content.decode())['error'],
+                         "Unknown format xml")
+
+    def test_conditional_get(self):
+        """Unchanged timeline and comparison data is not sent again"""
+        data = {"exe": "1", "ben": "float", "env": "1", "base": "3+8"}
+        for name in ('gettimelinedata', 'getcomparisondata'):
+            response = self.client.get(reverse(name), data)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name), data,
+                                           HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse([query for query in queries.captured_queries
+                              if 'codespeed_result' in query['sql']])
+
+        # Results saved one by one and in bulk change the data version
+        rev = Revision.objects.get(pk=2)
+        Result.objects.create(
+            value=1, benchmark=Benchmark.objects.create(name='new'),
+            revision=rev, executable_id=1, environment_id=1)
+        response = self.client.get(reverse('gettimelinedata'), data,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        save_results([{
+            'commitid': '6', 'branch': 'master', 'project': rev.project.name,
+            'executable': Executable.objects.get(pk=1).name,
+            'benchmark': 'float', 'environment': 'Dual Core',
+            'result_value': 2,
+        }], update_repo=False)
+        response = self.client.get(reverse('gettimelinedata'), data,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # Results of other projects do not
+        other = {
+            'commitid': '7', 'branch': 'default', 'project': 'other',
+            'executable': 'other', 'benchmark': 'float',
+            'environment': 'Dual Core', 'result_value': 2,
+        }
+        save_results([other], update_repo=False)
+        etag = self.client.get(reverse('gettimelinedata'), data)['ETag']
+        other['commitid'] = '8'
+        save_results([other], update_repo=False)
+        response = self.client.get(reverse('gettimelinedata'), data,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
 
 @override_settings(ALLOW_ANONYMOUS_POST=True)
 class TestReports(TestCase):
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Materialized timeline series
+
+The latest results of every benchmark, executable, environment and branch
+are kept in a TimelineSeries, packed in a numpy structured array latest
+first, so that the timeline view reads a series without joining and sorting
+results. Series are updated when results are saved with save_results,
+dropped when results are changed otherwise, and built from the results when
+they are missing.
+"""
+from __future__ import absolute_import
+
+import calendar
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Result, Revision, TimelineSeries, order_revisions
+
+#: Layout of a point. Positions and dates are those of the revision when the
+#: point was stored, and only used to order the points
+POINT_DTYPE = np.dtype([
+    ('revision', '<i8'),
+    ('position', '<i8'),
+    ('date', '<f8'),
+    ('value', '<f8'),
+    ('std_dev', '<f8'),
+    ('val_min', '<f8'),
+    ('val_max', '<f8'),
+    ('q1', '<f8'),
+    ('q3', '<f8'),
+])
+
+#: Position of revisions without one
+NULL_POSITION = np.iinfo(np.int64).min
+
+STATS = ('std_dev', 'val_min', 'val_max', 'q1', 'q3')
+
+
+class StoredResult(object):
+    """The fields of a result shown in timelines, read from the store"""
+    __slots__ = ('revision', 'value') + STATS
+
+    def __init__(self, revision, value, *stats):
+        self.revision = revision
+        self.value = value
+        for name, stat in zip(STATS, stats):
+            # NaN is only equal to itself when it is a number
+            setattr(self, name, stat if stat == stat else None)
+
+
+def store_enabled():
+    return getattr(settings, 'USE_TIMELINE_STORE', True)
+
+
+def get_store_size():
+    return getattr(settings, 'TIMELINE_STORE_SIZE', 1000)
+
+
+def series_key(result):
+    """(benchmark, executable, environment, branch) ids of a result"""
+    return (result.benchmark_id, result.executable_id, result.environment_id,
+            result.revision.branch_id)
+
+
+def _timestamp(date):
+    if date is None:
+        return np.nan
+    return calendar.timegm(date.utctimetuple()) + date.microsecond / 1e6
+
+
+def pack_results(results):
+    """Returns the points of results whose revisions are loaded"""
+    points = np.zeros(len(results), dtype=POINT_DTYPE)
+    for i, res in enumerate(results):
+        position = res.revision.position
+        points[i] = (
+            res.revision.id,
+            NULL_POSITION if position is None else position,
+            _timestamp(res.revision.date),
+            res.value,
+        ) + tuple(np.nan if getattr(res, name) is None
+                  else getattr(res, name) for name in STATS)
+    return points
+
+
+def unpack(data):
+    return np.frombuffer(bytes(data), dtype=POINT_DTYPE)
+
+
+def merge_points(points, new_points, size):
+    """Adds new points, replacing those of the same revisions
+
+    Returns the latest size points, ordered like order_revisions: by
+    position and then by date and revision, or only by date and revision
+    while some positions are unknown.
+    """
+    points = points[~np.isin(points['revision'], new_points['revision'])]
+    points = np.concatenate([points, new_points])
+    # Revisions without a date are the oldest
+    dates = np.where(np.isnan(points['date']), -np.inf, points['date'])
+    # lexsort orders by the last key first
+    keys = (points['revision'], dates)
+    if not (points['position'] == NULL_POSITION).any():
+        keys += (points['position'],)
+    order = np.lexsort(keys)[::-1]
+    return points[order[:size]]
+
+
+def update_series(results):
+    """Merges saved results into the stored series
+
+    Series that are not stored yet are built from all their results. Must
+    be called after the results are saved, in the same transaction.
+    """
+    by_key = OrderedDict()
+    for res in results:
+        by_key.setdefault(series_key(res), []).append(res)
+    if not by_key:
+        return
+
+    size = get_store_size()
+    with transaction.atomic():
+        stored = dict(
+            ((s.benchmark_id, s.executable_id, s.environment_id,
+              s.branch_id), s)
+            for s in TimelineSeries.objects.select_for_update().filter(
+                benchmark__in=set(key[0] for key in by_key),
+                executable__in=set(key[1] for key in by_key),
+                environment__in=set(key[2] for key in by_key),
+                branch__in=set(key[3] for key in by_key)))
+        for key, key_results in by_key.items():
+            series = stored.get(key)
+            if series is None:
+                build_series(key)
+                continue
+            points = merge_points(unpack(series.points),
+                                  pack_results(key_results), size)
+            TimelineSeries.objects.filter(pk=series.pk).update(
+                points=points.tobytes())
+
+
+def read_series_results(key, size):
+    benchmark_id, executable_id, environment_id, branch_id = key
+    return list(order_revisions(Result.objects.filter(
+        benchmark=benchmark_id, executable=executable_id,
+        environment=environment_id, revision__branch=branch_id
+    ).select_related('revision'), 'revision__')[:size])
+
+
+def build_series(key, results=None):
+    """Stores the series of key, reading its results unless given"""
+    if results is None:
+        results = read_series_results(key, get_store_size())
+    save_series({key: results})
+
+
+def _merge_series(key, results, size):
+    """Merges results into the stored series of key, locking it"""
+    stored = TimelineSeries.objects.select_for_update().get(
+        benchmark=key[0], executable=key[1], environment=key[2],
+        branch=key[3])
+    points = merge_points(unpack(stored.points), pack_results(results), size)
+    TimelineSeries.objects.filter(pk=stored.pk).update(
+        points=points.tobytes())
+
+
+def save_series(series):
+    """Stores new series, given as a dict of key -> results"""
+    new_series = [
+        TimelineSeries(
+            benchmark_id=key[0], executable_id=key[1],
+            environment_id=key[2], branch_id=key[3],
+            points=pack_results(results).tobytes())
+        for key, results in series.items()]
+    try:
+        with transaction.atomic():
+            TimelineSeries.objects.bulk_create(new_series)
+    except IntegrityError:
+        # Some were stored concurrently, possibly without the results saved
+        # by this transaction, which are merged into them
+        size = get_store_size()
+        for s, (key, results) in zip(new_series, series.items()):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        s.save()
+                except IntegrityError:
+                    _merge_series(key, results, size)
+
+
+def get_stored_series(keys, number_of_revs):
+    """
+    Returns the stored results of the given series as a dict of key ->
+    results, latest first, and the keys of the series not stored yet
+
+    The results are StoredResult instances, and their revisions are read in
+    one query.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}, set()
+    stored = {}
+    for values in TimelineSeries.objects.filter(
+        benchmark__in=set(key[0] for key in keys),
+        executable__in=set(key[1] for key in keys),
+        environment__in=set(key[2] for key in keys),
+        branch__in=set(key[3] for key in keys),
+    ).values_list('benchmark', 'executable', 'environment', 'branch',
+                  'points'):
+        if values[:4] in keys:
+            stored[values[:4]] = unpack(values[4])[:number_of_revs]
+
+    revisions = Revision.objects.in_bulk(set(
+        revision_id for points in stored.values()
+        for revision_id in points['revision'].tolist()))
+    series = {}
+    for key, points in stored.items():
+        columns = [points[name].tolist()
+                   for name in ('revision', 'value') + STATS]
+        results = []
+        for values in zip(*columns):
+            revision = revisions.get(values[0])
+            if revision is not None:
+                results.append(StoredResult(revision, *values[1:]))
+        if results:
+            series[key] = results
+    return series, keys - set(stored)
+
+
+def drop_series(benchmark_id, executable_id, environment_id):
+    """Drops the series of results changed other than by save_results, in
+    all branches. They are built again when needed."""
+    TimelineSeries.objects.filter(
+        benchmark=benchmark_id, executable=executable_id,
+        environment=environment_id).delete()
+
+
+def drop_results_series(results):
+    """Drops the series of results changed while the store is disabled, so
+    that they are built again once it is enabled. Other series of the same
+    benchmarks, executables, environments and branches may be dropped too.
+    """
+    keys = set(series_key(res) for res in results)
+    if keys:
+        TimelineSeries.objects.filter(
+            benchmark__in=set(key[0] for key in keys),
+            executable__in=set(key[1] for key in keys),
+            environment__in=set(key[2] for key in keys),
+            branch__in=set(key[3] for key in keys)).delete()
+
+
+def refresh_revision(revision):
+    """Updates the points of a revision whose position or date changed"""
+    results = list(revision.results.all())
+    for res in results:
+        res.revision = revision
+    if store_enabled():
+        update_series(results)
+    else:
+        drop_results_series(results)
+
+
+def rebuild(branches):
+    """Rebuilds the series of the given branches
+
+    Returns the number of series stored.
+    """
+    TimelineSeries.objects.filter(branch__in=branches).delete()
+    keys = Result.objects.filter(revision__branch__in=branches).order_by(
+    ).values_list('benchmark', 'executable', 'environment',
+                  'revision__branch').distinct()
+    count = 0
+    size = get_store_size()
+    for key in keys:
+        build_series(tuple(key), read_series_results(key, size))
+        count += 1
+    return count
@@ -30,5 +30,7 @@ urlpatterns += [
 urlpatterns += [
     # URLs for adding results
     url(r'^result/add/json/$', views.add_json_results, name='add-json-results'),
+    url(r'^result/add/ndjson/$', views.add_ndjson_results,
+        name='add-ndjson-results'),
     url(r'^result/add/$', views.add_result, name='add-result'),
 ]
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+import calendar
+import gzip
 import json
 import logging
+import zlib
+from collections import OrderedDict
+
 import django
 
 from django.conf import settings
@@ -12,19 +17,24 @@ from django.http import HttpResponse, Http404, HttpResponseBadRequest, \
     HttpResponseNotFound, StreamingHttpResponse
 from django.db.models import F
 from django.shortcuts import get_object_or_404, render_to_response
-from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
 
 from .auth import basic_auth_required
 from .models import (Environment, Report, Project, Revision, Result,
-                     Executable, Benchmark, Branch)
+                     Executable, Benchmark, Branch, TREND_DEPTHS,
+                     order_revisions)
 from .views_data import (get_default_environment, getbaselineexecutables,
                          getdefaultexecutable, getcomparisonexes,
                          get_benchmark_results, get_num_revs_and_benchmarks,
-                         get_stats_with_defaults)
-from .results import save_result, create_report_if_enough_data
+                         get_stats_with_defaults, get_timeline_results,
+                         get_baseline_values, get_data_stamp)
+from .results import (save_result, save_results, iter_result_chunks,
+                      save_result_chunk, create_report_if_enough_data)
+from .spool import queue_enabled, queue_results
 from . import commits
 from .validators import validate_results_request
+from .downsampling import downsample
 from .images import gen_image_from_results
 
 logger = logging.getLogger(__name__)
@@ -61,7 +71,26 @@ def no_data_found(request):
     })
 
 
+def data_stamp(request):
+    """Returns the data version stamp of a JSON data request
+
+    It is computed once for both the ETag and Last-Modified headers.
+    """
+    if not hasattr(request, 'codespeed_data_stamp'):
+        request.codespeed_data_stamp = get_data_stamp(request.GET)
+    return request.codespeed_data_stamp
+
+
+def data_etag(request):
+    return data_stamp(request)[0]
+
+
+def data_last_modified(request):
+    return data_stamp(request)[1]
+
+
 @require_GET
+@condition(etag_func=data_etag, last_modified_func=data_last_modified)
 def getcomparisondata(request):
     executables, exekeys = getcomparisonexes()
     benchmarks = Benchmark.objects.all()
@@ -233,6 +262,7 @@ def get_setting(name, default = None):
 
 
 @require_GET
+@condition(etag_func=data_etag, last_modified_func=data_last_modified)
 def gettimelinedata(request):
     data = request.GET
 
@@ -271,31 +301,59 @@ def gettimelinedata(request):
     if next_benchmarks is not False:
         next_benchmarks = int(next_benchmarks)
 
+    points = None
+    if data.get('points'):
+        try:
+            points = int(data['points'])
+        except ValueError:
+            points = 0
+        if points < 3:
+            timeline_list['error'] = "The number of points must be at least 3"
+            return HttpResponse(json.dumps(timeline_list))
+
+    if data.get('format', 'rows') not in ('rows', 'columnar'):
+        timeline_list['error'] = "Unknown format %s" % data['format']
+        return HttpResponse(json.dumps(timeline_list))
+    columnar = data.get('format') == 'columnar'
+
     resp = StreamingHttpResponse(stream_timeline(baseline_exe, baseline_rev, benchmarks, data,
                                                  environment, executables, number_of_revs,
-                                                 next_benchmarks),
+                                                 next_benchmarks, points, columnar),
                                  content_type='application/json')
     return resp
 
 
 def stream_timeline(baseline_exe, baseline_rev, benchmarks, data, environment, executables,
-                    number_of_revs, next_benchmarks):
+                    number_of_revs, next_benchmarks, points=None, columnar=False):
     yield '{"timelines": ['
     num_results = {"results": 0}
-    num_benchmark = 0
     transmitted_benchmarks = 0
     timeline_grid_paging = get_setting('TIMELINE_GRID_PAGING', 10)
-
-    for bench in benchmarks:
-        if transmitted_benchmarks + 1 > timeline_grid_paging:
-            # don't send more results than configured
-            break
-
-        num_benchmark += 1
-
-        if not next_benchmarks or num_benchmark > next_benchmarks:
-            result = get_timeline_for_benchmark(baseline_exe, baseline_rev, bench, environment,
-                                                executables, number_of_revs, num_results)
+    # For now, we'll only work with default branches
+    branches = list(Branch.objects.filter(
+        project__track=True, name=F('project__default_branch')))
+
+    benchmarks = list(benchmarks)
+    num_benchmark = min(next_benchmarks or 0, len(benchmarks))
+    while (num_benchmark < len(benchmarks) and
+           transmitted_benchmarks < timeline_grid_paging):
+        # Read the results of as many benchmarks as are still to be sent at
+        # once. Benchmarks without results are skipped, and the next ones
+        # read then.
+        page = benchmarks[num_benchmark:num_benchmark + timeline_grid_paging -
+                          transmitted_benchmarks]
+        series = get_timeline_results(page, environment, executables,
+                                      branches, number_of_revs)
+        baseline_values = {}
+        if baseline_rev is not None and series:
+            baseline_values = get_baseline_values(
+                page, baseline_exe, baseline_rev, environment)
+
+        for bench in page:
+            num_benchmark += 1
+            result = get_timeline_for_benchmark(
+                bench, baseline_values.get(bench.id), executables, branches,
+                series, num_results, points, columnar)
             if result != "":
                 transmitted_benchmarks += 1
                 yield result
@@ -317,8 +375,18 @@ def stream_timeline(baseline_exe, baseline_rev, benchmarks, data, environment, e
         yield ']' + not_first + next_page + ', "error":"None"}\n'
 
 
-def get_timeline_for_benchmark(baseline_exe, baseline_rev, bench, environment, executables,
-                               number_of_revs, num_results):
+def get_timeline_for_benchmark(bench, baselinevalue, executables, branches,
+                               series, num_results, points=None,
+                               columnar=False):
+    """Returns the JSON timeline of a benchmark, "" if it has no results
+
+    series are the results of get_timeline_results, and baselinevalue the
+    result of the baseline for this benchmark, if any. When points is given,
+    longer series are downsampled to about that many points.
+
+    Every series is a list of points, or with columnar a dict of arrays, see
+    get_timeline_columns.
+    """
     lessisbetter = bench.lessisbetter and ' (less is better)' or ' (more is better)'
     timeline = {
         'benchmark': bench.name,
@@ -330,28 +398,31 @@ def get_timeline_for_benchmark(baseline_exe, baseline_rev, bench, environment, e
         'branches': {},
         'baseline': "None",
     }
-    append = False
-    for branch in Branch.objects.filter(
-            project__track=True, name=F('project__default_branch')):
-        # For now, we'll only work with default branches
+    if columnar:
+        strings = OrderedDict()
+    longest = []
+    for branch in branches:
         for executable in executables:
-            if executable.project != branch.project:
+            if executable.project_id != branch.project_id:
                 continue
 
-            resultquery = Result.objects.filter(
-                benchmark=bench
-            ).filter(
-                environment=environment
-            ).filter(
-                executable=executable
-            ).filter(
-                revision__branch=branch
-            ).select_related(
-                "revision"
-            ).order_by('-revision__date')[:number_of_revs]
-            if not len(resultquery):
+            resultquery = series.get((bench.id, executable.id, branch.id))
+            if not resultquery:
                 continue
             timeline['branches'].setdefault(branch.name, {})
+            if points is not None and len(resultquery) > points:
+                keep = downsample(
+                    [res.value for res in resultquery], points,
+                    [bool(res.revision.tag) for res in resultquery])
+                resultquery = [resultquery[i] for i in keep]
+            if len(resultquery) > len(longest):
+                longest = resultquery
+
+            if columnar:
+                timeline['branches'][branch.name][executable.id] = \
+                    get_timeline_columns(resultquery, bench.data_type,
+                                         strings)
+                continue
 
             results = []
             for res in resultquery:
@@ -376,34 +447,29 @@ def get_timeline_for_benchmark(baseline_exe, baseline_rev, bench, environment, e
                         ]
                     )
             timeline['branches'][branch.name][executable.id] = results
-            append = True
-    if baseline_rev is not None and append:
-        try:
-            baselinevalue = Result.objects.get(
-                executable=baseline_exe,
-                benchmark=bench,
-                revision=baseline_rev,
-                environment=environment
-            ).value
-        except Result.DoesNotExist:
-            timeline['baseline'] = "None"
+    append = bool(longest)
+    if columnar and append:
+        timeline['strings'] = list(strings)
+    if baselinevalue is not None and append:
+        # determine start and end revision (x axis)
+        # from longest data series
+        if columnar:
+            end = to_timestamp(longest[0].revision.date)
+            start = to_timestamp(longest[-1].revision.date)
         else:
-            # determine start and end revision (x axis)
-            # from longest data series
-            results = []
-            for branch in timeline['branches']:
-                for exe in timeline['branches'][branch]:
-                    if len(timeline['branches'][branch][exe]) > len(results):
-                        results = timeline['branches'][branch][exe]
-            end = results[0][0]
-            start = results[len(results) - 1][0]
-            timeline['baseline'] = [
-                [str(start), baselinevalue],
-                [str(end), baselinevalue]
-            ]
+            end = longest[0].revision.date.strftime('%Y/%m/%d %H:%M:%S %z')
+            start = longest[-1].revision.date.strftime(
+                '%Y/%m/%d %H:%M:%S %z')
+        timeline['baseline'] = [
+            [start, baselinevalue],
+            [end, baselinevalue]
+        ]
     if append:
         old_num_results = num_results['results']
-        json_str = json.dumps(timeline)
+        if columnar:
+            json_str = json.dumps(timeline, separators=(',', ':'))
+        else:
+            json_str = json.dumps(timeline)
         num_results['results'] = old_num_results + len(timeline)
 
         if old_num_results > 0:
@@ -414,6 +480,42 @@ def get_timeline_for_benchmark(baseline_exe, baseline_rev, bench, environment, e
         return ""
 
 
+def to_timestamp(date):
+    """Seconds since the epoch of a date, naive dates being taken as UTC"""
+    return calendar.timegm(date.utctimetuple())
+
+
+def get_timeline_columns(results, data_type, strings):
+    """Returns a series of results as a dict of parallel arrays
+
+    The arrays are 'date', in seconds since the epoch, 'value' and either
+    'std_dev' or, for benchmarks of data type 'M', 'max', 'q3', 'q1' and
+    'min', with null for missing values. 'commit' and 'tag' hold the index
+    of the short commit id and tag of each result in strings, an OrderedDict
+    shared by the series of a timeline.
+    """
+    def encode(string):
+        return strings.setdefault(string, len(strings))
+
+    columns = OrderedDict([
+        ('date', [to_timestamp(res.revision.date) for res in results]),
+        ('value', [res.value for res in results]),
+    ])
+    if data_type == 'M':
+        columns['max'] = [res.val_max for res in results]
+        columns['q3'] = [res.q3 for res in results]
+        columns['q1'] = [res.q1 for res in results]
+        columns['min'] = [res.val_min for res in results]
+    else:
+        columns['std_dev'] = [res.std_dev for res in results]
+    columns['commit'] = []
+    columns['tag'] = []
+    for res in results:
+        columns['commit'].append(encode(res.revision.get_short_commitid()))
+        columns['tag'].append(encode(res.revision.tag))
+    return columns
+
+
 @require_GET
 def timeline(request):
     data = request.GET
@@ -556,10 +658,7 @@ def getchangestable(request):
         raise Http404()
     selectedrev = get_object_or_404(Revision, commitid=request.GET.get('rev'),
                                     branch__project=executable.project)
-    prevrev = Revision.objects.filter(
-        branch=selectedrev.branch,
-        date__lt=selectedrev.date,
-    ).order_by('-date').first()
+    prevrev = selectedrev.get_previous().first()
     if prevrev:
         try:
             summary = Report.objects.get(
@@ -577,10 +676,7 @@ def getchangestable(request):
     else:
         prevrev = None
 
-    nextrev = Revision.objects.filter(
-        branch=selectedrev.branch,
-        date__gt=selectedrev.date,
-    ).order_by('date').first()
+    nextrev = selectedrev.get_next().first()
     if nextrev:
         try:
             summary = Report.objects.get(
@@ -635,7 +731,7 @@ def changes(request):
         defaulttrendthres = settings.TREND_THRESHOLD
 
     defaulttrend = 10
-    trends = [5, 10, 20, 50, 100]
+    trends = TREND_DEPTHS
     if 'tre' in data and int(data['tre']) in trends:
         defaulttrend = int(data['tre'])
 
@@ -679,9 +775,8 @@ def changes(request):
         executables[proj] = Executable.objects.filter(project=proj)
         projectlist.append(proj)
         branch = Branch.objects.filter(name=proj.default_branch, project=proj).first()
-        revisionlists[proj.name] = list(Revision.objects.filter(
-            branch=branch
-        ).order_by('-date')[:revlimit])
+        revisionlists[proj.name] = list(order_revisions(
+            Revision.objects.filter(branch=branch))[:revlimit])
     # Get lastest revisions for this project and it's "default" branch
     lastrevisions = revisionlists.get(defaultexecutable.project.name)
     if not len(lastrevisions):
@@ -759,13 +854,7 @@ def displaylogs(request):
     )
     error = False
     try:
-        startrev = Revision.objects.filter(
-            branch=rev.branch
-        ).filter(date__lt=rev.date).order_by('-date')[:1]
-        if not len(startrev):
-            startrev = rev
-        else:
-            startrev = startrev[0]
+        startrev = rev.get_previous().first() or rev
 
         remotelogs = commits.get_logs(rev, startrev)
         if len(remotelogs):
@@ -799,6 +888,13 @@ def displaylogs(request):
 @require_POST
 @basic_auth_required('results')
 def add_result(request):
+    if queue_enabled():
+        response, error = queue_results([request.POST.dict()])
+        if error:
+            logger.error("Could not queue result: " + response)
+            return HttpResponseBadRequest(response)
+        return HttpResponse("Result data queued successfully", status=202)
+
     response, error = save_result(request.POST)
     if error:
         logger.error("Could not save result: " + response)
@@ -818,20 +914,23 @@ def add_json_results(request):
     data = json.loads(request.POST['json'])
     logger.info("add_json_results request with %d entries." % len(data))
 
-    unique_reports = set()
-    for (i, result) in enumerate(data):
-        logger.debug("add_json_results: save item %d." % i)
-        response, error = save_result(result, update_repo=(i==0))
+    if queue_enabled():
+        response, error = queue_results(data)
         if error:
             logger.debug(
-                "add_json_results: could not save item %d because %s" % (
-                    i, response))
+                "add_json_results: could not queue results because %s" %
+                response)
             return HttpResponseBadRequest(response)
-        else:
-            unique_reports.add(response)
+        return HttpResponse("All result data queued successfully", status=202)
+
+    response, error = save_results(data)
+    if error:
+        logger.debug(
+            "add_json_results: could not save results because %s" % response)
+        return HttpResponseBadRequest(response)
 
     logger.debug("add_json_results: about to create reports")
-    for rep in unique_reports:
+    for rep in response:
         create_report_if_enough_data(rep[0], rep[1], rep[2])
 
     logger.debug("add_json_results: completed")
@@ -839,6 +938,70 @@ def add_json_results(request):
     return HttpResponse("All result data saved successfully", status=202)
 
 
+@csrf_exempt
+@require_POST
+@basic_auth_required('results')
+def add_ndjson_results(request):
+    """Saves results posted as one JSON object per line
+
+    The request body is read as a stream (optionally gzip encoded) and saved
+    in chunks of settings.NDJSON_CHUNK_SIZE results, so memory use does not
+    depend on the size of the upload. When only some of the results could be
+    saved, the response status is 207 so that clients don't send the saved
+    ones again.
+    """
+    body = request
+    if request.META.get('HTTP_CONTENT_ENCODING') == 'gzip':
+        body = gzip.GzipFile(fileobj=request, mode='rb')
+    chunk_size = get_setting('NDJSON_CHUNK_SIZE', 500)
+    queue = queue_enabled()
+
+    # Only the first errors are returned to keep the response small
+    max_errors = 100
+    summary = {'saved': 0, 'failed': 0, 'chunks': [], 'errors': []}
+    unique_reports = OrderedDict()
+    try:
+        for i, (chunk, errors) in enumerate(
+                iter_result_chunks(body, chunk_size)):
+            save_errors = []
+            if chunk and queue:
+                queue_results([item for lineno, item in chunk])
+            elif chunk:
+                reports, save_errors = save_result_chunk(
+                    chunk, update_repo=(i == 0))
+                for rep in reports:
+                    unique_reports[rep] = True
+            saved = len(chunk) - len(save_errors)
+            errors = sorted(errors + save_errors,
+                            key=lambda error: error['line'])
+            logger.debug("add_ndjson_results: chunk %d saved %d results, "
+                         "%d errors", i + 1, saved, len(errors))
+            summary['chunks'].append({
+                'chunk': i + 1, 'saved': saved, 'errors': len(errors)})
+            summary['saved'] += saved
+            summary['failed'] += len(errors)
+            summary['errors'] += errors[:max_errors - len(summary['errors'])]
+    except (IOError, EOFError, zlib.error) as e:
+        if not summary['saved']:
+            return HttpResponseBadRequest(
+                "Could not read request body: %s" % e)
+        # The results of the chunks read before were saved
+        summary['error'] = "Could not read request body: %s" % e
+
+    logger.debug("add_ndjson_results: about to create reports")
+    for rep in unique_reports:
+        create_report_if_enough_data(rep[0], rep[1], rep[2])
+
+    if not (summary['failed'] or 'error' in summary):
+        status = 202
+    elif summary['saved']:
+        status = 207
+    else:
+        status = 400
+    return HttpResponse(json.dumps(summary), status=status,
+                        content_type='application/json')
+
+
 def django_has_content_type():
     return (django.VERSION[0] > 1 or
             (django.VERSION[0] == 1 and django.VERSION[1] >= 6))
@@ -3,11 +3,15 @@ from __future__ import absolute_import
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 
+from codespeed import timelines
 from codespeed.models import (
     Executable, Revision, Project, Branch,
-    Environment, Benchmark, Result)
+    Environment, Benchmark, Result, DataVersion, order_revisions,
+    revision_ordering)
 
 
 def get_default_environment(enviros, data, multi=False):
@@ -168,7 +172,7 @@ def get_benchmark_results(data):
         ('relative' in data and data['relative'] in ['1', 'yes']) or
         baseline_commit_name is not None)
 
-    result_query = Result.objects.filter(
+    result_query = order_revisions(Result.objects.filter(
         benchmark=benchmark
     ).filter(
         environment=environment
@@ -180,7 +184,7 @@ def get_benchmark_results(data):
         revision__branch=branch
     ).select_related(
         "revision"
-    ).order_by('-date')[:number_of_revs]
+    ), 'revision__')[:number_of_revs]
 
     if len(result_query) == 0:
         raise ObjectDoesNotExist("No results were found!")
@@ -260,3 +264,175 @@ def get_stats_with_defaults(res):
     if res.q3 is not None:
         q3 = res.q3
     return q1, q3, val_max, val_min
+
+
+def supports_window_functions():
+    """Whether the database can compute ROW_NUMBER() OVER (...)"""
+    if getattr(connection.features, 'supports_over_clause', False):
+        return True
+    if connection.vendor == 'sqlite':
+        from django.db.backends.sqlite3.base import Database
+        return Database.sqlite_version_info >= (3, 25, 0)
+    return connection.vendor == 'postgresql'
+
+
+def get_timeline_results(benchmarks, environment, executables, branches,
+                         number_of_revs):
+    """
+    Returns the last number_of_revs results of every benchmark, executable
+    and branch, as a dict of (benchmark id, executable id, branch id) ->
+    results, latest first
+
+    The results are read from the timeline store when it keeps enough of
+    them. Series missing from the store are read from the results, and
+    stored.
+    """
+    if (not timelines.store_enabled() or
+            number_of_revs > timelines.get_store_size()):
+        return read_timeline_results(benchmarks, environment, executables,
+                                     branches, number_of_revs)
+
+    keys = [(bench.id, executable.id, environment.id, branch.id)
+            for bench in benchmarks
+            for executable in executables
+            for branch in branches
+            if executable.project_id == branch.project_id]
+    stored, missing = timelines.get_stored_series(keys, number_of_revs)
+    series = dict(((key[0], key[1], key[3]), results)
+                  for key, results in stored.items())
+    if missing:
+        read = read_timeline_results(
+            [bench for bench in benchmarks
+             if bench.id in set(key[0] for key in missing)],
+            environment,
+            [executable for executable in executables
+             if executable.id in set(key[1] for key in missing)],
+            [branch for branch in branches
+             if branch.id in set(key[3] for key in missing)],
+            timelines.get_store_size())
+        # Series without results are stored too, so that they are not read
+        # again
+        timelines.save_series(dict(
+            (key, read.get((key[0], key[1], key[3]), [])) for key in missing))
+        for key in missing:
+            results = read.get((key[0], key[1], key[3]))
+            if results:
+                series[(key[0], key[1], key[3])] = results[:number_of_revs]
+    return series
+
+
+def read_timeline_results(benchmarks, environment, executables, branches,
+                          number_of_revs):
+    """
+    Reads the last number_of_revs results of every benchmark, executable
+    and branch from the results, see get_timeline_results
+
+    Where the database supports window functions, the results of all
+    series are read in one query. Otherwise there is one query per series.
+    """
+    if not (benchmarks and executables and branches):
+        return {}
+    results = Result.objects.filter(
+        benchmark__in=benchmarks,
+        environment=environment,
+        executable__in=executables,
+        revision__branch__in=branches)
+    # Like order_revisions, by date while some positions are unknown
+    by_position = not results.filter(revision__position__isnull=True).exists()
+    ordering = revision_ordering('revision__', by_position)
+
+    if supports_window_functions():
+        # Older Django versions cannot build window expressions for every
+        # database, nor filter on them, so the ranking is written in SQL
+        # around the query of the results
+        sql, params = results.order_by().annotate(
+            series_branch=F('revision__branch_id'),
+            series_position=F('revision__position'),
+            series_date=F('revision__date'),
+            series_revision=F('revision_id'),
+        ).values('id', 'benchmark_id', 'executable_id', 'series_branch',
+                 'series_position', 'series_date',
+                 'series_revision').query.sql_with_params()
+        qn = connection.ops.quote_name
+        columns = dict((name, qn(name)) for name in (
+            'id', 'benchmark_id', 'executable_id', 'series_branch',
+            'series_position', 'series_date', 'series_revision',
+            'series_row'))
+        order = ('CASE WHEN %(series_date)s IS NULL THEN 1 ELSE 0 END, '
+                 '%(series_date)s DESC, %(series_revision)s DESC')
+        if by_position:
+            order = '%(series_position)s DESC, ' + order
+        latest = ((
+            'SELECT %(id)s FROM ('
+            'SELECT %(id)s, ROW_NUMBER() OVER ('
+            'PARTITION BY %(benchmark_id)s, %(executable_id)s, '
+            '%(series_branch)s ORDER BY ' + order +
+            ') AS %(series_row)s FROM (') % columns + sql + ') ' +
+            qn('series') + ') ' + qn('ranked') +
+            ' WHERE %(series_row)s <= %%s' % columns)
+        querysets = [Result.objects.extra(
+            where=['%s.%s IN (%s)' % (qn(Result._meta.db_table), qn('id'),
+                                      latest)],
+            params=list(params) + [number_of_revs]
+        ).select_related('revision').order_by(*ordering)]
+    else:
+        querysets = [
+            results.filter(
+                benchmark=bench, executable=executable,
+                revision__branch=branch
+            ).select_related('revision').order_by(
+                *ordering)[:number_of_revs]
+            for bench in benchmarks
+            for executable in executables
+            for branch in branches
+            if executable.project_id == branch.project_id]
+
+    series = {}
+    for queryset in querysets:
+        for res in queryset:
+            key = (res.benchmark_id, res.executable_id,
+                   res.revision.branch_id)
+            series.setdefault(key, []).append(res)
+    return series
+
+
+def get_baseline_values(benchmarks, baseline_exe, baseline_rev, environment):
+    """Returns a dict of benchmark id -> value of the baseline"""
+    return dict(Result.objects.filter(
+        executable=baseline_exe,
+        benchmark__in=benchmarks,
+        revision=baseline_rev,
+        environment=environment
+    ).values_list('benchmark_id', 'value'))
+
+
+def _parse_ids(values):
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except ValueError:
+            pass
+    return ids
+
+
+def get_data_stamp(data):
+    """
+    Returns the DataVersion stamp of the results requested, as a tuple of
+    (ETag, last modified date)
+
+    The results are those of the environment and of the projects of the
+    executables and baseline in data. Without them, all environments or
+    projects are included.
+    """
+    environment_ids = None
+    if data.get('env'):
+        environment_ids = _parse_ids(data['env'].split(','))
+    project_ids = None
+    executable_ids = _parse_ids(data.get('exe', '').split(','))
+    if data.get('base') not in (None, '', 'none', 'undefined'):
+        executable_ids += _parse_ids(data['base'].split('+')[:1])
+    if executable_ids:
+        project_ids = set(Executable.objects.filter(
+            id__in=executable_ids).values_list('project_id', flat=True))
+    return DataVersion.get_stamp(environment_ids, project_ids)
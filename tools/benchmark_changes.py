@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# Measures the throughput of the computation of report changes and trends   #
+# Run from the root directory: python tools/benchmark_changes.py            #
+##############################################################################
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from codespeed.changes import compute_changes  # noqa: E402
+
+NUM_BENCHMARKS = 1000
+NUM_REVISIONS = 100
+NUM_UNITS_TITLES = 3
+REPEAT = 20
+
+
+def make_matrix():
+    random = np.random.RandomState(0)
+    values = random.uniform(0.5, 1.5, (NUM_BENCHMARKS, NUM_REVISIONS + 2))
+    # Some benchmarks were not run for every revision
+    values[random.uniform(size=values.shape) < 0.05] = np.nan
+    values[:, 0] = random.uniform(0.5, 1.5, NUM_BENCHMARKS)
+    groups = random.randint(0, NUM_UNITS_TITLES, NUM_BENCHMARKS)
+    lessisbetter = [True] * NUM_UNITS_TITLES
+    return values, groups, lessisbetter
+
+
+def main():
+    values, groups, lessisbetter = make_matrix()
+
+    def run():
+        compute_changes(values, slice(2, None), groups, lessisbetter,
+                        3.0, 5.0)
+
+    seconds = min(timeit.repeat(run, number=1, repeat=REPEAT))
+    print("%d benchmarks x %d revision trends: %.2f ms per report, "
+          "%.0f benchmarks/s" % (NUM_BENCHMARKS, NUM_REVISIONS,
+                                 seconds * 1000, NUM_BENCHMARKS / seconds))
+
+
+if __name__ == '__main__':
+    main()